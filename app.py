@@ -4,15 +4,37 @@ import requests
 import time
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
-from rich import print as rprint
-from rich.console import Console
-import pprint
 import json
 import redis
-from threading import Thread
+import redis.asyncio
+from threading import Thread, Event
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 import uuid
-import requests as req_deepseek
 import re
+import sys
+import cliente_http
+import prazo
+from prazo import OrcamentoEsgotado
+from disjuntor import Disjuntor, CircuitoAberto
+from logs import obter_logger
+import metricas
+from metricas import medir, cronometrar, novo_trace_id, submeter_com_contexto
+from cache_ixc import CacheIXC
+from snapshot_ixc import FormatoCompacto, FormatoJSON
+from aquecedor_ixc import AquecedorIXC
+from cache_local import CacheLocal
+from estado_conversa import EstadoConversa
+from outbox_mem0 import OutboxMem0
+from fila_confiavel import FilaConfiavel
+from coalescedor import CoalescedorMensagens, cpf_informado
+from deduplicador import DeduplicadorMensagens
+from outbox_whatsapp import OutboxWhatsApp
+from respostas_template import RespostasTemplate
+from registro_tools import RegistroTools, Tool, TurnoTools
+from contexto_mistral import PayloadMistral, montar_mensagens
+from historico_conversa import HistoricoConversa, contem_dado_sensivel
+from classificador_intencao import ClassificadorLocal, INTENCOES, normalizar_texto, normalizar_intencao, hash_texto
+from cache_respostas import CacheRespostas, PoliticaResposta
 
 load_dotenv()
 
@@ -24,20 +46,29 @@ INSTANCE_KEY = os.getenv("INSTANCE_KEY")
 # Mistral credentials
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 MISTRAL_AGENT_ID = os.getenv("MISTRAL_AGENT_ID")
-MISTRAL_URL = "https://api.mistral.ai/v1/agents/completions"
+MISTRAL_URL = os.getenv("MISTRAL_URL", "https://api.mistral.ai/v1/agents/completions")
 
 IXC_API_URL = os.getenv("IXC_API_URL", "https://n8n.rafaeltoshiba.com.br/webhook/ixc/consultaCliente")
 
 DEPSEEK_API_KEY = os.getenv("DEPSEEK_API_KEY")
-DEPSEEK_URL = "https://api.deepseek.com/v1/chat/completions"
+DEPSEEK_URL = os.getenv("DEPSEEK_URL", "https://api.deepseek.com/v1/chat/completions")
+
+# Webhook do Make.com para transferência a um atendente humano
+MAKE_WEBHOOK_URL = os.getenv("MAKE_WEBHOOK_URL", "https://hook.us2.make.com/f1x53952bxirumz2gnfpoabdo397uws2")
 
 app = Flask(__name__)
 
-console = Console(
-    color_system="truecolor",
-    style="bold",
-    emoji=True, 
-)
+# Logs estruturados por categoria (ver logs.py); nada de payload/histórico completo no stdout
+log_webhook = obter_logger("webhook")
+log_fila = obter_logger("fila")
+log_ixc = obter_logger("ixc")
+log_mistral = obter_logger("mistral")
+log_classificador = obter_logger("classificador")
+log_mem0 = obter_logger("mem0")
+log_whatsapp = obter_logger("whatsapp")
+log_historico = obter_logger("historico")
+log_prefetch = obter_logger("prefetch")
+log_tools = obter_logger("tools")
 
 PROMPT = (
     "Você é Geovana, agente virtual oficial da G4 Telecom.\n"
@@ -67,115 +98,160 @@ PROMPT = (
     "- Sempre use os dados reais do IXC para responder, nunca invente informações.\n"
 )
 
-tools = [
-    {
-        "type": "function",
-        "function": {
-            "name": "consultar_dados_ixc",
-            "description": "Consulta todos os dados do cliente no IXC a partir do CPF.",
-            "parameters": {
-                "cpf": {"type": "string", "description": "CPF do cliente"}
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "consultar_boletos",
-            "description": "Consulta os boletos do cliente no IXC a partir do CPF.",
-            "parameters": {
-                "cpf": {"type": "string", "description": "CPF do cliente"}
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "consultar_status_plano",
-            "description": "Consulta o status do plano do cliente no IXC a partir do CPF.",
-            "parameters": {
-                "cpf": {"type": "string", "description": "CPF do cliente"}
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "consultar_dados_cadastro",
-            "description": "Consulta os dados cadastrais do cliente no IXC a partir do CPF.",
-            "parameters": {
-                "cpf": {"type": "string", "description": "CPF do cliente"}
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "consultar_valor_plano",
-            "description": "Consulta o valor do plano do cliente no IXC a partir do CPF.",
-            "parameters": {
-                "cpf": {"type": "string", "description": "CPF do cliente"}
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "abrir_os",
-            "description": "Abre uma ordem de serviço para o cliente.",
-            "parameters": {
-                "id_cliente": {"type": "string", "description": "ID do cliente"},
-                "motivo": {"type": "string", "description": "Motivo da OS"}
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "transferir_para_humano",
-            "description": "Transfere o atendimento para um humano e envia um resumo do atendimento para o webhook Make.com.",
-            "parameters": {
-                "cpf": {"type": "string", "description": "CPF do cliente"},
-                "resumo": {"type": "string", "description": "Resumo da conversa"}
-            }
-        }
-    }
-]
+# Respostas por template para consultas de dados do IXC (ver respostas_template.py)
+TEMPLATES_ATIVOS = os.getenv("TEMPLATES_ATIVOS", "1") == "1"
+respostas_template = RespostasTemplate()
 
 # Configuração do Mem0AI
 os.environ["MEM0_API_KEY"] = os.getenv("MEM0_API_KEY")
-mem0_client = MemoryClient()
+mem0_client = MemoryClient(host=os.getenv("MEM0_HOST"))  # MEM0_HOST vazio = API pública do Mem0AI
 
 # Configuração do Redis
 redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 redis_client = redis.StrictRedis.from_url(redis_url, decode_responses=True)
+# Cliente asyncio usado só pela variante ASGI (app_async.py); não abre conexão até o primeiro uso
+redis_async_client = redis.asyncio.from_url(redis_url, decode_responses=True)
+
+# --- DISJUNTORES (circuit breakers) dos upstreams, com estado compartilhado no Redis (ver disjuntor.py) ---
+# Aberto, a chamada falha na hora e cada upstream tem o seu fallback: IXC -> último snapshot bom,
+# Mistral -> resposta por template/mensagem fixa, DeepSeek -> intenção "outros".
+# Configuração por upstream: DISJUNTOR_<NOME>_LIMIAR, _MIN_CHAMADAS, _JANELA_S, _ABERTO_S, _LATENCIA_MAX_S.
+def resposta_http_falhou(response):
+    return response.status_code >= 500 or response.status_code == 429
+
+def criar_disjuntor(nome, falha, latencia_max):
+    prefixo = f"DISJUNTOR_{nome.upper()}"
+    return Disjuntor(
+        redis_client,
+        nome,
+        falha=falha,
+        limiar=float(os.getenv(f"{prefixo}_LIMIAR", 0.5)),
+        min_chamadas=int(os.getenv(f"{prefixo}_MIN_CHAMADAS", 10)),
+        janela=float(os.getenv(f"{prefixo}_JANELA_S", 30)),
+        tempo_aberto=float(os.getenv(f"{prefixo}_ABERTO_S", 30)),
+        latencia_max=float(os.getenv(f"{prefixo}_LATENCIA_MAX_S", latencia_max)),
+    )
+
+disjuntor_ixc = criar_disjuntor("ixc", lambda dados: isinstance(dados, dict) and "erro" in dados, 10)
+disjuntor_mistral = criar_disjuntor("mistral", resposta_http_falhou, 30)
+disjuntor_deepseek = criar_disjuntor("deepseek", resposta_http_falhou, 8)
+DISJUNTORES = {d.nome: d for d in (disjuntor_ixc, disjuntor_mistral, disjuntor_deepseek)}
+
+# Write-behind do histórico no Mem0AI (ver outbox_mem0.py). MEM0_WRITE_BEHIND=0 volta a gravar na hora.
+MEM0_WRITE_BEHIND = os.getenv("MEM0_WRITE_BEHIND", "1") == "1"
+MEM0_ESCRITA_ORCAMENTO = float(os.getenv("MEM0_ESCRITA_ORCAMENTO_S", 5))
+outbox_mem0 = OutboxMem0(
+    redis_client,
+    mem0_client,
+    tamanho_lote=int(os.getenv("MEM0_LOTE", 20)),
+    intervalo=float(os.getenv("MEM0_FLUSH_INTERVALO", 1.0)),
+    max_rps=float(os.getenv("MEM0_MAX_RPS", 5)),
+    max_tentativas=int(os.getenv("MEM0_MAX_TENTATIVAS", 5)),
+)
+if MEM0_WRITE_BEHIND:
+    outbox_mem0.iniciar()
+
+# Histórico local por conversa (ver historico_conversa.py); o Mem0AI só é lido no cold start
+HISTORICO_CONTEXTO_MAX = int(os.getenv("HISTORICO_CONTEXTO_MAX", 20))
+historico_conversa = HistoricoConversa(
+    redis_client,
+    max_turnos=int(os.getenv("HISTORICO_MAX_TURNOS", 50)),
+    max_por_intencao=int(os.getenv("HISTORICO_MAX_POR_INTENCAO", 20)),
+    ttl=int(os.getenv("HISTORICO_TTL", 60 * 60 * 24 * 7)),
+    redis_async=redis_async_client,
+)
+
+# Cache L1 em memória na frente do Redis (CPF do contexto, cumprimento, snapshot IXC),
+# invalidado entre processos via pub/sub sempre que esses dados são gravados
+cache_l1 = CacheLocal(
+    redis_client,
+    max_itens=int(os.getenv("L1_MAX_ITENS", 10000)),
+    ttl=float(os.getenv("L1_TTL", 30)),
+)
+cache_l1.iniciar_listener()
+
+# Cache de respostas do Mistral para perguntas repetidas (ver cache_respostas.py). TTL por intenção com
+# RESPOSTA_CACHE_TTL_<INTENCAO> (ex: RESPOSTA_CACHE_TTL_CONSULTA_BOLETO=600); 0 tira a intenção do cache.
+RESPOSTA_CACHE_ATIVO = os.getenv("RESPOSTA_CACHE_ATIVO", "1") == "1"
+POLITICAS_RESPOSTA = {
+    "consulta_valor_plano": PoliticaResposta(("valor_plano",), ttl=60 * 60 * 6, compartilhada=True),
+    "consulta_status_plano": PoliticaResposta(("status_plano", "contrato"), ttl=60 * 10),
+    "consulta_boleto": PoliticaResposta(("boletos", "contrato"), ttl=60 * 60),
+    "consulta_dados_cadastro": PoliticaResposta(("cadastro", "cliente"), ttl=60 * 60),
+}
+# Intenções que costumam terminar em abrir_os/transferir_para_humano ficam fora do cache
+RESPOSTA_SEM_CACHE = {"estou_sem_internet", "falar_com_atendente", "reclamacao"}
+for _intencao in INTENCOES:
+    _ttl = os.getenv(f"RESPOSTA_CACHE_TTL_{_intencao.upper()}")
+    if _ttl is None:
+        continue
+    if int(_ttl) <= 0:
+        RESPOSTA_SEM_CACHE.add(_intencao)
+    else:
+        POLITICAS_RESPOSTA.setdefault(_intencao, PoliticaResposta()).ttl = int(_ttl)
+cache_respostas = CacheRespostas(
+    redis_client,
+    POLITICAS_RESPOSTA,
+    ttl=int(os.getenv("RESPOSTA_CACHE_TTL", 60 * 60)),
+    sem_cache=RESPOSTA_SEM_CACHE,
+    usar_simhash=os.getenv("RESPOSTA_CACHE_SIMHASH", "1") == "1",
+    distancia=int(os.getenv("RESPOSTA_CACHE_SIMHASH_DISTANCIA", 3)),
+    min_palavras=int(os.getenv("RESPOSTA_CACHE_MIN_PALAVRAS", 2)),
+    redis_async=redis_async_client,
+)
 
 # Helpers para cache IXC no Redis
 REDIS_TTL_IXC = 60 * 30  # 30 minutos
+# Cache do IXC por CPF (ver cache_ixc.py): fresco até o soft TTL, servido velho (com refresh em
+# background) até o hard TTL, e erros/timeouts ficam em cache negativo por IXC_NEG_TTL
+IXC_SOFT_TTL = int(os.getenv("IXC_SOFT_TTL", 60 * 10))
+IXC_HARD_TTL = int(os.getenv("IXC_HARD_TTL", REDIS_TTL_IXC))
+IXC_NEG_TTL = int(os.getenv("IXC_NEG_TTL", 60))
+
+# Estado da conversa (CPF, cumprimento) em um único hash Redis por remoteJid (ver estado_conversa.py).
+# processar_payload carrega o estado no início do turno e grava tudo no fim; os helpers abaixo
+# recebem esse estado. Chamados sem estado, carregam e gravam na hora.
+# As chaves antigas (conversa:{remoteJid}:cpf/:cumprimentou) só são lidas em conversas ainda não
+# migradas; ESTADO_LER_LEGADO=0 desliga essa leitura de vez quando a migração terminar.
+ESTADO_LER_LEGADO = os.getenv("ESTADO_LER_LEGADO", "1") == "1"
+
+@cronometrar("redis_estado")
+def carregar_estado_conversa(remoteJid):
+    return EstadoConversa.carregar(
+        redis_client,
+        remoteJid,
+        cache_local=cache_l1,
+        ttls_legado={"cpf": REDIS_TTL_IXC, "cumprimentou": CUMPRIMENTO_TTL},
+        ler_legado=ESTADO_LER_LEGADO,
+    )
 
 # Helpers para contexto de CPF
 
-def get_cpf_from_context(remoteJid):
-    key = f"conversa:{remoteJid}:cpf"
-    cpf = redis_client.get(key)
+def get_cpf_from_context(remoteJid, estado=None):
+    estado = estado or carregar_estado_conversa(remoteJid)
+    cpf = estado.get("cpf")
     if cpf and is_cpf(cpf):
         return cpf
     return None
 
-def salvar_cpf_contexto(remoteJid, cpf):
+def salvar_cpf_contexto(remoteJid, cpf, estado=None):
     if is_cpf(cpf):
-        key = f"conversa:{remoteJid}:cpf"
-        redis_client.setex(key, REDIS_TTL_IXC, cpf)
+        if estado is None:
+            estado = carregar_estado_conversa(remoteJid)
+            estado.set("cpf", cpf, REDIS_TTL_IXC)
+            estado.salvar()
+        else:
+            estado.set("cpf", cpf, REDIS_TTL_IXC)
 
 # Função para garantir que o CPF está no contexto antes de qualquer consulta
 # Se não estiver, retorna None e a função chamadora deve lidar com isso
 
-def garantir_cpf_contexto(remoteJid, user_message=None):
-    cpf = get_cpf_from_context(remoteJid)
+def garantir_cpf_contexto(remoteJid, user_message=None, estado=None):
+    cpf = get_cpf_from_context(remoteJid, estado)
     if cpf:
         return cpf
     if user_message and is_cpf(user_message):
-        salvar_cpf_contexto(remoteJid, user_message)
+        salvar_cpf_contexto(remoteJid, user_message, estado)
         return user_message
     return None
 
@@ -187,12 +263,8 @@ def processar_mensagem_usuario(remoteJid, message, messages, logs=None):
     if is_cpf(message):
         # Salva o CPF no contexto
         salvar_cpf_contexto(remoteJid, message)
-        # Busca no Redis
-        dados_ixc = buscar_ixc_redis(remoteJid, message)
-        if not dados_ixc:
-            dados_ixc = consultar_dados_ixc(message, remoteJid)
-            salvar_ixc_redis(remoteJid, message, dados_ixc)
-        print(f"[LOG] Dados IXC retornados para CPF {message}: {dados_ixc}")
+        # Busca no cache do IXC (consulta o IXC só se necessário)
+        dados_ixc = consultar_dados_ixc(message, remoteJid)
         # Salva apenas a mensagem do usuário no histórico Mem0AI
         salvar_historico_mem0(remoteJid, message, {"role": "user", "content": message})
         return True
@@ -200,6 +272,10 @@ def processar_mensagem_usuario(remoteJid, message, messages, logs=None):
 
 # Função para classificar intenção e extrair entidades
 # Retorna: {"intencao": ..., "entidades": {...}}
+@cronometrar("deepseek")
+def _post_deepseek(payload, headers):
+    return cliente_http.post("deepseek", DEPSEEK_URL, headers=headers, json=payload)
+
 def classificar_intencao_deepseek(mensagem_usuario):
     prompt = (
         "Classifique a intenção da mensagem do usuário e extraia entidades relevantes.\n"
@@ -221,314 +297,616 @@ def classificar_intencao_deepseek(mensagem_usuario):
         "Content-Type": "application/json"
     }
     try:
-        response = req_deepseek.post(DEPSEEK_URL, headers=headers, json=payload, timeout=15)
+        response = disjuntor_deepseek.executar(_post_deepseek, payload, headers)
         response.raise_for_status()
         result = response.json()
         if "choices" in result and result["choices"]:
             content = result["choices"][0]["message"]["content"]
             # Tenta converter para dict
             import json as _json
-            return _json.loads(content)
+            classificacao = _json.loads(content)
+            classificacao["fonte"] = "deepseek"
+            return classificacao
+    except CircuitoAberto:
+        return {"intencao": "outros", "entidades": {}, "fonte": "disjuntor"}
     except Exception as e:
-        print(f"[DeepSeek][ERRO] Falha ao classificar intenção: {str(e)}")
-    return {"intencao": "outros", "entidades": {}}
+        log_classificador.erro("deepseek_falhou", erro=str(e))
+    return {"intencao": "outros", "entidades": {}, "fonte": "padrao"}
+
+# --- CLASSIFICAÇÃO LOCAL COM FALLBACK PARA O DEEPSEEK ---
+# Regras + TF-IDF local (classificador_intencao.py) resolvem a maioria das mensagens sem rede.
+# Resultados do modelo abaixo do limiar de confiança, com pouca margem entre as duas primeiras
+# intenções ou em "outros" sobem para o DeepSeek, e o resultado fica em cache pelo hash do texto
+# normalizado. Limiar e margem são calibrados na subida num conjunto de validação separado do treino
+# (CLASSIFICADOR_VALIDACAO acrescenta exemplos), pela maior cobertura com precisão >=
+# CLASSIFICADOR_PRECISAO_MIN; CLASSIFICADOR_LIMIAR/CLASSIFICADOR_MARGEM_MIN fixam os valores na mão.
+INTENCAO_CACHE_TTL = int(os.getenv("INTENCAO_CACHE_TTL", 60 * 60 * 24))
+classificador_local = ClassificadorLocal()
+_calibracao = classificador_local.calibrar(precisao_min=float(os.getenv("CLASSIFICADOR_PRECISAO_MIN", 0.95)))
+if os.getenv("CLASSIFICADOR_LIMIAR"):
+    classificador_local.limiar = float(os.getenv("CLASSIFICADOR_LIMIAR"))
+if os.getenv("CLASSIFICADOR_MARGEM_MIN"):
+    classificador_local.margem_min = float(os.getenv("CLASSIFICADOR_MARGEM_MIN"))
+CLASSIFICADOR_LIMIAR = classificador_local.limiar
+log_classificador.info("classificador_calibrado", limiar=classificador_local.limiar,
+                       margem_min=classificador_local.margem_min, precisao=_calibracao["precisao"],
+                       cobertura=_calibracao["cobertura"])
+
+def _ler_classificacao_cache(chave):
+    val = redis_client.get(chave)
+    return json.loads(val) if val else None
+
+@cronometrar("classificacao")
+def classificar_intencao(mensagem_usuario):
+    local = classificador_local.classificar(mensagem_usuario)
+    if classificador_local.confiavel(local):
+        return local
+    chave = f"intencao:{hash_texto(normalizar_texto(mensagem_usuario))}"
+    cache = cache_l1.obter(chave, lambda: _ler_classificacao_cache(chave))
+    if cache:
+        return dict(cache, fonte="cache")
+    log_classificador.info("fallback_deepseek", intencao_local=local["intencao"], confianca=local["confianca"])
+    classificacao = classificar_intencao_deepseek(mensagem_usuario)
+    classificacao["intencao"] = normalizar_intencao(classificacao.get("intencao"))
+    if classificacao.get("fonte") == "deepseek":
+        redis_client.setex(chave, INTENCAO_CACHE_TTL, json.dumps(classificacao, ensure_ascii=False))
+        cache_l1.invalidar(chave)
+    return classificacao
 
 # --- FLAG DE CUMPRIMENTO NO REDIS ---
 CUMPRIMENTO_TTL = 60 * 60 * 6  # 6 horas (ajuste conforme necessário)
 
-def cumprimentou_cliente(remoteJid):
-    key = f"conversa:{remoteJid}:cumprimentou"
-    return redis_client.get(key) == "1"
+def cumprimentou_cliente(remoteJid, estado=None):
+    estado = estado or carregar_estado_conversa(remoteJid)
+    return estado.get("cumprimentou") == "1"
+
+def setar_cumprimento_cliente(remoteJid, estado=None):
+    if estado is None:
+        estado = carregar_estado_conversa(remoteJid)
+        estado.set("cumprimentou", "1", CUMPRIMENTO_TTL)
+        estado.salvar()
+    else:
+        estado.set("cumprimentou", "1", CUMPRIMENTO_TTL)
+
+# --- PREFETCH DO CONTEXTO ---
+# IXC, histórico e classificação de intenção são independentes entre si: rodam em paralelo e a
+# latência pré-LLM passa a ser a da etapa mais lenta, não a soma das três.
+PREFETCH_MAX_WORKERS = int(os.getenv("PREFETCH_MAX_WORKERS", 32))
+PREFETCH_TIMEOUTS = {
+    "ixc": float(os.getenv("PREFETCH_TIMEOUT_IXC", 30)),
+    "historico": float(os.getenv("PREFETCH_TIMEOUT_HISTORICO", 10)),
+    "intencao": float(os.getenv("PREFETCH_TIMEOUT_INTENCAO", 15)),
+}
+PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=PREFETCH_MAX_WORKERS, thread_name_prefix="prefetch")
+
+def carregar_dados_ixc(remoteJid, cpf):
+    marcar_conversa_ativa(cpf)
+    return consultar_dados_ixc(cpf, remoteJid)
+
+def sincronizar_historico(remoteJid, cpf):
+    """Cold start do histórico local: só consulta o Mem0AI se a conversa ainda não tem histórico no Redis."""
+    user_id = f"{remoteJid}:{cpf}"
+    if historico_conversa.sincronizado(user_id):
+        return True
+    historico = buscar_historico_mem0(remoteJid, cpf)
+    importadas = historico_conversa.importar_mem0(user_id, historico, lambda texto: classificador_local.classificar(texto)["intencao"])
+    log_historico.info("mem0_importado", user_id=user_id, memorias=importadas)
+    return True
+
+def registrar_turno(remoteJid, cpf, intencao, user_message, resposta=None):
+    """Grava a mensagem do usuário e a resposta enviada no histórico local, marcadas com a intenção."""
+    entradas = [historico_conversa.entrada("user", user_message, intencao)]
+    if resposta:
+        entradas.append(historico_conversa.entrada("assistant", resposta, intencao))
+    try:
+        historico_conversa.adicionar(f"{remoteJid}:{cpf}", entradas)
+    except Exception as e:
+        log_historico.erro("gravar_turno_falhou", erro=str(e))
+
+def prefetch_contexto(remoteJid, cpf, phone, user_message):
+    """
+    Executa as três consultas pré-LLM em paralelo, cada uma com seu próprio timeout.
+    Etapas que estouram o timeout ou falham usam um valor padrão e não derrubam o atendimento.
+    Retorna (dados_ixc, historico, classificacao).
+    """
+    inicio = time.time()
+    futuros = {
+        "ixc": submeter_com_contexto(PREFETCH_EXECUTOR, carregar_dados_ixc, remoteJid, cpf),
+        "historico": submeter_com_contexto(PREFETCH_EXECUTOR, sincronizar_historico, remoteJid, phone),
+        "intencao": submeter_com_contexto(PREFETCH_EXECUTOR, classificar_intencao, user_message),
+    }
+    padroes = {"ixc": None, "historico": None, "intencao": {"intencao": "outros", "entidades": {}}}
+    resultados = {}
+    for etapa, futuro in futuros.items():
+        # Limitado também pelo orçamento do turno (ver prazo.py)
+        restante = prazo.limitar(inicio + PREFETCH_TIMEOUTS[etapa] - time.time())
+        try:
+            resultados[etapa] = futuro.result(timeout=max(0, restante))
+        except FuturesTimeout:
+            log_prefetch.erro("timeout", etapa=etapa, timeout_s=PREFETCH_TIMEOUTS[etapa])
+            metricas.contar_erro(f"prefetch_{etapa}")
+            futuro.cancel()
+            resultados[etapa] = padroes[etapa]
+        except Exception as e:
+            log_prefetch.erro("etapa_falhou", etapa=etapa, erro=str(e))
+            metricas.contar_erro(f"prefetch_{etapa}")
+            resultados[etapa] = padroes[etapa]
+    log_prefetch.info("contexto_carregado", duracao_ms=round((time.time() - inicio) * 1000))
+    return resultados["ixc"], resultados["historico"], resultados["intencao"]
+
+# --- EXECUÇÃO DE TOOL CALLS ---
+# Todas as tool_calls de uma mesma mensagem do Mistral rodam em paralelo (parallel_tool_calls),
+# então um turno com N consultas ao IXC custa uma latência do IXC e não N.
+TOOLS_MAX_WORKERS = int(os.getenv("TOOLS_MAX_WORKERS", 16))
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", 30))
+TOOLS_EXECUTOR = ThreadPoolExecutor(max_workers=TOOLS_MAX_WORKERS, thread_name_prefix="tools")
+
+def executar_tool(tool_name, tool_args, turno=None):
+    # Nome vem do Mistral: fora da lista de tools vira um único label, para não explodir as séries
+    rotulo = tool_name if tool_name in TOOLS_CONHECIDAS else "desconhecida"
+    metricas.TOOL_CALLS_TOTAL.labels(rotulo).inc()
+    with medir(f"tool_{rotulo}"):
+        return registro_tools.executar(tool_name, tool_args, turno)
+
+def preparar_tool_call(tool_call, cpf_contexto):
+    """(nome, argumentos, erro) de uma tool_call do Mistral, com o CPF do contexto."""
+    tool_name = tool_call["function"]["name"]
+    try:
+        tool_args = json.loads(tool_call["function"]["arguments"] or "{}")
+    except (ValueError, TypeError) as e:
+        return tool_name, None, {"erro": f"Argumentos inválidos para {tool_name}: {str(e)}"}
+    # Garante que o CPF passado é sempre o do contexto
+    if "cpf" in tool_args or "cpf" in registro_tools.parametros(tool_name):
+        tool_args["cpf"] = cpf_contexto
+    log_tools.info("tool_call", tool=tool_name, args=tool_args)
+    return tool_name, tool_args, None
+
+def executar_tool_calls(tool_calls, cpf_contexto, turno=None):
+    """
+    Executa as tool_calls concorrentemente e retorna os resultados na ordem original.
+    Timeout ou exceção em uma tool vira {"erro": ...} só para ela, sem afetar as demais.
+    turno (TurnoTools) traz o snapshot do IXC do turno e os resultados já obtidos nas rodadas anteriores.
+    """
+    turno = turno or TurnoTools(cpf_contexto)
+    futuros = []
+    for tool_call in tool_calls:
+        tool_name, tool_args, erro = preparar_tool_call(tool_call, cpf_contexto)
+        if erro:
+            futuros.append((tool_name, None, erro))
+            continue
+        futuros.append((tool_name, submeter_com_contexto(TOOLS_EXECUTOR, executar_tool, tool_name, tool_args, turno), None))
+    inicio = time.time()
+    resultados = []
+    for tool_name, futuro, erro in futuros:
+        if futuro is None:
+            resultados.append(erro)
+            continue
+        try:
+            resultados.append(futuro.result(timeout=max(0, prazo.limitar(inicio + TOOL_TIMEOUT - time.time()))))
+        except FuturesTimeout:
+            log_tools.erro("timeout", tool=tool_name, timeout_s=TOOL_TIMEOUT)
+            metricas.contar_erro("tool_timeout")
+            futuro.cancel()
+            resultados.append({"erro": f"Timeout ao executar {tool_name}"})
+        except Exception as e:
+            log_tools.erro("tool_falhou", tool=tool_name, erro=str(e))
+            resultados.append({"erro": str(e)})
+    return resultados
+
+def aplicar_cumprimento(resposta, nome_cliente, remoteJid, estado=None):
+    """Cumprimenta pelo nome só na primeira resposta útil da conversa; nas demais remove o cumprimento."""
+    if not resposta:
+        return resposta
+    cumprimentou = cumprimentou_cliente(remoteJid, estado)
+    if not cumprimentou and nome_cliente:
+        if not resposta.lower().startswith(f"olá, {nome_cliente.lower()}"):
+            resposta = f"Olá, {nome_cliente}!\n" + resposta.lstrip()
+        setar_cumprimento_cliente(remoteJid, estado)
+    elif cumprimentou and nome_cliente:
+        resposta = re.sub(r"olá,?\s*" + re.escape(nome_cliente) + r"[!,\.\s]*", "", resposta, flags=re.IGNORECASE)
+    return resposta
+
+def extrair_remetente(data):
+    """Retorna (remote_jid, phone, user_message) do payload da MegaAPI; campos ausentes vêm como None."""
+    remote_jid = data.get("remoteJid") or data.get("key", {}).get("remoteJid")
+    phone = None
+    if remote_jid:
+        phone = remote_jid.split("@")[0]
+        phone = "".join(filter(str.isdigit, phone))
+    else:
+        log_webhook.aviso("remote_jid_ausente")
+    user_message = data.get("message", {}).get("extendedTextMessage", {}).get("text")
+    return remote_jid, phone, user_message
+
+def deve_ignorar_payload(data):
+    return data.get("fromMe") or data.get("key", {}).get("fromMe") or data.get("isGroup") or data.get("broadcast")
+
+def montar_contexto_cliente(dados_ixc):
+    """Retorna (nome_cliente, fatos_cliente) com os dados do contrato/cliente para o contexto do Mistral."""
+    nome_cliente = None
+    status_contrato = None
+    if dados_ixc and 'cliente' in dados_ixc:
+        nome_cliente = dados_ixc['cliente'].get('razao_social') or dados_ixc['cliente'].get('nome')
+    if dados_ixc and 'contrato' in dados_ixc:
+        status_contrato = dados_ixc['contrato'].get('status')
+    contexto_cliente = []
+    if nome_cliente:
+        contexto_cliente.append(f"O nome do cliente é {nome_cliente}.")
+    if status_contrato:
+        contexto_cliente.append(f"O status do contrato do cliente é {status_contrato}.")
+    fatos_cliente = []
+    if contexto_cliente:
+        fatos_cliente.append({"role": "system", "content": " ".join(contexto_cliente)})
+    return nome_cliente, fatos_cliente
+
+def selecionar_historico(entradas):
+    """Separa as entradas do histórico local em (turnos user/assistant, memórias do Mem0AI), sem dados sensíveis."""
+    # Memórias importadas do Mem0AI entram como system (últimas 5), sem dados sensíveis
+    memorias = [{"role": "system", "content": e["content"]} for e in entradas if e.get("origem") == "mem0" and not e.get("sensivel")][-5:]
+    # Adicionar histórico user/assistant (últimas 10 interações, sem dados sensíveis, da mesma intenção)
+    hist_msgs = [e for e in entradas if e.get("origem") != "mem0" and e.get("role") in ("user", "assistant")]
+    # Remove duplicidade e pega só as últimas 10
+    last_msgs = []
+    last_role = None
+    for e in hist_msgs[-10:]:
+        if last_role == e["role"] == "user":
+            continue  # pula user duplicado
+        # Não adiciona mensagens com dados sensíveis
+        if e.get("sensivel"):
+            continue
+        last_msgs.append({"role": e["role"], "content": e["content"]})
+        last_role = e["role"]
+    return last_msgs, memorias
+
+def montar_messages_mistral(fatos_cliente, last_msgs, memorias, user_message, intencao, entidades):
+    # Corta histórico e memórias para caber no orçamento de tokens (ver contexto_mistral.py).
+    # A intenção detectada vai explicitamente no fim do contexto do Mistral.
+    messages = montar_mensagens(
+        payload_mistral.mensagem_prompt,
+        fatos_cliente,
+        last_msgs,
+        memorias,
+        {"role": "user", "content": user_message},
+        {"role": "system", "content": f"A intenção detectada é: {intencao}. Entidades: {json.dumps(entidades, ensure_ascii=False)}"},
+        MISTRAL_ORCAMENTO_TOKENS,
+    )
+    log_mistral.debug("contexto_montado", mensagens=len(messages), fatos_cliente=len(fatos_cliente), turnos=len(last_msgs), memorias=len(memorias))
+    return messages
 
-def setar_cumprimento_cliente(remoteJid):
-    key = f"conversa:{remoteJid}:cumprimentou"
-    redis_client.setex(key, CUMPRIMENTO_TTL, "1")
+def resposta_sem_llm(intencao, dados_ixc, nome_cliente):
+    """
+    Respostas fixas (saudação, despedida, pedido não entendido) e regras de negócio checadas antes
+    de chamar o Mistral. Retorna (status, resposta) ou (None, None) quando o Mistral deve responder.
+    """
+    # Se for saudação, elogio ou despedida, responder cordialmente
+    if intencao in ["saudacao", "elogio", "despedida"]:
+        resposta = "Olá! Como posso te ajudar hoje?"
+        if intencao == "despedida":
+            resposta = "Obrigado pelo contato! Se precisar de algo, estou à disposição."
+        return "ok", resposta
+    # CPF informado sozinho: já está salvo no contexto, só perguntar como ajudar
+    if intencao == "informar_cpf":
+        return "ok", "Obrigado! Recebi seu CPF. Como posso te ajudar hoje?"
+    # Se for outros, pedir para ser mais específico
+    if intencao == "outros":
+        return "ok", "Não entendi seu pedido. Pode ser mais específico? Por exemplo: 'quero meu boleto', 'estou sem internet', etc."
+    # Se for intenção clara, seguir fluxo normal (já existente)
+
+    # --- REGRAS DE NEGÓCIO NO BACKEND ---
+    # Checagens antes de chamar o Mistral
+    resposta_antecipada = None
+    if intencao == "consulta_boleto":
+        status_contrato = None
+        if dados_ixc and 'contrato' in dados_ixc:
+            status_contrato = dados_ixc['contrato'].get('status')
+        if status_contrato and status_contrato.lower() != 'ativo':
+            resposta_antecipada = f"Seu contrato está '{status_contrato}'. Não é possível exibir boletos. Por favor, regularize sua situação ou fale com um atendente."
+    elif intencao == "estou_sem_internet":
+        status_contrato = None
+        status_internet = None
+        if dados_ixc and 'contrato' in dados_ixc:
+            status_contrato = dados_ixc['contrato'].get('status')
+            status_internet = dados_ixc['contrato'].get('status_internet')
+        if status_contrato and status_contrato.lower() == 'bloqueado':
+            resposta_antecipada = "Seu contrato está bloqueado. Para reativação, regularize seus boletos ou fale com um atendente."
+        elif status_internet and status_internet.lower() != 'ativo':
+            resposta_antecipada = f"Sua internet está '{status_internet}'. Recomendo falar com o suporte."
+    elif intencao == "consulta_valor_plano":
+        status_contrato = None
+        if dados_ixc and 'contrato' in dados_ixc:
+            status_contrato = dados_ixc['contrato'].get('status')
+        if status_contrato and status_contrato.lower() != 'ativo':
+            resposta_antecipada = f"Seu contrato está '{status_contrato}'. Não é possível exibir o valor do plano."
+    if resposta_antecipada:
+        return "regra_negocio", limpar_resposta(resposta_antecipada, nome_cliente, intencao)
+    return None, None
+
+def anexar_resultados_tools(mistral_messages, tool_calls, resultados_tools):
+    # Resultados voltam ao contexto na mesma ordem das tool_calls recebidas
+    for tool_call, tool_result in zip(tool_calls, resultados_tools):
+        tool_name = tool_call["function"]["name"]
+        log_tools.debug("resultado_tool", tool=tool_name, erro=tool_result.get("erro") if isinstance(tool_result, dict) else None)
+        mistral_messages.append({
+            "role": "assistant",
+            "tool_call_id": tool_call["id"],
+            "content": "",
+            "tool_calls": [tool_call]
+        })
+        mistral_messages.append({
+            "role": "tool",
+            "tool_call_id": tool_call["id"],
+            "name": tool_name,
+            "content": json.dumps(tool_result, ensure_ascii=False)
+        })
 
-@app.route("/webhook", methods=["POST"])
-def webhook():
+MAX_TOOL_CALLS = 5
+MENSAGENS_TRANSICAO = ["estou buscando seus dados...", "aguarde...", "buscando informações..."]
+
+# --- RESPOSTA DEGRADADA ---
+# Quando o orçamento do turno acaba (ver prazo.py) ou o disjuntor do Mistral está aberto (ver
+# disjuntor.py), o cliente recebe uma resposta definida em vez de esperar indefinidamente: o template da intenção, se o snapshot do IXC permitir, senão uma mensagem fixa.
+# Com TURNO_DEGRADADO_HUMANO=1 o atendimento também é transferido para um humano (Make.com).
+RESPOSTA_DEGRADADA = os.getenv(
+    "RESPOSTA_DEGRADADA",
+    "Desculpe a demora! Não consegui concluir sua consulta agora. Pode me mandar sua mensagem de novo em alguns minutos?",
+)
+TURNO_DEGRADADO_HUMANO = os.getenv("TURNO_DEGRADADO_HUMANO", "0") == "1"
+
+def resposta_degradada(intencao, dados_ixc, nome_cliente):
+    resposta = respostas_template.responder(intencao, dados_ixc) if TEMPLATES_ATIVOS and intencao else None
+    return limpar_resposta(resposta or RESPOSTA_DEGRADADA, nome_cliente, intencao)
+
+def transferir_degradado(cpf, intencao, user_message):
+    if TURNO_DEGRADADO_HUMANO and cpf:
+        # submit sem copiar o contexto: a transferência roda fora do prazo do turno
+        TOOLS_EXECUTOR.submit(transferir_para_humano, cpf, f"Turno sem resposta a tempo (intenção: {intencao}). Última mensagem: {user_message}")
+
+def responder_degradado(remote_jid, phone, cpf, intencao, user_message, dados_ixc, nome_cliente):
+    resposta = resposta_degradada(intencao, dados_ixc, nome_cliente)
+    metricas.RESPOSTAS_TOTAL.labels("degradada").inc()
+    enviar_whatsapp(phone, resposta)
+    registrar_turno(remote_jid, phone, intencao, user_message, resposta)
+    transferir_degradado(cpf, intencao, user_message)
+    return {"status": "degradada", "intencao": intencao, "mensagem": resposta}, 200
+
+@cronometrar("turno")
+def processar_payload(data):
+    """
+    Processa um payload de webhook da MegaAPI do início ao fim (classificação, contexto, Mistral, envio).
+    Usado tanto pela rota /webhook (síncrona) quanto pelos workers da fila. Retorna (corpo, status_http).
+    A variante asyncio (app_async.py) segue exatamente os mesmos passos.
+    """
     intencao = None  # valor padrão
     entidades = {}
+    estado = None
+    remote_jid = phone = user_message = cpf_contexto = None
+    dados_ixc = nome_cliente = None
+    token_prazo = None
     try:
-        data = request.json
-        logs = []
-        console.rule("[bold green]Webhook Recebido")
-        rprint(data)
-        console.log(f"[LOG] Payload recebido: {json.dumps(data, ensure_ascii=False)}")
-
-        if data.get("fromMe") or data.get("key", {}).get("fromMe") or data.get("isGroup") or data.get("broadcast"):
-            console.log("[yellow] Ignorando mensagem enviada pelo próprio bot, grupo ou broadcast.")
-            return jsonify({"status": "ignored"})
-
-        remote_jid = data.get("remoteJid") or data.get("key", {}).get("remoteJid")
-        phone = None
-        if remote_jid:
-            phone_original = remote_jid
-            phone = remote_jid.split("@")[0]
-            phone = "".join(filter(str.isdigit, phone))
-            console.log(f"[yellow]Telefone original: {phone_original} | Telefone extraído: {phone}")
-        else:
-            console.log(f"[red]Campo 'remoteJid' não encontrado no payload!")
+        # trace_id do turno: vai em todos os logs (inclusive das threads de prefetch/tools)
+        novo_trace_id((data.get("key") or {}).get("id"))
+        # Prazo do turno contado a partir de agora; a espera desde o recebimento do webhook (fila,
+        # coalescedor, reentregas) é medida à parte e não consome o orçamento
+        token_prazo = prazo.iniciar()
+        registrar_espera_fila(data)
+        log_webhook.debug("payload_recebido")
 
-        user_message = data.get("message", {}).get("extendedTextMessage", {}).get("text")
+        if deve_ignorar_payload(data):
+            log_webhook.debug("payload_ignorado")
+            return {"status": "ignored"}, 200
+
+        remote_jid, phone, user_message = extrair_remetente(data)
 
         if not phone or not user_message or len(phone) < 10:
-            console.log(f"[red]Payload inesperado ou número inválido: {data}")
-            return jsonify({"error": "Payload inesperado ou número inválido", "payload": data}), 400
-
-        # Se o usuário informar um CPF válido, consultar e salvar dados do IXC
-        if is_cpf(user_message):
-            salvar_cpf_contexto(remote_jid, user_message)
-            dados_ixc = buscar_ixc_redis(remote_jid, user_message)
-            if not dados_ixc:
-                dados_ixc = consultar_dados_ixc(user_message, remote_jid)
-                salvar_ixc_redis(remote_jid, user_message, dados_ixc)
-            console.log(f"[LOG] CPF informado e dados IXC salvos: {user_message} -> {dados_ixc}")
+            log_webhook.aviso("payload_invalido", campos=sorted(data.keys()))
+            return {"error": "Payload inesperado ou número inválido", "payload": data}, 400
+
+        # Estado da conversa: um round trip para carregar agora e um para gravar no fim do turno
+        estado = carregar_estado_conversa(remote_jid)
+
+        # Se o usuário informar um CPF válido, salva no contexto (os dados do IXC são carregados no prefetch).
+        # Num grupo de mensagens (coalescedor) o CPF pode estar em qualquer uma delas
+        cpf_mensagem = cpf_informado(user_message)
+        if cpf_mensagem:
+            salvar_cpf_contexto(remote_jid, cpf_mensagem, estado)
+            log_webhook.info("cpf_salvo", remote_jid=remote_jid)
 
         # Garante que o CPF está no contexto
-        cpf_contexto = garantir_cpf_contexto(remote_jid, user_message)
-        console.log(f"[LOG] CPF no contexto: {cpf_contexto}")
+        cpf_contexto = garantir_cpf_contexto(remote_jid, cpf_mensagem, estado)
 
         if not cpf_contexto:
-            console.log(f"[LOG] CPF não encontrado no contexto. Solicitando ao usuário.")
+            log_webhook.info("aguardando_cpf", remote_jid=remote_jid)
             resposta = "Por favor, informe seu CPF (apenas números) para que eu possa te ajudar."
-            send_whatsapp_message(phone, resposta)
-            return jsonify({"status": "aguardando_cpf"})
-
-        # Buscar dados do IXC do Redis, se não houver, consultar e salvar
-        dados_ixc = buscar_ixc_redis(remote_jid, cpf_contexto)
-        if not dados_ixc:
-            dados_ixc = consultar_dados_ixc(cpf_contexto, remote_jid)
-            salvar_ixc_redis(remote_jid, cpf_contexto, dados_ixc)
-        console.log(f"[LOG] Dados IXC usados para contexto: {dados_ixc}")
+            enviar_whatsapp(phone, resposta)
+            return {"status": "aguardando_cpf"}, 200
 
-        # Buscar histórico do Mem0AI (apenas user/assistant)
-        historico = buscar_historico_mem0(remote_jid, phone)
-        console.log(f"[LOG] Histórico Mem0AI retornado: {historico}")
+        # Prefetch: dados do IXC, histórico do Mem0AI e classificação de intenção em paralelo
+        prazo.verificar("prefetch")
+        dados_ixc, historico, classificacao = prefetch_contexto(remote_jid, cpf_contexto, phone, user_message)
+        intencao = classificacao.get("intencao", "outros")
+        entidades = classificacao.get("entidades", {})
+        log_classificador.info("intencao", intencao=intencao, fonte=classificacao.get("fonte"), confianca=classificacao.get("confianca"), entidades=len(entidades))
+        metricas.INTENCOES_TOTAL.labels(intencao, classificacao.get("fonte") or "desconhecida").inc()
 
         # Montar contexto para o Mistral
-        messages = [{"role": "system", "content": PROMPT}]
-        # Adicionar dados do contrato/cliente do Redis ao contexto
-        nome_cliente = None
-        status_contrato = None
-        if dados_ixc and 'cliente' in dados_ixc:
-            nome_cliente = dados_ixc['cliente'].get('razao_social') or dados_ixc['cliente'].get('nome')
-        if dados_ixc and 'contrato' in dados_ixc:
-            status_contrato = dados_ixc['contrato'].get('status')
-        contexto_cliente = []
-        if nome_cliente:
-            contexto_cliente.append(f"O nome do cliente é {nome_cliente}.")
-        if status_contrato:
-            contexto_cliente.append(f"O status do contrato do cliente é {status_contrato}.")
-        if contexto_cliente:
-            messages.append({"role": "system", "content": " ".join(contexto_cliente)})
-        console.log(f"[LOG] Contexto do cliente adicionado ao Mistral: {contexto_cliente}")
-
-        # Filtrar histórico do Mem0AI: só intenções, sem dados sensíveis
-        def is_intent_memory(mem):
-            if not isinstance(mem, dict) or not mem.get("memory"): return False
-            texto = mem["memory"].lower()
-            # Palavras-chave de intenção
-            if any(x in texto for x in ["preciso", "quero", "necessito", "estou sem", "reclamação", "elogio", "boleto", "status", "cadastro", "valor do plano", "abrir os", "transferir para humano", "ajuda", "suporte"]):
-                # Não pode conter dados sensíveis
-                if not any(x in texto for x in ["cpf", "endereço", "address", "contrato", "boleto de r$", "nome", "razao_social", "telefone", "pix", "linha_digitavel", "url_pdf", "gateway_link", "senha", "login", "mac", "ipv4"]):
-                    return True
-            return False
-        # --- NOVO: Só adicionar histórico da mesma intenção ---
-        def is_same_intent(mem, intencao):
-            if not isinstance(mem, dict) or not mem.get("memory"): return False
-            texto = mem["memory"].lower()
-            if intencao == "consulta_boleto" and "boleto" in texto:
-                return True
-            if intencao == "consulta_status_plano" and "status" in texto:
-                return True
-            if intencao == "estou_sem_internet" and ("sem internet" in texto or "internet" in texto or "conexão" in texto):
-                return True
-            if intencao == "consulta_dados_cadastro" and ("cadastro" in texto or "dados cadastrais" in texto):
-                return True
-            if intencao == "consulta_valor_plano" and ("valor do plano" in texto or "mensalidade" in texto):
-                return True
-            if intencao == "fazer_contrato" and ("contrato" in texto or "assinar" in texto):
-                return True
-            if intencao in ["reclamar_atendimento", "elogiar_servico", "falar_com_atendente"] and ("reclamação" in texto or "elogio" in texto or "atendente" in texto):
-                return True
-            return False
-        historico_intencoes = []
-        if historico and isinstance(historico, dict) and "results" in historico:
-            historico_intencoes = [m for m in historico["results"] if is_intent_memory(m) and is_same_intent(m, intencao)]
-        elif historico and isinstance(historico, list):
-            historico_intencoes = [m for m in historico if is_intent_memory(m) and is_same_intent(m, intencao)]
-        # Adicionar intenções ao contexto (apenas da mesma intenção)
-        for m in historico_intencoes[-5:]:
-            messages.append({"role": "system", "content": m["memory"]})
-        # Adicionar histórico user/assistant (últimas 10 interações, sem dados sensíveis, da mesma intenção)
-        hist_msgs = []
-        if historico and isinstance(historico, dict) and "results" in historico:
-            hist_msgs = [m for m in mem0_to_mistral_messages(historico["results"]) if m.get("role") in ("user", "assistant") and is_same_intent(m, intencao)]
-        elif historico and isinstance(historico, list):
-            hist_msgs = [m for m in mem0_to_mistral_messages(historico) if m.get("role") in ("user", "assistant") and is_same_intent(m, intencao)]
-        # Remove duplicidade e pega só as últimas 10
-        last_msgs = []
-        last_role = None
-        for m in hist_msgs[-10:]:
-            if last_role == m.get("role") == "user":
-                continue  # pula user duplicado
-            # Não adiciona mensagens com dados sensíveis
-            if any(x in m.get("content", "").lower() for x in ["cpf", "endereço", "address", "contrato", "boleto de r$", "nome", "razao_social", "telefone", "pix", "linha_digitavel", "url_pdf", "gateway_link", "senha", "login", "mac", "ipv4"]):
-                continue
-            last_msgs.append(m)
-            last_role = m.get("role")
-        messages.extend(last_msgs)
-        if last_role != "user":
-            messages.append({"role": "user", "content": user_message})
-        print("\n[LOG] Enviando para Mistral:")
-        pprint.pprint(messages)
-        console.log(f"[LOG] Mensagens enviadas para Mistral: {messages}")
+        nome_cliente, fatos_cliente = montar_contexto_cliente(dados_ixc)
+        # Histórico local da mesma intenção (índice por intenção no Redis, já marcado como sensível ou não)
+        with medir("redis_historico"):
+            entradas = historico_conversa.ultimos(f"{remote_jid}:{phone}", intencao, HISTORICO_CONTEXTO_MAX)
+        last_msgs, memorias = selecionar_historico(entradas)
 
         # Salvar mensagem do usuário no Mem0AI
         salvar_historico_mem0(remote_jid, phone, {"role": "user", "content": user_message})
 
-        # Classificar intenção do usuário
-        classificacao = classificar_intencao_deepseek(user_message)
-        intencao = classificacao.get("intencao", "outros")
-        entidades = classificacao.get("entidades", {})
-        print(f"[DeepSeek][MICROAGENTE] Mensagem: {user_message}")
-        print(f"[DeepSeek][MICROAGENTE] Intenção detectada: {intencao}")
-        print(f"[DeepSeek][MICROAGENTE] Entidades extraídas: {entidades}")
-        # Adiciona intenção detectada explicitamente ao contexto do Mistral
-        messages.append({
-            "role": "system",
-            "content": f"A intenção detectada é: {intencao}. Entidades: {json.dumps(entidades, ensure_ascii=False)}"
-        })
-        # Se for saudação, elogio ou despedida, responder cordialmente
-        if intencao in ["saudacao", "elogio", "despedida"]:
-            resposta = "Olá! Como posso te ajudar hoje?"
-            if intencao == "despedida":
-                resposta = "Obrigado pelo contato! Se precisar de algo, estou à disposição."
-            send_whatsapp_message(phone, resposta)
-            return jsonify({"status": "ok", "intencao": intencao})
-        # Se for outros, pedir para ser mais específico
-        if intencao == "outros":
-            resposta = "Não entendi seu pedido. Pode ser mais específico? Por exemplo: 'quero meu boleto', 'estou sem internet', etc."
-            send_whatsapp_message(phone, resposta)
-            return jsonify({"status": "ok", "intencao": intencao})
-        # Se for intenção clara, seguir fluxo normal (já existente)
-
-        # --- REGRAS DE NEGÓCIO NO BACKEND ---
-        # Checagens antes de chamar o Mistral
-        resposta_antecipada = None
-        if intencao == "consulta_boleto":
-            status_contrato = None
-            if dados_ixc and 'contrato' in dados_ixc:
-                status_contrato = dados_ixc['contrato'].get('status')
-            if status_contrato and status_contrato.lower() != 'ativo':
-                resposta_antecipada = f"Seu contrato está '{status_contrato}'. Não é possível exibir boletos. Por favor, regularize sua situação ou fale com um atendente."
-        elif intencao == "estou_sem_internet":
-            status_contrato = None
-            status_internet = None
-            if dados_ixc and 'contrato' in dados_ixc:
-                status_contrato = dados_ixc['contrato'].get('status')
-                status_internet = dados_ixc['contrato'].get('status_internet')
-            if status_contrato and status_contrato.lower() == 'bloqueado':
-                resposta_antecipada = "Seu contrato está bloqueado. Para reativação, regularize seus boletos ou fale com um atendente."
-            elif status_internet and status_internet.lower() != 'ativo':
-                resposta_antecipada = f"Sua internet está '{status_internet}'. Recomendo falar com o suporte."
-        elif intencao == "consulta_valor_plano":
-            status_contrato = None
-            if dados_ixc and 'contrato' in dados_ixc:
-                status_contrato = dados_ixc['contrato'].get('status')
-            if status_contrato and status_contrato.lower() != 'ativo':
-                resposta_antecipada = f"Seu contrato está '{status_contrato}'. Não é possível exibir o valor do plano."
-        # Se houver resposta antecipada, envia e encerra
-        if resposta_antecipada:
-            resposta_antecipada = limpar_resposta(resposta_antecipada, nome_cliente, intencao)
-            send_whatsapp_message(phone, resposta_antecipada)
-            console.log(f"[LOG] Mensagem enviada para WhatsApp (regra de negócio): {resposta_antecipada}")
-            return jsonify({"status": "regra_negocio", "mensagem": resposta_antecipada})
+        messages = montar_messages_mistral(fatos_cliente, last_msgs, memorias, user_message, intencao, entidades)
+
+        # Saudação/despedida/outros e regras de negócio: responde sem chamar o Mistral
+        status_resposta, resposta = resposta_sem_llm(intencao, dados_ixc, nome_cliente)
+        if resposta:
+            metricas.RESPOSTAS_TOTAL.labels("regra_negocio" if status_resposta == "regra_negocio" else "fixa").inc()
+            enviar_whatsapp(phone, resposta)
+            registrar_turno(remote_jid, phone, intencao, user_message, resposta)
+            if status_resposta == "regra_negocio":
+                return {"status": "regra_negocio", "mensagem": resposta}, 200
+            return {"status": "ok", "intencao": intencao}, 200
+
+        # --- RESPOSTA POR TEMPLATE ---
+        # Consultas que são só preenchimento de campos do IXC saem direto do snapshot, sem Mistral
+        resposta_template = respostas_template.responder(intencao, dados_ixc) if TEMPLATES_ATIVOS else None
+        if resposta_template:
+            metricas.RESPOSTAS_TOTAL.labels("template").inc()
+            resposta_template = aplicar_cumprimento(resposta_template, nome_cliente, remote_jid, estado)
+            resposta_template = limpar_resposta(resposta_template, nome_cliente, intencao)
+            enviar_whatsapp(phone, resposta_template)
+            registrar_turno(remote_jid, phone, intencao, user_message, resposta_template)
+            return {"status": "template", "intencao": intencao, "mensagem": resposta_template}, 200
+
+        # --- CACHE DE RESPOSTAS ---
+        # Mesma pergunta com os mesmos dados do IXC: reaproveita a resposta do Mistral sem chamar o LLM
+        resposta_cache = cache_respostas.buscar(intencao, user_message, dados_ixc, cpf_contexto, nome_cliente) if RESPOSTA_CACHE_ATIVO else None
+        if resposta_cache:
+            metricas.RESPOSTAS_TOTAL.labels("cache").inc()
+            resposta_cache = aplicar_cumprimento(resposta_cache, nome_cliente, remote_jid, estado)
+            resposta_cache = limpar_resposta(resposta_cache, nome_cliente, intencao)
+            enviar_whatsapp(phone, resposta_cache)
+            registrar_turno(remote_jid, phone, intencao, user_message, resposta_cache)
+            return {"status": "cache", "intencao": intencao, "mensagem": resposta_cache}, 200
 
         # --- CICLO ROBUSTO DE TOOL_CALLS ---
-        max_tool_calls = 5
         tool_call_count = 0
+        transicoes = 0
         resposta_final = None
         mistral_messages = messages.copy()
+        memo_serializacao = {}
+        turno_tools = TurnoTools(cpf_contexto, dados_ixc)
         while True:
-            result = call_mistral(mistral_messages, tools)
-            print("[LOG] Resposta do Mistral:")
-            pprint.pprint(result)
-            console.log(f"[LOG] Resposta do Mistral recebida: {result}")
+            prazo.verificar("mistral")
+            try:
+                result = call_mistral(mistral_messages, tools, memo_serializacao)
+            except CircuitoAberto:
+                log_mistral.aviso("disjuntor_aberto")
+                return responder_degradado(remote_jid, phone, cpf_contexto, intencao, user_message, dados_ixc, nome_cliente)
             if not result or "choices" not in result or not result["choices"]:
                 break
             msg = result["choices"][0]["message"]
             # Se houver tool_calls, executa e adiciona ao contexto
             if msg.get("tool_calls"):
-                for tool_call in msg["tool_calls"]:
-                    tool_name = tool_call["function"]["name"]
-                    tool_args = json.loads(tool_call["function"]["arguments"])
-                    # Garante que o CPF passado é sempre o do contexto
-                    if "cpf" in tool_args:
-                        tool_args["cpf"] = cpf_contexto
-                    print(f"[LOG] Tool call recebida: {tool_name} | Args: {tool_args}")
-                    # Executa a tool
-                    if tool_name == "consultar_dados_ixc":
-                        tool_result = consultar_dados_ixc(**tool_args)
-                    elif tool_name == "consultar_boletos":
-                        tool_result = consultar_boletos_ixc(**tool_args)
-                    elif tool_name == "consultar_status_plano":
-                        tool_result = consultar_status_plano_ixc(**tool_args)
-                    elif tool_name == "consultar_dados_cadastro":
-                        tool_result = consultar_dados_cadastro_ixc(**tool_args)
-                    elif tool_name == "consultar_valor_plano":
-                        tool_result = consultar_valor_plano_ixc(**tool_args)
-                    elif tool_name == "abrir_os":
-                        tool_result = abrir_os(**tool_args)
-                    elif tool_name == "transferir_para_humano":
-                        tool_result = transferir_para_humano(**tool_args)
-                    else:
-                        tool_result = {"erro": f"Tool {tool_name} não implementada"}
-                    print("[LOG] Resultado da tool:", tool_result)
-                    mistral_messages.append({
-                        "role": "assistant",
-                        "tool_call_id": tool_call["id"],
-                        "content": "",
-                        "tool_calls": [tool_call]
-                    })
-                    mistral_messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call["id"],
-                        "name": tool_name,
-                        "content": json.dumps(tool_result, ensure_ascii=False)
-                    })
+                resultados_tools = executar_tool_calls(msg["tool_calls"], cpf_contexto, turno_tools)
+                anexar_resultados_tools(mistral_messages, msg["tool_calls"], resultados_tools)
                 tool_call_count += 1
-                if tool_call_count >= max_tool_calls:
-                    print("[LOG][ERRO] Excesso de tool_calls, encerrando ciclo para evitar loop infinito.")
+                if tool_call_count >= MAX_TOOL_CALLS:
+                    log_mistral.erro("excesso_tool_calls", max_tool_calls=MAX_TOOL_CALLS)
                     break
                 continue  # Chama o Mistral novamente com o novo contexto
             # Se não houver tool_calls, pega a resposta final
             resposta_final = msg.get("content", "")
-            # Ignora mensagens de transição
-            if resposta_final.strip().lower() in ["estou buscando seus dados...", "aguarde...", "buscando informações..."]:
-                print("[LOG] Ignorando mensagem de transição, aguardando resposta final.")
+            # Ignora mensagens de transição (limitadas: o Mistral pode repetir "um momento" indefinidamente)
+            if resposta_final.strip().lower() in MENSAGENS_TRANSICAO:
+                log_mistral.debug("mensagem_transicao_ignorada")
+                transicoes += 1
+                if transicoes >= MAX_TOOL_CALLS:
+                    log_mistral.erro("excesso_mensagens_transicao", max_transicoes=MAX_TOOL_CALLS)
+                    return responder_degradado(remote_jid, phone, cpf_contexto, intencao, user_message, dados_ixc, nome_cliente)
                 continue
             break  # Sai do loop quando tiver resposta final útil
+        metricas.RESPOSTAS_TOTAL.labels("mistral").inc()
+        resposta_mistral = resposta_final
         # Cumprimento cordial na primeira resposta útil
-        cumprimentou = cumprimentou_cliente(remote_jid)
-        if not cumprimentou and nome_cliente and resposta_final:
-            if not resposta_final.lower().startswith(f"olá, {nome_cliente.lower()}"):
-                resposta_final = f"Olá, {nome_cliente}!\n" + resposta_final.lstrip()
-            setar_cumprimento_cliente(remote_jid)
-        elif cumprimentou and nome_cliente:
-            resposta_final = re.sub(r"olá,?\s*" + re.escape(nome_cliente) + r"[!,\.\s]*", "", resposta_final, flags=re.IGNORECASE)
+        resposta_final = aplicar_cumprimento(resposta_final, nome_cliente, remote_jid, estado)
         resposta_final = limpar_resposta(resposta_final, nome_cliente, intencao)
         if resposta_final:
-            send_whatsapp_message(phone, resposta_final)
-            console.log(f"[LOG] Mensagem enviada para WhatsApp: {resposta_final}")
-        return jsonify(result)
+            enviar_whatsapp(phone, resposta_final)
+        registrar_turno(remote_jid, phone, intencao, user_message, resposta_final)
+        # Guarda a resposta crua (sem cumprimento), a não ser que o turno tenha aberto OS/transferido
+        # ou que o Mistral tenha visto turnos anteriores da conversa (a resposta pode depender deles)
+        if RESPOSTA_CACHE_ATIVO and resposta_mistral and not turno_tools.efeito_colateral:
+            cache_respostas.gravar(intencao, user_message, dados_ixc, cpf_contexto, nome_cliente, resposta_mistral,
+                                   com_historico=bool(last_msgs))
+        return result, 200
+    except OrcamentoEsgotado as e:
+        log_webhook.aviso("orcamento_esgotado", motivo=str(e), intencao=intencao)
+        metricas.contar_erro("orcamento_turno")
+        if not phone or not cpf_contexto:
+            return {"error": str(e)}, 504
+        return responder_degradado(remote_jid, phone, cpf_contexto, intencao, user_message, dados_ixc, nome_cliente)
     except Exception as e:
-        console.log(f"[red]Erro inesperado no webhook: {e}")
-        console.log(f"[LOG][ERRO] Exceção capturada: {str(e)} | Payload: {json.dumps(request.json, ensure_ascii=False) if request.json else ''}")
-        return jsonify({"error": str(e)}), 500
+        log_webhook.erro("turno_falhou", exc_info=True, erro=str(e), intencao=intencao)
+        metricas.contar_erro("turno")
+        return {"error": str(e)}, 500
+    finally:
+        if estado is not None:
+            try:
+                with medir("redis_estado_salvar"):
+                    estado.salvar()
+            except Exception as e:
+                log_webhook.erro("gravar_estado_falhou", erro=str(e))
+        if token_prazo is not None:
+            prazo.encerrar(token_prazo)
+
+# Reentregas da MegaAPI (mesmo key.id) são confirmadas na hora, sem processar de novo (ver deduplicador.py)
+deduplicador = DeduplicadorMensagens(
+    redis_client,
+    ttl=int(os.getenv("DEDUP_TTL", 60 * 60 * 24)),
+    max_recentes=int(os.getenv("DEDUP_MAX_RECENTES", 5000)),
+)
+
+def marcar_recebimento(data):
+    """Registra a chegada do webhook no payload, para medir a espera até o turno começar (ver prazo.py)."""
+    if isinstance(data, dict):
+        data.setdefault("recebido_em", time.time())
+    return data
+
+def registrar_espera_fila(data):
+    espera = prazo.espera_fila(data.get("recebido_em"))
+    if espera is None:
+        return
+    metricas.FILA_ESPERA_SEGUNDOS.observe(espera)
+    if espera > prazo.TURNO_ORCAMENTO:
+        log_webhook.aviso("turno_atrasado", espera_s=round(espera, 1))
+
+@app.route("/webhook", methods=["POST"])
+def webhook():
+    data = marcar_recebimento(request.json)
+    if deduplicador.duplicada(data):
+        log_webhook.info("duplicada", msg_id=DeduplicadorMensagens.id_mensagem(data))
+        return jsonify({"status": "duplicada"}), 200
+    corpo, status = processar_em_ordem(data)
+    if status >= 500:
+        # Falhou sem resposta ao cliente: aceita a reentrega da MegaAPI
+        deduplicador.esquecer(data)
+    return jsonify(corpo), status
+
+@app.route("/disjuntores", methods=["GET"])
+def estado_disjuntores():
+    return jsonify({nome: d.status() for nome, d in DISJUNTORES.items()})
+
+@app.route("/webhook/estatisticas", methods=["GET"])
+def webhook_estatisticas():
+    return jsonify({"deduplicacao": deduplicador.estatisticas()})
+
+def processar_em_ordem(data):
+    """processar_payload com os turnos da mesma conversa em série (lock por remoteJid no Redis)."""
+    remote_jid = remote_jid_do_payload(data)
+    if not remote_jid:
+        return processar_payload(data)
+    # Turnos da mesma conversa em série, na ordem de chegada (não há janela de agrupamento aqui)
+    lock = coalescedor.lock_turno(remote_jid, timeout=FILA_VISIBILITY_TIMEOUT, espera=prazo.TURNO_ORCAMENTO)
+    if not lock.acquire():
+        # Sem o lock não processa (passaria na frente do turno em andamento): 503 faz /webhook
+        # esquecer o id e a MegaAPI reentrega a mensagem
+        log_webhook.aviso("timeout_lock_turno", remote_jid=remote_jid)
+        return {"error": "Conversa ocupada, tente novamente"}, 503
+    try:
+        corpo, status = processar_payload(data)
+    finally:
+        try:
+            lock.release()
+        except Exception:
+            pass  # lock expirou durante o turno
+    return corpo, status
 
 def send_to_mistral(user_message):
-    url = "https://api.mistral.ai/v1/agents/completions"
+    url = MISTRAL_URL
     headers = {
         "Authorization": f"Bearer {MISTRAL_API_KEY}",
         "Content-Type": "application/json"
@@ -540,23 +918,20 @@ def send_to_mistral(user_message):
         ],
         "response_format": {"type": "text"}
     }
-    response = requests.post(url, headers=headers, json=payload)
+    response = cliente_http.post("mistral", url, headers=headers, json=payload)
     try:
         response.raise_for_status()
     except requests.exceptions.HTTPError as e:
-        console.log(f"[red]Erro na requisição para Mistral: {e}")
-        rprint(response.text)
+        log_mistral.erro("requisicao_falhou", erro=str(e), status=response.status_code)
         raise
     return response.json()["choices"][0]["message"]["content"]
 
-def send_whatsapp_message(phone, message, max_retries=3, timeout=10):
+@cronometrar("whatsapp_envio")
+def send_whatsapp_message(phone, message, max_retries=3, timeout=None):
     """
     Envia mensagem via MegaAPI. O campo 'to' deve ser apenas o número puro para chat individual, e terminar com @g.us para grupos.
     O payload deve ser enviado dentro de 'messageData', conforme documentação MegaAPI.
     """
-    console.log(f"[magenta]MEGAAPI_URL: {MEGAAPI_URL}")
-    console.log(f"[magenta]INSTANCE_KEY: {INSTANCE_KEY}")
-    console.log(f"[magenta]MEGAAPI_KEY: {MEGAAPI_KEY[:6]}... (ocultado)")
     if phone.endswith("@s.whatsapp.net"):
         phone = phone.replace("@s.whatsapp.net", "")
     payload = {
@@ -566,75 +941,114 @@ def send_whatsapp_message(phone, message, max_retries=3, timeout=10):
             "linkPreview": False
         }
     }
-    console.log(f"[magenta]Payload: {payload}")
     url = f"{MEGAAPI_URL}/rest/sendMessage/{INSTANCE_KEY}/text"
     headers = {
         "Authorization": f"Bearer {MEGAAPI_KEY}",
         "Content-Type": "application/json"
     }
-    console.log(f"[cyan]Enviando requisição para MegaAPI: {payload}")
     for attempt in range(1, max_retries + 1):
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=timeout)
+            response = cliente_http.post("megaapi", url, headers=headers, json=payload, timeout=timeout)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            console.log(f"[red]Tentativa {attempt} - Erro ao enviar mensagem via MegaAPI: {e}")
-            if attempt == max_retries:
-                rprint(response.text if 'response' in locals() else str(e))
+            log_whatsapp.erro("envio_falhou", tentativa=attempt, erro=str(e))
+            if attempt == max_retries or prazo.esgotado(2 + prazo.TIMEOUT_MINIMO):
                 raise
             time.sleep(2)  # Espera 2 segundos antes de tentar novamente
 
+# --- ENVIO DE MENSAGENS PELO OUTBOX ---
+# O processamento do turno só registra o envio no Redis (ver outbox_whatsapp.py); threads de envio
+# entregam à MegaAPI com limite de taxa por INSTANCE_KEY, backoff com jitter e lista de mortas.
+# As mensagens de um mesmo telefone saem sempre na ordem (uma por vez), com qualquer WHATSAPP_SENDERS;
+# mais senders só paralelizam telefones diferentes.
+# WHATSAPP_OUTBOX=0 volta ao envio direto (bloqueante) com send_whatsapp_message.
+WHATSAPP_OUTBOX = os.getenv("WHATSAPP_OUTBOX", "1") == "1"
+outbox_whatsapp = OutboxWhatsApp(
+    redis_client,
+    lambda phone, message: send_whatsapp_message(phone, message, max_retries=1),
+    INSTANCE_KEY,
+    taxa=float(os.getenv("WHATSAPP_TAXA", 5)),  # mensagens/s por instância
+    rajada=int(os.getenv("WHATSAPP_RAJADA", 10)),
+    max_tentativas=int(os.getenv("WHATSAPP_MAX_TENTATIVAS", 5)),
+    backoff_base=float(os.getenv("WHATSAPP_BACKOFF_BASE", 1)),
+    backoff_max=float(os.getenv("WHATSAPP_BACKOFF_MAX", 60)),
+)
+if WHATSAPP_OUTBOX:
+    outbox_whatsapp.iniciar(num_threads=int(os.getenv("WHATSAPP_SENDERS", 2)))
+
+def enviar_whatsapp(phone, message):
+    """Entrega a mensagem ao outbox e retorna o id do envio (ou a resposta da MegaAPI sem outbox)."""
+    with prazo.reserva_envio():
+        if WHATSAPP_OUTBOX:
+            envio_id = outbox_whatsapp.enfileirar(phone, message)
+            log_whatsapp.debug("envio_registrado", envio_id=envio_id)
+            return envio_id
+        return send_whatsapp_message(phone, message)
+
+@app.route("/whatsapp/envios/<envio_id>", methods=["GET"])
+def status_envio_whatsapp(envio_id):
+    status = outbox_whatsapp.status(envio_id)
+    if status is None:
+        return jsonify({"error": "Envio não encontrado"}), 404
+    return jsonify(status)
+
 def validar_cpf(cpf):
     payload = {"cpf": cpf}
     url = f"{IXC_API_URL}/validarCpf"
-    response = requests.post(url, json=payload, timeout=10)
+    response = cliente_http.post("ixc", url, json=payload, timeout=10)
     response.raise_for_status()
     return response.json()
 
 def consultar_cliente(cpf):
     payload = {"cpf": cpf}
     url = f"{IXC_API_URL}/consultarCliente"
-    response = requests.post(url, json=payload, timeout=10)
+    response = cliente_http.post("ixc", url, json=payload, timeout=10)
     response.raise_for_status()
     return response.json()
 
 def consultar_contratos(id_cliente):
     payload = {"id_cliente": id_cliente}
     url = f"{IXC_API_URL}/consultarContratos"
-    response = requests.post(url, json=payload, timeout=10)
+    response = cliente_http.post("ixc", url, json=payload, timeout=10)
     response.raise_for_status()
     return response.json()
 
 def consultar_boletos(id_cliente):
     payload = {"id_cliente": id_cliente}
     url = f"{IXC_API_URL}/consultarBoletos"
-    response = requests.post(url, json=payload, timeout=10)
+    response = cliente_http.post("ixc", url, json=payload, timeout=10)
     response.raise_for_status()
     return response.json()
 
 def consultar_status_plano(id_cliente):
     payload = {"id_cliente": id_cliente}
     url = f"{IXC_API_URL}/consultarStatusPlano"
-    response = requests.post(url, json=payload, timeout=10)
+    response = cliente_http.post("ixc", url, json=payload, timeout=10)
     response.raise_for_status()
     return response.json()
 
+@cronometrar("ixc")
 def consultar_dados_ixc(cpf, remoteJid=None):
-    if remoteJid:
-        cache = buscar_ixc_redis(remoteJid, cpf)
-        if cache:
-            print(f"[LOG] Usando dados do IXC do cache Redis para CPF {cpf}")
-            return cache
+    # O cache é por CPF: o mesmo cliente falando de dois números compartilha o snapshot.
+    # remoteJid é mantido na assinatura por compatibilidade com as chamadas existentes.
+    return cache_ixc.obter(cpf)
+
+def consultar_ixc_upstream(cpf):
+    """Consulta ao IXC pelo disjuntor; aberto, levanta CircuitoAberto (o CacheIXC serve o último snapshot bom)."""
+    return disjuntor_ixc.executar(_consultar_ixc_upstream, cpf)
+
+@cronometrar("ixc_upstream")
+def _consultar_ixc_upstream(cpf):
     payload = {"cpf": cpf}
     try:
-        response = requests.post(IXC_API_URL, json=payload, timeout=30)
+        response = cliente_http.post("ixc", IXC_API_URL, json=payload)
         response.raise_for_status()
         data = response.json()
-        print("[LOG] Dados retornados do IXC para CPF", cpf, ":", json.dumps(data, ensure_ascii=False, indent=2))
-        if remoteJid:
-            salvar_ixc_redis(remoteJid, cpf, data)
+        log_ixc.info("consulta_ixc", cpf=cpf, campos=len(data) if isinstance(data, dict) else None)
         return data
+    except OrcamentoEsgotado:
+        raise  # falta de tempo do turno não é erro do IXC: não entra no cache negativo
     except requests.exceptions.Timeout:
         return {"erro": "Timeout ao consultar IXC"}
     except Exception as e:
@@ -644,7 +1058,7 @@ def abrir_os(id_cliente, motivo):
     payload = {"id_cliente": id_cliente, "motivo": motivo}
     url = f"{IXC_API_URL}/abrirOS"
     try:
-        response = requests.post(url, json=payload, timeout=30)
+        response = cliente_http.post("ixc_escrita", url, json=payload)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.Timeout:
@@ -656,7 +1070,7 @@ def encaminhar_humano(id_cliente, resumo):
     payload = {"id_cliente": id_cliente, "resumo": resumo}
     url = f"{IXC_API_URL}/encaminharHumano"
     try:
-        response = requests.post(url, json=payload, timeout=30)
+        response = cliente_http.post("ixc_escrita", url, json=payload)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.Timeout:
@@ -664,54 +1078,105 @@ def encaminhar_humano(id_cliente, resumo):
     except Exception as e:
         return {"erro": str(e)}
 
-def call_mistral(messages, tools=None):
-    payload = {
-        "agent_id": MISTRAL_AGENT_ID,
-        "messages": messages,
-        "tools": tools,
-        "response_format": {"type": "text"},
-        "max_tokens": 500,
-        "presence_penalty": 0.5,
-        "frequency_penalty": 0.5,
-        "parallel_tool_calls": True
-    }
+@cronometrar("mistral")
+def _post_mistral(corpo, headers):
+    return cliente_http.post("mistral", MISTRAL_URL, headers=headers, data=corpo)
+
+def call_mistral(messages, tools=None, memo=None):
+    # Corpo serializado a partir das partes pré-serializadas (PROMPT, tools, parâmetros); `memo`
+    # guarda o JSON das mensagens já enviadas nas iterações anteriores do loop de tool_calls
+    corpo = payload_mistral.serializar(messages, tools, memo)
     headers = {
         "Authorization": f"Bearer {MISTRAL_API_KEY}",
         "Content-Type": "application/json"
     }
-    response = requests.post(MISTRAL_URL, headers=headers, json=payload)
+    response = disjuntor_mistral.executar(_post_mistral, corpo.encode("utf-8"), headers)
     return response.json()
 
 def is_cpf(text):
     return isinstance(text, str) and text.isdigit() and len(text) == 11
 
+@cronometrar("mem0_escrita")
 def salvar_historico_mem0(remoteJid, cpf, mensagem):
     # Só salva mensagens de intenção/conversa, nunca dados sensíveis
     if mensagem.get("role") in ("user", "assistant"):
         # Proteção extra: não salva se mensagem contém dados sensíveis
-        texto = mensagem.get("content", "").lower()
-        if any(x in texto for x in ["cpf", "endereço", "address", "contrato", "boleto de r$", "nome", "razao_social", "telefone", "pix", "linha_digitavel", "url_pdf", "gateway_link", "senha", "login", "mac", "ipv4"]):
+        if contem_dado_sensivel(mensagem.get("content", "")):
             return
         user_id = f"{remoteJid}:{cpf}"
-        print(f"[MEM0AI] Salvando no histórico: {mensagem} para user_id={user_id}")
+        # Sem tempo no turno para uma escrita direta, também vai para o outbox (o SDK não aceita timeout)
+        if MEM0_WRITE_BEHIND or prazo.esgotado(MEM0_ESCRITA_ORCAMENTO):
+            # Vai para o outbox no Redis; o flusher grava no Mem0AI em background
+            outbox_mem0.enfileirar(user_id, mensagem)
+            return
+        log_mem0.debug("salvando", user_id=user_id, role=mensagem.get("role"))
         mem0_client.add([mensagem], user_id=user_id, agent_id="geovana")
 
+@cronometrar("mem0_leitura")
 def buscar_historico_mem0(remoteJid, cpf, page=1, page_size=50):
     user_id = f"{remoteJid}:{cpf}"
     historico = mem0_client.get_all(user_id=user_id, page=page, page_size=page_size)
-    print(f"[MEM0AI] Histórico retornado para user_id={user_id}: {historico}")
+    log_mem0.info("historico_lido", user_id=user_id, memorias=len(historico.get("results", [])) if isinstance(historico, dict) else len(historico or []))
     return historico
 
+# Formato do snapshot no Redis (ver snapshot_ixc.py): "compacto" (seções usadas, msgpack/zlib, leitura
+# parcial) ou "json" (envelope inteiro, formato anterior). Valores binários: clientes sem decode_responses.
+IXC_FORMATO = os.getenv("IXC_FORMATO", "compacto")
+if IXC_FORMATO == "compacto":
+    formato_ixc = FormatoCompacto(
+        redis.StrictRedis.from_url(redis_url),
+        redis.asyncio.from_url(redis_url),
+        comprimir_acima=int(os.getenv("IXC_COMPRIMIR_ACIMA", 512)),
+    )
+else:
+    formato_ixc = FormatoJSON(redis_client, redis_async_client)
+
+cache_ixc = CacheIXC(
+    redis_client,
+    consultar_ixc_upstream,
+    soft_ttl=IXC_SOFT_TTL,
+    hard_ttl=IXC_HARD_TTL,
+    neg_ttl=IXC_NEG_TTL,
+    lock_ttl=int(os.getenv("IXC_LOCK_TTL", 45)),
+    espera_max=int(os.getenv("IXC_ESPERA_MAX", 35)),
+    cache_local=cache_l1,
+    redis_async=redis_async_client,
+    formato=formato_ixc,
+)
+
+# Aquecimento do cache do IXC (ver aquecedor_ixc.py): mantém fresco o snapshot das conversas ativas
+# e, com IXC_AQUECIMENTO_LOTE_S > 0, aquece em lote os clientes com boleto vencendo ou contrato não ativo.
+# IXC_AQUECEDOR_ATIVO=1 liga o ciclo em background; o lote também roda avulso com: python app.py aquecer
+IXC_AQUECEDOR_ATIVO = os.getenv("IXC_AQUECEDOR_ATIVO", "0") == "1"
+aquecedor_ixc = AquecedorIXC(
+    redis_client,
+    cache_ixc,
+    janela_ativa=int(os.getenv("IXC_AQUECIMENTO_JANELA_S", 60 * 30)),
+    antecedencia=int(os.getenv("IXC_AQUECIMENTO_ANTECEDENCIA_S", 120)),
+    intervalo=float(os.getenv("IXC_AQUECIMENTO_INTERVALO_S", 60)),
+    intervalo_lote=int(os.getenv("IXC_AQUECIMENTO_LOTE_S", 0)),
+    concorrencia=int(os.getenv("IXC_AQUECIMENTO_CONCORRENCIA", 4)),
+    dias_vencimento=int(os.getenv("IXC_AQUECIMENTO_DIAS_VENCIMENTO", 3)),
+)
+if IXC_AQUECEDOR_ATIVO:
+    aquecedor_ixc.iniciar()
+
+def marcar_conversa_ativa(cpf):
+    # Falha aqui só tira o CPF do aquecimento; não pode derrubar a consulta do turno
+    try:
+        aquecedor_ixc.marcar_ativo(cpf)
+    except Exception as e:
+        log_ixc.erro("marcar_ativo_falhou", cpf=cpf, erro=str(e))
+
 def salvar_ixc_redis(remoteJid, cpf, dados_ixc):
     # Proteção extra: nunca salvar histórico de conversa aqui
-    key = f"conversa:{remoteJid}:{cpf}:ixc"
-    redis_client.setex(key, REDIS_TTL_IXC, json.dumps(dados_ixc, ensure_ascii=False))
+    cache_ixc.gravar(cpf, dados_ixc)
 
 def buscar_ixc_redis(remoteJid, cpf):
-    key = f"conversa:{remoteJid}:{cpf}:ixc"
-    val = redis_client.get(key)
-    if val:
-        return json.loads(val)
+    # Só lê o cache (fresco ou velho), nunca consulta o IXC
+    envelope = cache_ixc.ler(cpf)
+    if envelope and not envelope.get("erro"):
+        return envelope["dados"]
     return None
 
 def mem0_to_mistral_messages(memories):
@@ -734,87 +1199,251 @@ def mem0_to_mistral_messages(memories):
 
 def transferir_para_humano(cpf, resumo):
     # Envia o resumo para o webhook Make.com
-    url = "https://hook.us2.make.com/f1x53952bxirumz2gnfpoabdo397uws2"
+    url = MAKE_WEBHOOK_URL
     payload = {"cpf": cpf, "resumo": resumo}
     try:
-        response = requests.post(url, json=payload, timeout=30)
+        response = cliente_http.post("make", url, json=payload)
         response.raise_for_status()
-        console.log(f"[LOG] Resumo enviado para Make.com: {payload}")
+        log_tools.info("transferido_para_humano", cpf=cpf)
         return {"status": "Transferido para humano", "resumo": resumo}
     except Exception as e:
-        console.log(f"[LOG][ERRO] Falha ao transferir para humano: {str(e)} | Payload: {payload}")
+        log_tools.erro("transferir_para_humano_falhou", cpf=cpf, erro=str(e))
         return {"erro": str(e)}
 
-# Funções auxiliares para consultar dados específicos usando o cache geral do IXC
-
-def consultar_boletos_ixc(cpf, remoteJid=None):
-    if remoteJid:
-        cache = buscar_ixc_redis(remoteJid, cpf)
-        if cache and 'boletos' in cache:
-            print(f"[LOG] Usando boletos do cache IXC para CPF {cpf}")
-            return cache['boletos']
-    dados = consultar_dados_ixc(cpf, remoteJid)
-    return dados.get('boletos', dados)
-
-def consultar_status_plano_ixc(cpf, remoteJid=None):
-    if remoteJid:
-        cache = buscar_ixc_redis(remoteJid, cpf)
-        if cache and 'status_plano' in cache:
-            print(f"[LOG] Usando status_plano do cache IXC para CPF {cpf}")
-            return cache['status_plano']
-    dados = consultar_dados_ixc(cpf, remoteJid)
-    return dados.get('status_plano', dados)
-
-def consultar_dados_cadastro_ixc(cpf, remoteJid=None):
-    if remoteJid:
-        cache = buscar_ixc_redis(remoteJid, cpf)
-        if cache and 'cadastro' in cache:
-            print(f"[LOG] Usando cadastro do cache IXC para CPF {cpf}")
-            return cache['cadastro']
-    dados = consultar_dados_ixc(cpf, remoteJid)
-    return dados.get('cadastro', dados)
-
-def consultar_valor_plano_ixc(cpf, remoteJid=None):
-    if remoteJid:
-        cache = buscar_ixc_redis(remoteJid, cpf)
-        if cache and 'valor_plano' in cache:
-            print(f"[LOG] Usando valor_plano do cache IXC para CPF {cpf}")
-            return cache['valor_plano']
-    dados = consultar_dados_ixc(cpf, remoteJid)
-    return dados.get('valor_plano', dados)
+# --- TOOLS DO MISTRAL ---
+# Schema, handler, política de cache e efeito colateral de cada tool ficam no registro (ver registro_tools.py).
+# As consultas ao IXC são projeções do snapshot do CPF: saem do snapshot já carregado no turno ou do CacheIXC.
+registro_tools = RegistroTools(consultar_dados_ixc, cache_local=cache_l1)
+PARAMETRO_CPF = {"cpf": {"type": "string", "description": "CPF do cliente"}}
+
+def _campo_ixc(campo):
+    return lambda dados: dados.get(campo, dados)
+
+registro_tools.registrar(Tool(
+    "consultar_dados_ixc", "Consulta todos os dados do cliente no IXC a partir do CPF.",
+    PARAMETRO_CPF, projecao=lambda dados: dados,
+))
+registro_tools.registrar(Tool(
+    "consultar_boletos", "Consulta os boletos do cliente no IXC a partir do CPF.",
+    PARAMETRO_CPF, projecao=_campo_ixc("boletos"),
+))
+registro_tools.registrar(Tool(
+    "consultar_status_plano", "Consulta o status do plano do cliente no IXC a partir do CPF.",
+    PARAMETRO_CPF, projecao=_campo_ixc("status_plano"),
+))
+registro_tools.registrar(Tool(
+    "consultar_dados_cadastro", "Consulta os dados cadastrais do cliente no IXC a partir do CPF.",
+    PARAMETRO_CPF, projecao=_campo_ixc("cadastro"),
+))
+registro_tools.registrar(Tool(
+    "consultar_valor_plano", "Consulta o valor do plano do cliente no IXC a partir do CPF.",
+    PARAMETRO_CPF, projecao=_campo_ixc("valor_plano"),
+))
+registro_tools.registrar(Tool(
+    "abrir_os", "Abre uma ordem de serviço para o cliente.",
+    {
+        "id_cliente": {"type": "string", "description": "ID do cliente"},
+        "motivo": {"type": "string", "description": "Motivo da OS"}
+    },
+    handler=abrir_os, efeito_colateral=True,
+))
+registro_tools.registrar(Tool(
+    "transferir_para_humano",
+    "Transfere o atendimento para um humano e envia um resumo do atendimento para o webhook Make.com.",
+    {
+        "cpf": {"type": "string", "description": "CPF do cliente"},
+        "resumo": {"type": "string", "description": "Resumo da conversa"}
+    },
+    handler=transferir_para_humano, efeito_colateral=True,
+))
+tools = registro_tools.schemas()
+TOOLS_CONHECIDAS = registro_tools.nomes()
+
+# Partes constantes do corpo do Mistral serializadas uma única vez (ver contexto_mistral.py)
+MISTRAL_ORCAMENTO_TOKENS = int(os.getenv("MISTRAL_ORCAMENTO_TOKENS", 3000))
+payload_mistral = PayloadMistral(
+    MISTRAL_AGENT_ID,
+    PROMPT,
+    tools,
+    {
+        "response_format": {"type": "text"},
+        "max_tokens": 500,
+        "presence_penalty": 0.5,
+        "frequency_penalty": 0.5,
+        "parallel_tool_calls": True
+    },
+)
 
 # --- SISTEMA DE FILAS COM REDIS ---
 # Webhook apenas enfileira mensagem, processamento é feito por worker
+# Fila confiável (processamento, prazo de visibilidade, reaper, backoff e lista de mortas): ver fila_confiavel.py
+FILA_MENSAGENS = FilaConfiavel.MENSAGENS
+FILA_PROCESSANDO = FilaConfiavel.PROCESSANDO
+FILA_MORTAS = FilaConfiavel.MORTAS
+
+FILA_WORKERS = int(os.getenv("FILA_WORKERS", 4))
+FILA_VISIBILITY_TIMEOUT = int(os.getenv("FILA_VISIBILITY_TIMEOUT", 120))  # segundos
+FILA_MAX_TENTATIVAS = int(os.getenv("FILA_MAX_TENTATIVAS", 3))
+FILA_REAPER_INTERVALO = int(os.getenv("FILA_REAPER_INTERVALO", 15))  # segundos
+FILA_BACKOFF_BASE = float(os.getenv("FILA_BACKOFF_BASE", 5))  # segundos; dobra a cada tentativa
+FILA_BACKOFF_MAX = float(os.getenv("FILA_BACKOFF_MAX", 60))
+
+fila = FilaConfiavel(
+    redis_client,
+    visibilidade=FILA_VISIBILITY_TIMEOUT,
+    max_tentativas=FILA_MAX_TENTATIVAS,
+    backoff_base=FILA_BACKOFF_BASE,
+    backoff_max=FILA_BACKOFF_MAX,
+)
+
+_parar_workers = Event()
+
+# Agrupamento por conversa (ver coalescedor.py): mensagens da mesma conversa que chegam dentro da
+# janela viram um único turno, e só um turno por conversa fica na fila/em processamento por vez.
+COALESCER_ATIVO = os.getenv("COALESCER_ATIVO", "1") == "1"
+COALESCER_INTERVALO = float(os.getenv("COALESCER_INTERVALO_MS", 100)) / 1000
+coalescedor = CoalescedorMensagens(
+    redis_client,
+    janela=float(os.getenv("COALESCER_JANELA_MS", 1500)) / 1000,
+    janela_max=float(os.getenv("COALESCER_JANELA_MAX_MS", 5000)) / 1000,
+    ttl_em_andamento=FILA_VISIBILITY_TIMEOUT * (FILA_MAX_TENTATIVAS + 1),
+)
+
+def remote_jid_do_payload(data):
+    """remoteJid de uma mensagem que gera turno; None para payloads ignorados ou sem remetente."""
+    if not isinstance(data, dict) or deve_ignorar_payload(data):
+        return None
+    return data.get("remoteJid") or data.get("key", {}).get("remoteJid")
 
-def enqueue_message(data):
+def enqueue_message(data, remote_jid=None):
     msg_id = str(uuid.uuid4())
-    redis_client.lpush("fila:mensagens", json.dumps({"id": msg_id, "data": data}))
-    console.log(f"[FILA] Mensagem enfileirada com id {msg_id}")
+    msg = {"id": msg_id, "data": data}
+    if remote_jid:
+        msg["remoteJid"] = remote_jid
+    fila.enfileirar(msg)
+    log_fila.debug("enfileirada", msg_id=msg_id)
     return msg_id
 
+def receber_mensagem(data):
+    """Entrada da fila: agrupa por conversa quando possível, senão enfileira direto."""
+    remote_jid = remote_jid_do_payload(data)
+    if COALESCER_ATIVO and remote_jid:
+        coalescedor.adicionar(remote_jid, data)
+        return None
+    return enqueue_message(data)
+
 @app.route("/webhook_fila", methods=["POST"])
 def webhook_fila():
-    data = request.json
-    enqueue_message(data)
+    data = marcar_recebimento(request.json)
+    if deduplicador.duplicada(data):
+        log_fila.info("duplicada", msg_id=DeduplicadorMensagens.id_mensagem(data))
+        return jsonify({"status": "duplicada"})
+    try:
+        receber_mensagem(data)
+    except Exception as e:
+        # Não enfileirou: libera o id para a reentrega da MegaAPI não virar "duplicada"
+        log_fila.erro("enfileirar_falhou", msg_id=DeduplicadorMensagens.id_mensagem(data), erro=str(e))
+        deduplicador.esquecer(data)
+        return jsonify({"error": "Falha ao enfileirar mensagem"}), 503
     return jsonify({"status": "enfileirado"})
 
+def despachar_coalescidas():
+    """Loop que fecha as janelas vencidas e enfileira um turno por conversa."""
+    while not _parar_workers.wait(COALESCER_INTERVALO):
+        try:
+            for remote_jid, data in coalescedor.liberar_prontas():
+                if data.get("mensagens_agrupadas"):
+                    log_fila.info("mensagens_agrupadas", remote_jid=remote_jid, quantidade=data["mensagens_agrupadas"])
+                enqueue_message(data, remote_jid)
+        except Exception as e:
+            log_fila.erro("despachar_agrupadas_falhou", erro=str(e))
+
+def _concluir_turno(msg):
+    if isinstance(msg, dict) and msg.get("remoteJid"):
+        try:
+            coalescedor.concluir(msg["remoteJid"])
+        except Exception as e:
+            log_fila.erro("liberar_conversa_falhou", remote_jid=msg["remoteJid"], erro=str(e))
+
+def ack_mensagem_fila(raw, msg_id=None, msg=None):
+    fila.ack(raw, msg_id)
+    _concluir_turno(msg)
+
+def mover_para_mortas(raw, msg_id=None, msg=None):
+    fila.mover_para_mortas(raw, msg_id)
+    _concluir_turno(msg)
+
+def falha_mensagem_fila(raw, msg_id, msg, tentativas):
+    if fila.falhar(raw, msg_id, tentativas):
+        _concluir_turno(msg)
+
 # Worker para processar mensagens da fila
 
 def processar_mensagem_fila():
-    while True:
-        item = redis_client.brpop("fila:mensagens", timeout=5)
-        if item:
-            _, raw = item
+    while not _parar_workers.is_set():
+        raw = fila.reservar(timeout=5)
+        if not raw:
+            continue
+        msg_id = None
+        msg = None
+        tentativas = 0
+        try:
+            msg = json.loads(raw)
+            msg_id = msg["id"]
+            tentativas = fila.registrar_entrega(msg_id)
+            if tentativas > FILA_MAX_TENTATIVAS:
+                log_fila.erro("tentativas_excedidas", msg_id=msg_id, max_tentativas=FILA_MAX_TENTATIVAS)
+                mover_para_mortas(raw, msg_id, msg)
+                continue
+            log_fila.debug("processando", msg_id=msg_id, tentativa=tentativas)
+            corpo, status = processar_payload(msg["data"])
+            log_fila.info("processada", msg_id=msg_id, status=status)
+            if status >= 500:
+                falha_mensagem_fila(raw, msg_id, msg, tentativas)
+            else:
+                ack_mensagem_fila(raw, msg_id, msg)
+        except Exception as e:
+            log_fila.erro("processamento_falhou", exc_info=True, msg_id=msg_id, erro=str(e))
             try:
-                msg = json.loads(raw)
-                console.log(f"[FILA] Processando mensagem id {msg['id']}")
-                # Aqui você pode chamar a função webhook() ou refatorar o processamento para ser reutilizável
-                # Exemplo: processar_payload(msg['data'])
+                falha_mensagem_fila(raw, msg_id, msg, tentativas)
             except Exception as e:
-                console.log(f"[FILA][ERRO] Falha ao processar mensagem da fila: {str(e)} | Raw: {raw}")
+                log_fila.erro("reagendar_falhou", msg_id=msg_id, erro=str(e))
 
-# Para rodar o worker em thread separada (exemplo, não inicia automaticamente)
-# Thread(target=processar_mensagem_fila, daemon=True).start()
+def reaper_fila():
+    while not _parar_workers.wait(FILA_REAPER_INTERVALO):
+        try:
+            fila.devolver_travadas()
+        except Exception as e:
+            log_fila.erro("reaper_falhou", erro=str(e))
+
+def iniciar_workers_fila(num_workers=None):
+    """Inicia o pool de workers da fila (threads daemon) e o reaper de mensagens travadas."""
+    num_workers = num_workers or FILA_WORKERS
+    threads = [Thread(target=processar_mensagem_fila, name=f"fila-worker-{i}", daemon=True) for i in range(num_workers)]
+    threads.append(Thread(target=reaper_fila, name="fila-reaper", daemon=True))
+    if COALESCER_ATIVO:
+        threads.append(Thread(target=despachar_coalescidas, name="fila-coalescer", daemon=True))
+    for t in threads:
+        t.start()
+    log_fila.info("workers_iniciados", workers=num_workers)
+    return threads
+
+# --- MÉTRICAS ---
+# Latência por etapa, contadores e profundidade das filas no formato Prometheus (ver metricas.py)
+coletor_filas = metricas.ColetorFilas(redis_client, {
+    "mensagens": (FILA_MENSAGENS, "list"),
+    "processando": (FILA_PROCESSANDO, "list"),
+    "mortas": (FILA_MORTAS, "list"),
+    "coalescer": (CoalescedorMensagens.PRAZOS, "zset"),
+    "whatsapp_agendados": (outbox_whatsapp.agendados, "zset"),
+    "whatsapp_mortas": (OutboxWhatsApp.MORTAS, "list"),
+    "mem0_pendentes": (OutboxMem0.PENDENTES, "set"),
+})
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    corpo, content_type = metricas.exportar(coletor_filas)
+    return corpo, 200, {"Content-Type": content_type}
 
 def limpar_resposta(resposta, nome_cliente=None, intencao=None):
     if not resposta:
@@ -835,6 +1464,19 @@ def limpar_resposta(resposta, nome_cliente=None, intencao=None):
     resposta = re.sub(r"\s{2,}", " ", resposta)
     return resposta.strip()
 
+# Para iniciar os workers junto com o app (ex: gunicorn), defina FILA_INICIAR_NO_APP=1.
+# Para escalar por processos, rode workers dedicados com: python app.py worker
+if os.getenv("FILA_INICIAR_NO_APP") == "1":
+    iniciar_workers_fila()
+
 if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port)
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        # Processo dedicado de workers, sem servidor HTTP
+        for t in iniciar_workers_fila():
+            t.join()
+    elif len(sys.argv) > 1 and sys.argv[1] == "aquecer":
+        # Aquecimento em lote avulso (ex: cron antes do pico de atendimento)
+        aquecedor_ixc.aquecer_lote()
+    else:
+        port = int(os.environ.get("PORT", 5000))
+        app.run(host="0.0.0.0", port=port)
\ No newline at end of file
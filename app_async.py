@@ -0,0 +1,518 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from asgiref.wsgi import WsgiToAsgi
+
+import cliente_http
+import metricas
+import prazo
+from prazo import OrcamentoEsgotado
+from disjuntor import CircuitoAberto
+from metricas import medir, cronometrar, novo_trace_id
+import app as base
+from app import (
+    app, tools, payload_mistral, classificador_local, cache_l1, cache_ixc, historico_conversa,
+    outbox_mem0, respostas_template, redis_client, redis_async_client, mem0_client,
+    DEPSEEK_URL, DEPSEEK_API_KEY, MISTRAL_URL, MISTRAL_API_KEY, MEGAAPI_URL, MEGAAPI_KEY, INSTANCE_KEY,
+    IXC_API_URL, REDIS_TTL_IXC, CUMPRIMENTO_TTL, ESTADO_LER_LEGADO, INTENCAO_CACHE_TTL,
+    PREFETCH_TIMEOUTS, TOOL_TIMEOUT, HISTORICO_CONTEXTO_MAX, MEM0_WRITE_BEHIND, TEMPLATES_ATIVOS,
+    MAX_TOOL_CALLS, MENSAGENS_TRANSICAO, FILA_MENSAGENS, FILA_VISIBILITY_TIMEOUT, COALESCER_ATIVO, coalescedor,
+    log_webhook, log_fila, log_ixc, log_mistral, log_classificador, log_mem0, log_whatsapp, log_historico,
+    log_prefetch, log_tools,
+    remote_jid_do_payload, deduplicador, DeduplicadorMensagens, WHATSAPP_OUTBOX, outbox_whatsapp,
+    EstadoConversa, normalizar_texto, normalizar_intencao, hash_texto, contem_dado_sensivel,
+    salvar_cpf_contexto, garantir_cpf_contexto, executar_tool, preparar_tool_call, TurnoTools,
+    aplicar_cumprimento, limpar_resposta,
+    extrair_remetente, deve_ignorar_payload, montar_contexto_cliente, selecionar_historico,
+    montar_messages_mistral, resposta_sem_llm, anexar_resultados_tools,
+    MEM0_ESCRITA_ORCAMENTO, resposta_degradada, transferir_degradado, marcar_recebimento, registrar_espera_fila,
+    disjuntor_ixc, disjuntor_mistral, disjuntor_deepseek, aquecedor_ixc, cache_respostas, RESPOSTA_CACHE_ATIVO,
+    cpf_informado,
+)
+
+# Variante asyncio/ASGI do webhook: mesmo fluxo de processar_payload (app.py), mas com I/O não
+# bloqueante (httpx.AsyncClient por upstream e redis.asyncio), então um único processo atende
+# centenas de conversas simultâneas esperando o Mistral/IXC sem uma thread por requisição.
+# As rotas /webhook e /webhook_fila são atendidas nativamente; o resto cai no app Flask via WsgiToAsgi.
+# Rodar com: uvicorn app_async:asgi_app --host 0.0.0.0 --port 5000
+# As tools do Mistral e o cold start do Mem0AI continuam síncronos e rodam em threads (asyncio.to_thread).
+
+# --- UPSTREAMS ---
+
+@cronometrar("deepseek")
+async def _post_deepseek_async(payload, headers):
+    return await cliente_http.post_async("deepseek", DEPSEEK_URL, headers=headers, json=payload)
+
+async def classificar_intencao_deepseek_async(mensagem_usuario):
+    prompt = (
+        "Classifique a intenção da mensagem do usuário e extraia entidades relevantes.\n"
+        "Responda em JSON no formato: {\"intencao\": <string>, \"entidades\": <dict>}\n"
+        "Exemplos de intenções: consulta_boleto, suporte_internet, consulta_status_plano, consulta_cadastro, consulta_valor_plano, elogio, reclamacao, saudacao, despedida, outros.\n"
+        f"Mensagem: {mensagem_usuario}"
+    )
+    payload = {
+        "model": "deepseek-chat",
+        "messages": [
+            {"role": "system", "content": "Você é um classificador de intenções para atendimento ao cliente."},
+            {"role": "user", "content": prompt}
+        ],
+        "response_format": {"type": "json_object"},
+        "max_tokens": 200
+    }
+    headers = {
+        "Authorization": f"Bearer {DEPSEEK_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    try:
+        response = await disjuntor_deepseek.executar_async(redis_async_client, _post_deepseek_async, payload, headers)
+        response.raise_for_status()
+        result = response.json()
+        if "choices" in result and result["choices"]:
+            classificacao = json.loads(result["choices"][0]["message"]["content"])
+            classificacao["fonte"] = "deepseek"
+            return classificacao
+    except CircuitoAberto:
+        return {"intencao": "outros", "entidades": {}, "fonte": "disjuntor"}
+    except Exception as e:
+        log_classificador.erro("deepseek_falhou", erro=str(e))
+    return {"intencao": "outros", "entidades": {}, "fonte": "padrao"}
+
+@cronometrar("classificacao")
+async def classificar_intencao_async(mensagem_usuario):
+    local = classificador_local.classificar(mensagem_usuario)
+    if classificador_local.confiavel(local):
+        return local
+    chave = f"intencao:{hash_texto(normalizar_texto(mensagem_usuario))}"
+    cache = cache_l1.get(chave, None)
+    if cache is None:
+        versao = cache_l1.versao(chave)
+        val = await redis_async_client.get(chave)
+        cache = json.loads(val) if val else None
+        cache_l1.set(chave, cache, versao=versao)
+    if cache:
+        return dict(cache, fonte="cache")
+    log_classificador.info("fallback_deepseek", intencao_local=local["intencao"], confianca=local["confianca"])
+    classificacao = await classificar_intencao_deepseek_async(mensagem_usuario)
+    classificacao["intencao"] = normalizar_intencao(classificacao.get("intencao"))
+    if classificacao.get("fonte") == "deepseek":
+        await redis_async_client.setex(chave, INTENCAO_CACHE_TTL, json.dumps(classificacao, ensure_ascii=False))
+        await cache_l1.invalidar_async(chave, redis_async_client)
+    return classificacao
+
+async def consultar_ixc_upstream_async(cpf):
+    return await disjuntor_ixc.executar_async(redis_async_client, _consultar_ixc_upstream_async, cpf)
+
+@cronometrar("ixc_upstream")
+async def _consultar_ixc_upstream_async(cpf):
+    import httpx
+    try:
+        response = await cliente_http.post_async("ixc", IXC_API_URL, json={"cpf": cpf})
+        response.raise_for_status()
+        data = response.json()
+        log_ixc.info("consulta_ixc", cpf=cpf, campos=len(data) if isinstance(data, dict) else None)
+        return data
+    except OrcamentoEsgotado:
+        raise  # falta de tempo do turno não é erro do IXC: não entra no cache negativo
+    except httpx.TimeoutException:
+        return {"erro": "Timeout ao consultar IXC"}
+    except Exception as e:
+        return {"erro": str(e)}
+
+cache_ixc.buscar_upstream_async = consultar_ixc_upstream_async
+
+@cronometrar("mistral")
+async def _post_mistral_async(corpo, headers):
+    return await cliente_http.post_async("mistral", MISTRAL_URL, headers=headers, content=corpo)
+
+async def call_mistral_async(messages, tools=None, memo=None):
+    corpo = payload_mistral.serializar(messages, tools, memo)
+    headers = {
+        "Authorization": f"Bearer {MISTRAL_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    response = await disjuntor_mistral.executar_async(redis_async_client, _post_mistral_async, corpo.encode("utf-8"), headers)
+    return response.json()
+
+@cronometrar("whatsapp_envio")
+async def send_whatsapp_message_async(phone, message, max_retries=3, timeout=None):
+    if phone.endswith("@s.whatsapp.net"):
+        phone = phone.replace("@s.whatsapp.net", "")
+    payload = {
+        "messageData": {
+            "to": phone,
+            "text": message,
+            "linkPreview": False
+        }
+    }
+    url = f"{MEGAAPI_URL}/rest/sendMessage/{INSTANCE_KEY}/text"
+    headers = {
+        "Authorization": f"Bearer {MEGAAPI_KEY}",
+        "Content-Type": "application/json"
+    }
+    for attempt in range(1, max_retries + 1):
+        try:
+            response = await cliente_http.post_async("megaapi", url, headers=headers, json=payload, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            log_whatsapp.erro("envio_falhou", tentativa=attempt, erro=str(e))
+            if attempt == max_retries or prazo.esgotado(2 + prazo.TIMEOUT_MINIMO):
+                raise
+            await asyncio.sleep(2)
+
+async def enviar_whatsapp_async(phone, message):
+    with prazo.reserva_envio():
+        if WHATSAPP_OUTBOX:
+            envio_id = await outbox_whatsapp.enfileirar_async(redis_async_client, phone, message)
+            log_whatsapp.debug("envio_registrado", envio_id=envio_id)
+            return envio_id
+        return await send_whatsapp_message_async(phone, message)
+
+# --- HISTÓRICO E MEM0AI ---
+
+async def sincronizar_historico_async(remoteJid, cpf):
+    user_id = f"{remoteJid}:{cpf}"
+    if await historico_conversa.sincronizado_async(user_id):
+        return True
+    # Cold start: o SDK do Mem0AI é síncrono, roda em thread
+    historico = await asyncio.to_thread(base.buscar_historico_mem0, remoteJid, cpf)
+    importadas = await historico_conversa.importar_mem0_async(user_id, historico, lambda texto: classificador_local.classificar(texto)["intencao"])
+    log_historico.info("mem0_importado", user_id=user_id, memorias=importadas)
+    return True
+
+async def registrar_turno_async(remoteJid, cpf, intencao, user_message, resposta=None):
+    entradas = [historico_conversa.entrada("user", user_message, intencao)]
+    if resposta:
+        entradas.append(historico_conversa.entrada("assistant", resposta, intencao))
+    try:
+        await historico_conversa.adicionar_async(f"{remoteJid}:{cpf}", entradas)
+    except Exception as e:
+        log_historico.erro("gravar_turno_falhou", erro=str(e))
+
+async def salvar_historico_mem0_async(remoteJid, cpf, mensagem):
+    if mensagem.get("role") not in ("user", "assistant") or contem_dado_sensivel(mensagem.get("content", "")):
+        return
+    user_id = f"{remoteJid}:{cpf}"
+    if MEM0_WRITE_BEHIND or prazo.esgotado(MEM0_ESCRITA_ORCAMENTO):
+        await outbox_mem0.enfileirar_async(redis_async_client, user_id, mensagem)
+        return
+    log_mem0.debug("salvando", user_id=user_id, role=mensagem.get("role"))
+    with medir("mem0_escrita"):
+        await asyncio.to_thread(mem0_client.add, [mensagem], user_id=user_id, agent_id="geovana")
+
+# --- PREFETCH E TOOLS ---
+
+@cronometrar("ixc")
+async def carregar_dados_ixc_async(cpf):
+    try:
+        await aquecedor_ixc.marcar_ativo_async(redis_async_client, cpf)
+    except Exception as e:
+        log_ixc.erro("marcar_ativo_falhou", cpf=cpf, erro=str(e))
+    return await cache_ixc.obter_async(cpf)
+
+async def prefetch_contexto_async(remoteJid, cpf, phone, user_message):
+    """Mesmo contrato de prefetch_contexto: (dados_ixc, historico, classificacao), com timeout por etapa."""
+    inicio = time.time()
+    etapas = {
+        "ixc": carregar_dados_ixc_async(cpf),
+        "historico": sincronizar_historico_async(remoteJid, phone),
+        "intencao": classificar_intencao_async(user_message),
+    }
+    padroes = {"ixc": None, "historico": None, "intencao": {"intencao": "outros", "entidades": {}}}
+
+    async def _etapa(nome, corrotina):
+        try:
+            return await asyncio.wait_for(corrotina, max(0, prazo.limitar(PREFETCH_TIMEOUTS[nome])))
+        except asyncio.TimeoutError:
+            log_prefetch.erro("timeout", etapa=nome, timeout_s=PREFETCH_TIMEOUTS[nome])
+            metricas.contar_erro(f"prefetch_{nome}")
+        except Exception as e:
+            log_prefetch.erro("etapa_falhou", etapa=nome, erro=str(e))
+            metricas.contar_erro(f"prefetch_{nome}")
+        return padroes[nome]
+
+    dados_ixc, historico, classificacao = await asyncio.gather(*(_etapa(n, c) for n, c in etapas.items()))
+    log_prefetch.info("contexto_carregado", duracao_ms=round((time.time() - inicio) * 1000))
+    return dados_ixc, historico, classificacao
+
+async def executar_tool_calls_async(tool_calls, cpf_contexto, turno=None):
+    """Mesmo contrato de executar_tool_calls; as tools (síncronas) rodam em threads, em paralelo."""
+    turno = turno or TurnoTools(cpf_contexto)
+
+    async def _executar(tool_call):
+        tool_name, tool_args, erro = preparar_tool_call(tool_call, cpf_contexto)
+        if erro:
+            return erro
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(executar_tool, tool_name, tool_args, turno), max(0, prazo.limitar(TOOL_TIMEOUT)))
+        except asyncio.TimeoutError:
+            log_tools.erro("timeout", tool=tool_name, timeout_s=TOOL_TIMEOUT)
+            metricas.contar_erro("tool_timeout")
+            return {"erro": f"Timeout ao executar {tool_name}"}
+        except Exception as e:
+            log_tools.erro("tool_falhou", tool=tool_name, erro=str(e))
+            return {"erro": str(e)}
+
+    return list(await asyncio.gather(*(_executar(tc) for tc in tool_calls)))
+
+# --- FLUXO DO WEBHOOK ---
+
+async def responder_degradado_async(remote_jid, phone, cpf, intencao, user_message, dados_ixc, nome_cliente):
+    """Mesma resposta degradada de app.responder_degradado (orçamento do turno esgotado)."""
+    resposta = resposta_degradada(intencao, dados_ixc, nome_cliente)
+    metricas.RESPOSTAS_TOTAL.labels("degradada").inc()
+    await enviar_whatsapp_async(phone, resposta)
+    await registrar_turno_async(remote_jid, phone, intencao, user_message, resposta)
+    transferir_degradado(cpf, intencao, user_message)
+    return {"status": "degradada", "intencao": intencao, "mensagem": resposta}, 200
+
+@cronometrar("turno")
+async def processar_payload_async(data):
+    """Equivalente assíncrono de processar_payload (app.py). Retorna (corpo, status_http)."""
+    intencao = None
+    entidades = {}
+    estado = None
+    remote_jid = phone = user_message = cpf_contexto = None
+    dados_ixc = nome_cliente = None
+    token_prazo = None
+    try:
+        novo_trace_id((data.get("key") or {}).get("id"))
+        # Prazo do turno contado a partir de agora; a espera desde o recebimento do webhook (fila,
+        # coalescedor, reentregas) é medida à parte e não consome o orçamento
+        token_prazo = prazo.iniciar()
+        registrar_espera_fila(data)
+        log_webhook.debug("payload_recebido")
+
+        if deve_ignorar_payload(data):
+            log_webhook.debug("payload_ignorado")
+            return {"status": "ignored"}, 200
+
+        remote_jid, phone, user_message = extrair_remetente(data)
+
+        if not phone or not user_message or len(phone) < 10:
+            log_webhook.aviso("payload_invalido", campos=sorted(data.keys()))
+            return {"error": "Payload inesperado ou número inválido", "payload": data}, 400
+
+        estado = await EstadoConversa.carregar_async(
+            redis_client,
+            redis_async_client,
+            remote_jid,
+            cache_local=cache_l1,
+            ttls_legado={"cpf": REDIS_TTL_IXC, "cumprimentou": CUMPRIMENTO_TTL},
+            ler_legado=ESTADO_LER_LEGADO,
+        )
+
+        cpf_mensagem = cpf_informado(user_message)
+        if cpf_mensagem:
+            salvar_cpf_contexto(remote_jid, cpf_mensagem, estado)
+            log_webhook.info("cpf_salvo", remote_jid=remote_jid)
+
+        cpf_contexto = garantir_cpf_contexto(remote_jid, cpf_mensagem, estado)
+
+        if not cpf_contexto:
+            resposta = "Por favor, informe seu CPF (apenas números) para que eu possa te ajudar."
+            await enviar_whatsapp_async(phone, resposta)
+            return {"status": "aguardando_cpf"}, 200
+
+        prazo.verificar("prefetch")
+        dados_ixc, historico, classificacao = await prefetch_contexto_async(remote_jid, cpf_contexto, phone, user_message)
+        intencao = classificacao.get("intencao", "outros")
+        entidades = classificacao.get("entidades", {})
+        log_classificador.info("intencao", intencao=intencao, fonte=classificacao.get("fonte"), confianca=classificacao.get("confianca"), entidades=len(entidades))
+        metricas.INTENCOES_TOTAL.labels(intencao, classificacao.get("fonte") or "desconhecida").inc()
+
+        nome_cliente, fatos_cliente = montar_contexto_cliente(dados_ixc)
+        with medir("redis_historico"):
+            entradas = await historico_conversa.ultimos_async(f"{remote_jid}:{phone}", intencao, HISTORICO_CONTEXTO_MAX)
+        last_msgs, memorias = selecionar_historico(entradas)
+
+        await salvar_historico_mem0_async(remote_jid, phone, {"role": "user", "content": user_message})
+
+        messages = montar_messages_mistral(fatos_cliente, last_msgs, memorias, user_message, intencao, entidades)
+
+        status_resposta, resposta = resposta_sem_llm(intencao, dados_ixc, nome_cliente)
+        if resposta:
+            metricas.RESPOSTAS_TOTAL.labels("regra_negocio" if status_resposta == "regra_negocio" else "fixa").inc()
+            await enviar_whatsapp_async(phone, resposta)
+            await registrar_turno_async(remote_jid, phone, intencao, user_message, resposta)
+            if status_resposta == "regra_negocio":
+                return {"status": "regra_negocio", "mensagem": resposta}, 200
+            return {"status": "ok", "intencao": intencao}, 200
+
+        resposta_template = respostas_template.responder(intencao, dados_ixc) if TEMPLATES_ATIVOS else None
+        if resposta_template:
+            metricas.RESPOSTAS_TOTAL.labels("template").inc()
+            resposta_template = aplicar_cumprimento(resposta_template, nome_cliente, remote_jid, estado)
+            resposta_template = limpar_resposta(resposta_template, nome_cliente, intencao)
+            await enviar_whatsapp_async(phone, resposta_template)
+            await registrar_turno_async(remote_jid, phone, intencao, user_message, resposta_template)
+            return {"status": "template", "intencao": intencao, "mensagem": resposta_template}, 200
+
+        resposta_cache = await cache_respostas.buscar_async(intencao, user_message, dados_ixc, cpf_contexto, nome_cliente) if RESPOSTA_CACHE_ATIVO else None
+        if resposta_cache:
+            metricas.RESPOSTAS_TOTAL.labels("cache").inc()
+            resposta_cache = aplicar_cumprimento(resposta_cache, nome_cliente, remote_jid, estado)
+            resposta_cache = limpar_resposta(resposta_cache, nome_cliente, intencao)
+            await enviar_whatsapp_async(phone, resposta_cache)
+            await registrar_turno_async(remote_jid, phone, intencao, user_message, resposta_cache)
+            return {"status": "cache", "intencao": intencao, "mensagem": resposta_cache}, 200
+
+        tool_call_count = 0
+        transicoes = 0
+        resposta_final = None
+        result = None
+        mistral_messages = messages.copy()
+        memo_serializacao = {}
+        turno_tools = TurnoTools(cpf_contexto, dados_ixc)
+        while True:
+            prazo.verificar("mistral")
+            try:
+                result = await call_mistral_async(mistral_messages, tools, memo_serializacao)
+            except CircuitoAberto:
+                log_mistral.aviso("disjuntor_aberto")
+                return await responder_degradado_async(remote_jid, phone, cpf_contexto, intencao, user_message, dados_ixc, nome_cliente)
+            if not result or "choices" not in result or not result["choices"]:
+                break
+            msg = result["choices"][0]["message"]
+            if msg.get("tool_calls"):
+                resultados_tools = await executar_tool_calls_async(msg["tool_calls"], cpf_contexto, turno_tools)
+                anexar_resultados_tools(mistral_messages, msg["tool_calls"], resultados_tools)
+                tool_call_count += 1
+                if tool_call_count >= MAX_TOOL_CALLS:
+                    log_mistral.erro("excesso_tool_calls", max_tool_calls=MAX_TOOL_CALLS)
+                    break
+                continue
+            resposta_final = msg.get("content", "")
+            if resposta_final.strip().lower() in MENSAGENS_TRANSICAO:
+                log_mistral.debug("mensagem_transicao_ignorada")
+                transicoes += 1
+                if transicoes >= MAX_TOOL_CALLS:
+                    log_mistral.erro("excesso_mensagens_transicao", max_transicoes=MAX_TOOL_CALLS)
+                    return await responder_degradado_async(remote_jid, phone, cpf_contexto, intencao, user_message, dados_ixc, nome_cliente)
+                continue
+            break
+        metricas.RESPOSTAS_TOTAL.labels("mistral").inc()
+        resposta_mistral = resposta_final
+        resposta_final = aplicar_cumprimento(resposta_final, nome_cliente, remote_jid, estado)
+        resposta_final = limpar_resposta(resposta_final, nome_cliente, intencao)
+        if resposta_final:
+            await enviar_whatsapp_async(phone, resposta_final)
+        await registrar_turno_async(remote_jid, phone, intencao, user_message, resposta_final)
+        if RESPOSTA_CACHE_ATIVO and resposta_mistral and not turno_tools.efeito_colateral:
+            await cache_respostas.gravar_async(intencao, user_message, dados_ixc, cpf_contexto, nome_cliente, resposta_mistral,
+                                               com_historico=bool(last_msgs))
+        return result, 200
+    except OrcamentoEsgotado as e:
+        log_webhook.aviso("orcamento_esgotado", motivo=str(e), intencao=intencao)
+        metricas.contar_erro("orcamento_turno")
+        if not phone or not cpf_contexto:
+            return {"error": str(e)}, 504
+        return await responder_degradado_async(remote_jid, phone, cpf_contexto, intencao, user_message, dados_ixc, nome_cliente)
+    except Exception as e:
+        log_webhook.erro("turno_falhou", exc_info=True, erro=str(e), intencao=intencao)
+        metricas.contar_erro("turno")
+        return {"error": str(e)}, 500
+    finally:
+        if estado is not None:
+            try:
+                with medir("redis_estado_salvar"):
+                    await estado.salvar_async()
+            except Exception as e:
+                log_webhook.erro("gravar_estado_falhou", erro=str(e))
+        if token_prazo is not None:
+            prazo.encerrar(token_prazo)
+
+async def enqueue_message_async(data):
+    remote_jid = remote_jid_do_payload(data)
+    if COALESCER_ATIVO and remote_jid:
+        # Mesmo agrupamento por conversa da fila síncrona; o despachante roda com os workers
+        await coalescedor.adicionar_async(redis_async_client, remote_jid, data)
+        return None
+    msg_id = str(uuid.uuid4())
+    await redis_async_client.lpush(FILA_MENSAGENS, json.dumps({"id": msg_id, "data": data}))
+    log_fila.debug("enfileirada", msg_id=msg_id)
+    return msg_id
+
+async def processar_em_ordem_async(data):
+    """Como a rota /webhook síncrona: turnos da mesma conversa em série, via lock no Redis."""
+    remote_jid = remote_jid_do_payload(data)
+    if not remote_jid:
+        return await processar_payload_async(data)
+    lock = redis_async_client.lock(f"coalescer:{remote_jid}:turno", timeout=FILA_VISIBILITY_TIMEOUT, blocking_timeout=prazo.TURNO_ORCAMENTO)
+    if not await lock.acquire():
+        log_webhook.aviso("timeout_lock_turno", remote_jid=remote_jid)
+        return {"error": "Conversa ocupada, tente novamente"}, 503
+    try:
+        return await processar_payload_async(data)
+    finally:
+        try:
+            await lock.release()
+        except Exception:
+            pass
+
+# --- APP ASGI ---
+
+flask_asgi = WsgiToAsgi(app)
+
+async def _ler_corpo(receive):
+    corpo = b""
+    while True:
+        mensagem = await receive()
+        corpo += mensagem.get("body", b"")
+        if not mensagem.get("more_body"):
+            return corpo
+
+async def _responder_json(send, corpo, status=200):
+    bruto = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(bruto)).encode())],
+    })
+    await send({"type": "http.response.body", "body": bruto})
+
+async def _lifespan(receive, send):
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif mensagem["type"] == "lifespan.shutdown":
+            await cliente_http.fechar_clientes_async()
+            await redis_async_client.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+ROTAS_ASYNC = {"/webhook", "/webhook_fila"}
+
+async def asgi_app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in ROTAS_ASYNC:
+        try:
+            data = json.loads(await _ler_corpo(receive) or b"null")
+        except ValueError:
+            return await _responder_json(send, {"error": "JSON inválido"}, 400)
+        marcar_recebimento(data)
+        if await deduplicador.duplicada_async(redis_async_client, data):
+            log_webhook.info("duplicada", msg_id=DeduplicadorMensagens.id_mensagem(data))
+            return await _responder_json(send, {"status": "duplicada"})
+        if scope["path"] == "/webhook_fila":
+            try:
+                await enqueue_message_async(data)
+            except Exception as e:
+                log_fila.erro("enfileirar_falhou", msg_id=DeduplicadorMensagens.id_mensagem(data), erro=str(e))
+                await deduplicador.esquecer_async(redis_async_client, data)
+                return await _responder_json(send, {"error": "Falha ao enfileirar mensagem"}, 503)
+            return await _responder_json(send, {"status": "enfileirado"})
+        corpo, status = await processar_em_ordem_async(data or {})
+        if status >= 500:
+            await deduplicador.esquecer_async(redis_async_client, data)
+        return await _responder_json(send, corpo, status)
+    # Demais rotas (e qualquer rota nova do Flask) seguem pelo app WSGI
+    return await flask_asgi(scope, receive, send)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(asgi_app, host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
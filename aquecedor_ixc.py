@@ -0,0 +1,177 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from cache_ixc import is_erro
+from logs import obter_logger
+from respostas_template import boletos_em_aberto
+
+# Aquecimento proativo do cache do IXC (ver cache_ixc.py), para a primeira resposta de uma conversa
+# sair de um cache hit em vez de esperar a consulta ao n8n/IXC.
+# - Conversas ativas: cada turno com CPF marca o CPF em ixc:ativos (ZSET cpf -> último contato).
+#   A cada `intervalo`, o aquecedor atualiza os CPFs com contato nos últimos `janela_ativa` segundos
+#   cujo snapshot falta ou vai ficar velho (soft TTL) nos próximos `antecedencia` segundos.
+# - Aquecimento em lote: clientes com boleto em aberto vencendo (ou vencido) há até `dias_vencimento`
+#   dias ou contrato não ativo, pelos últimos snapshots bons (só as seções usadas), mais os CPFs que
+#   sistemas externos (ex: um fluxo do n8n com a lista do IXC) colocam no SET ixc:aquecer. Roda a cada
+#   `intervalo_lote` segundos (0 desliga; para agendar por cron: python app.py aquecer).
+# As consultas usam no máximo `concorrencia` chamadas simultâneas ao IXC, passam pelo disjuntor do IXC
+# e pelo lock por CPF do CacheIXC (um CPF sendo consultado por um turno não é consultado de novo).
+# Com vários processos, só quem detém o lock ixc:aquecedor:lider roda o ciclo.
+
+log = obter_logger("ixc")
+
+STATUS_ATIVO = ("ativo", "a")
+CAMPOS_CONTATO = ("contrato", "status_plano", "boletos")  # seções lidas por provavel_contato
+
+def _data(valor):
+    for formato in ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(str(valor), formato).date()
+        except ValueError:
+            continue
+    return None
+
+def provavel_contato(dados, dias_vencimento=3, hoje=None):
+    """True para snapshots de clientes que costumam procurar o atendimento: boleto vencendo ou contrato não ativo."""
+    if not isinstance(dados, dict) or is_erro(dados):
+        return False
+    hoje = hoje or date.today()
+    contrato = dados.get("contrato") or {}
+    status = (dados.get("status_plano") or {}).get("status_contrato") or contrato.get("status")
+    if status and str(status).lower() not in STATUS_ATIVO:
+        return True
+    # Mesma leitura de boletos dos templates (lista ou {"registros": [...]}, status quitado/cancelado)
+    for boleto in boletos_em_aberto(dados):
+        vencimento = _data(boleto.get("data_vencimento"))
+        if vencimento and abs((vencimento - hoje).days) <= dias_vencimento:
+            return True
+    return False
+
+class AquecedorIXC:
+    ATIVOS = "ixc:ativos"
+    LISTA = "ixc:aquecer"
+    LIDER = "ixc:aquecedor:lider"
+    LOTE = "ixc:aquecedor:lote"
+
+    def __init__(self, redis_client, cache_ixc, janela_ativa=1800, antecedencia=120, intervalo=60,
+                 intervalo_lote=0, concorrencia=4, dias_vencimento=3, lote=500):
+        self.redis = redis_client
+        self.cache = cache_ixc
+        self.janela_ativa = janela_ativa
+        self.antecedencia = antecedencia
+        self.intervalo = intervalo
+        self.intervalo_lote = intervalo_lote
+        self.concorrencia = concorrencia
+        self.dias_vencimento = dias_vencimento
+        self.lote = lote
+        self._parar = threading.Event()
+        self._thread = None
+
+    def marcar_ativo(self, cpf):
+        self.redis.zadd(self.ATIVOS, {cpf: time.time()})
+
+    async def marcar_ativo_async(self, redis_async, cpf):
+        await redis_async.zadd(self.ATIVOS, {cpf: time.time()})
+
+    def _envelopes(self, cpfs):
+        # Só ts/erro: no formato compacto nenhuma seção do snapshot é lida nem decodificada
+        return dict(zip(cpfs, self.cache.ler_varios(cpfs, campos=())))
+
+    def _precisa_atualizar(self, envelope, agora):
+        if envelope is None:
+            return True
+        if envelope.get("erro"):
+            return False  # cache negativo: o IXC acabou de falhar para esse CPF
+        return agora - envelope["ts"] >= self.cache.soft_ttl - self.antecedencia
+
+    def _filtrar(self, cpfs):
+        agora = time.time()
+        pendentes = []
+        for i in range(0, len(cpfs), self.lote):
+            parte = cpfs[i:i + self.lote]
+            pendentes.extend(c for c, env in self._envelopes(parte).items() if self._precisa_atualizar(env, agora))
+        return pendentes
+
+    def aquecer(self, cpfs):
+        """Atualiza os CPFs com até `concorrencia` consultas simultâneas ao IXC. Retorna quantos foram atualizados."""
+        if not cpfs:
+            return 0
+        with ThreadPoolExecutor(max_workers=self.concorrencia, thread_name_prefix="ixc-aquecedor") as executor:
+            return sum(1 for ok in executor.map(self._atualizar, cpfs) if ok)
+
+    def _atualizar(self, cpf):
+        try:
+            return self.cache.atualizar(cpf)
+        except Exception as e:
+            log.erro("aquecimento_falhou", cpf=cpf, erro=str(e))
+            return False
+
+    def ativos(self):
+        limite = time.time() - self.janela_ativa
+        self.redis.zremrangebyscore(self.ATIVOS, "-inf", limite)
+        return self.redis.zrangebyscore(self.ATIVOS, limite, "+inf")
+
+    def atualizar_ativos(self):
+        pendentes = self._filtrar(self.ativos())
+        atualizados = self.aquecer(pendentes)
+        if pendentes:
+            log.info("ativos_aquecidos", pendentes=len(pendentes), atualizados=atualizados)
+        return atualizados
+
+    def candidatos(self):
+        """CPFs para o aquecimento em lote: lista externa (ixc:aquecer) e snapshots de prováveis contatos."""
+        lista = self.redis.smembers(self.LISTA)
+        if lista:
+            self.redis.srem(self.LISTA, *lista)
+        cpfs = set(lista)
+        hoje = date.today()
+        cpfs_lote = []
+        for chave in self.redis.scan_iter(match=self.cache.formato.padrao_ultimo_bom, count=self.lote):
+            cpfs_lote.append(chave.split(":")[1])
+            if len(cpfs_lote) >= self.lote:
+                cpfs.update(self._provaveis(cpfs_lote, hoje))
+                cpfs_lote = []
+        cpfs.update(self._provaveis(cpfs_lote, hoje))
+        return sorted(cpfs)
+
+    def _provaveis(self, cpfs, hoje):
+        envelopes = self.cache.ler_varios(cpfs, campos=CAMPOS_CONTATO, ultimo_bom=True)
+        return [
+            cpf for cpf, envelope in zip(cpfs, envelopes)
+            if envelope and provavel_contato(envelope["dados"], self.dias_vencimento, hoje)
+        ]
+
+    def aquecer_lote(self):
+        inicio = time.time()
+        candidatos = self.candidatos()
+        pendentes = self._filtrar(candidatos)
+        atualizados = self.aquecer(pendentes)
+        log.info("lote_aquecido", candidatos=len(candidatos), pendentes=len(pendentes), atualizados=atualizados,
+                 duracao_ms=round((time.time() - inicio) * 1000))
+        return atualizados
+
+    def ciclo(self):
+        # Lock de líder com TTL do ciclo: um processo por vez; se ele cair, outro assume no próximo ciclo
+        if not self.redis.set(self.LIDER, "1", nx=True, ex=max(1, int(self.intervalo))):
+            return
+        self.atualizar_ativos()
+        # Marca no Redis para o lote rodar uma vez por intervalo_lote no conjunto dos processos
+        if self.intervalo_lote and self.redis.set(self.LOTE, "1", nx=True, ex=int(self.intervalo_lote)):
+            self.aquecer_lote()
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.ciclo()
+            except Exception as e:
+                log.erro("aquecedor_falhou", erro=str(e))
+
+    def iniciar(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="ixc-aquecedor", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def parar(self):
+        self._parar.set()
@@ -0,0 +1,275 @@
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Gerador de carga: reproduz webhooks da MegaAPI numa taxa alvo contra /webhook ou /webhook_fila e
+# mede latência, vazão e chamadas aos upstreams por mensagem (lidas dos stubs, ver bench/stubs.py).
+#   python -m bench.carga --url http://127.0.0.1:5000 --stubs http://127.0.0.1:8900 \
+#       --rota webhook_fila --taxa 20 --duracao 60 --saida resultado.json [--comparar anterior.json]
+# - Aquecimento: cada conversa manda o CPF primeiro (fora da medição), como no atendimento real.
+# - Carga em malha aberta: os envios seguem o relógio (taxa alvo), não esperam a resposta anterior.
+#   Cada conversa tem no máximo uma mensagem aguardando resposta, para casar a entrega na MegaAPI
+#   (stub) com o envio; sem conversa livre, o envio é contado como "sem_conversa_livre".
+# - Latência HTTP: tempo de resposta do endpoint. Latência ponta a ponta: do envio do webhook até a
+#   MegaAPI (stub) receber a resposta para o telefone; é a que importa para /webhook_fila e com o
+#   outbox do WhatsApp ligado.
+
+FRASES = {
+    "consulta_boleto": ["quero meu boleto", "me manda a segunda via do boleto", "qual o valor da minha fatura?", "boleto desse mês"],
+    "suporte_internet": ["estou sem internet", "a internet caiu desde ontem", "minha conexão tá muito lenta", "wifi não conecta"],
+    "consulta_status_plano": ["meu plano está ativo?", "qual o status do meu contrato?"],
+    "consulta_valor_plano": ["quanto custa meu plano?", "qual o valor da mensalidade?"],
+    "consulta_dados_cadastro": ["quais meus dados cadastrais?", "quero confirmar meu endereço"],
+    "saudacao": ["oi", "bom dia", "olá, tudo bem?"],
+    "outros": ["vocês atendem no sábado?", "quero falar com um atendente", "obrigado!"],
+}
+# Peso de cada intenção na carga (proporção aproximada de um dia de atendimento)
+PESOS = {"consulta_boleto": 35, "suporte_internet": 25, "consulta_status_plano": 10, "consulta_valor_plano": 8,
+         "consulta_dados_cadastro": 5, "saudacao": 10, "outros": 7}
+
+class Conversa:
+    def __init__(self, rng):
+        self.phone = "55" + str(rng.randint(11, 99)) + "9" + "".join(str(rng.randint(0, 9)) for _ in range(8))
+        self.cpf = "".join(str(rng.randint(0, 9)) for _ in range(11))
+        self.nome = f"Cliente {self.phone[-4:]}"
+
+def payload_megaapi(conversa, texto):
+    return {
+        "instance_key": "bench",
+        "jid": "5511900000000@s.whatsapp.net",
+        "messageType": "extendedTextMessage",
+        "key": {"remoteJid": f"{conversa.phone}@s.whatsapp.net", "fromMe": False, "id": uuid.uuid4().hex[:20].upper()},
+        "messageTimestamp": int(time.time()),
+        "pushName": conversa.nome,
+        "broadcast": False,
+        "message": {"extendedTextMessage": {"text": texto}},
+    }
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    # Nearest-rank: o menor valor com pelo menos p% das amostras abaixo ou iguais
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+def resumo_latencias(valores):
+    ms = [v * 1000 for v in valores]
+    return {
+        "n": len(ms),
+        "p50_ms": _arredondar(percentil(ms, 50)),
+        "p95_ms": _arredondar(percentil(ms, 95)),
+        "p99_ms": _arredondar(percentil(ms, 99)),
+        "max_ms": _arredondar(max(ms) if ms else None),
+    }
+
+def _arredondar(valor):
+    return None if valor is None else round(valor, 1)
+
+class Rastreador:
+    """Casa as entregas recebidas pelo stub da MegaAPI com os envios pendentes por telefone."""
+
+    def __init__(self, stubs_url, intervalo=0.05):
+        self.stubs_url = stubs_url
+        self.intervalo = intervalo
+        self.seq = 0
+        self.pendentes = {}  # phone -> instante do envio
+        self.latencias = []
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+
+    def registrar(self, phone, instante):
+        with self._lock:
+            self.pendentes[phone] = instante
+
+    def ocupado(self, phone):
+        with self._lock:
+            return phone in self.pendentes
+
+    def aguardando(self):
+        with self._lock:
+            return len(self.pendentes)
+
+    def reiniciar(self):
+        """Descarta pendências e latências (ex: depois do aquecimento e do /_reset dos stubs)."""
+        with self._lock:
+            self.seq = 0
+            self.pendentes.clear()
+            self.latencias.clear()
+
+    def _sondar(self):
+        entregas = requests.get(f"{self.stubs_url}/_entregas", params={"desde": self.seq}, timeout=5).json()
+        with self._lock:
+            for entrega in entregas:
+                self.seq = entrega["seq"] + 1
+                enviado_em = self.pendentes.pop(entrega["phone"], None)
+                if enviado_em is not None:
+                    self.latencias.append(entrega["ts"] - enviado_em)
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                self._sondar()
+            except requests.RequestException:
+                pass
+            self._parar.wait(self.intervalo)
+
+    def iniciar(self):
+        threading.Thread(target=self._loop, name="rastreador", daemon=True).start()
+
+    def parar(self):
+        self._parar.set()
+
+def aquecer(url, conversas, rota, rastreador, timeout):
+    """Manda o CPF de cada conversa e espera as respostas, fora da medição."""
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        for conversa in conversas:
+            rastreador.registrar(conversa.phone, time.time())
+            executor.submit(requests.post, f"{url}/{rota}", json=payload_megaapi(conversa, conversa.cpf), timeout=timeout)
+    limite = time.time() + timeout
+    while rastreador.aguardando() and time.time() < limite:
+        time.sleep(0.1)
+
+def executar(args):
+    rng = random.Random(args.seed)
+    conversas = [Conversa(rng) for _ in range(args.conversas)]
+    intencoes = list(PESOS)
+    pesos = [PESOS[i] for i in intencoes]
+    sessao = requests.Session()
+    sessao.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concorrencia))
+
+    rastreador = Rastreador(args.stubs)
+    rastreador.iniciar()
+    requests.post(f"{args.stubs}/_reset", timeout=5)
+    print(f"Aquecimento: {len(conversas)} conversas enviando CPF...")
+    aquecer(args.url, conversas, args.rota, rastreador, args.timeout_entrega)
+    requests.post(f"{args.stubs}/_reset", timeout=5)
+    rastreador.reiniciar()
+
+    latencias_http = []
+    status = Counter()
+    lock = threading.Lock()
+    livres = deque(conversas)
+
+    def enviar(payload):
+        inicio = time.time()
+        try:
+            resposta = sessao.post(f"{args.url}/{args.rota}", json=payload, timeout=args.timeout_http)
+            codigo = str(resposta.status_code)
+        except requests.RequestException as e:
+            codigo = type(e).__name__
+        with lock:
+            latencias_http.append(time.time() - inicio)
+            status[codigo] += 1
+
+    print(f"Carga: {args.taxa} msg/s por {args.duracao}s em /{args.rota}...")
+    enviadas = reentregas = sem_conversa = 0
+    inicio = time.time()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        while True:
+            alvo = inicio + enviadas / args.taxa if args.taxa > 0 else time.time()
+            if alvo - inicio >= args.duracao:
+                break
+            time.sleep(max(0, alvo - time.time()))
+            enviadas += 1
+            conversa = None
+            for _ in range(len(livres)):
+                candidata = livres.popleft()
+                livres.append(candidata)
+                if not rastreador.ocupado(candidata.phone):
+                    conversa = candidata
+                    break
+            if conversa is None:
+                sem_conversa += 1
+                continue
+            texto = rng.choice(FRASES[rng.choices(intencoes, pesos)[0]])
+            payload = payload_megaapi(conversa, texto)
+            rastreador.registrar(conversa.phone, time.time())
+            executor.submit(enviar, payload)
+            if rng.random() < args.reentregas:
+                # Reentrega da MegaAPI (mesmo key.id), como quando o handler demora a responder
+                reentregas += 1
+                executor.submit(enviar, payload)
+        duracao_envio = time.time() - inicio
+
+    limite = time.time() + args.timeout_entrega
+    while rastreador.aguardando() and time.time() < limite:
+        time.sleep(0.1)
+    rastreador.parar()
+    duracao_total = time.time() - inicio
+    stats = requests.get(f"{args.stubs}/_stats", timeout=5).json()
+
+    aceitas = enviadas - sem_conversa
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("saida", "comparar")},
+        "mensagens": {"enviadas": aceitas, "reentregas": reentregas, "sem_conversa_livre": sem_conversa,
+                      "entregues": len(rastreador.latencias), "sem_entrega": rastreador.aguardando()},
+        "http": {**resumo_latencias(latencias_http), "status": dict(status)},
+        "ponta_a_ponta": resumo_latencias(rastreador.latencias),
+        "vazao": {"enviadas_por_s": round(aceitas / duracao_envio, 2) if duracao_envio else None,
+                  "entregues_por_s": round(len(rastreador.latencias) / duracao_total, 2) if duracao_total else None},
+        "upstream_por_mensagem": {nome: round(total / aceitas, 3) if aceitas else None for nome, total in stats["chamadas"].items()},
+        "upstream_erros": stats["erros"],
+    }
+
+def imprimir(resultado, anterior=None):
+    def linha(rotulo, atual, antes):
+        delta = ""
+        if isinstance(atual, (int, float)) and isinstance(antes, (int, float)) and antes:
+            delta = f"  ({(atual - antes) / antes * 100:+.1f}% vs anterior: {antes})"
+        print(f"  {rotulo:<26} {atual}{delta}")
+
+    anterior = anterior or {}
+    print("\nMensagens")
+    for nome, valor in resultado["mensagens"].items():
+        linha(nome, valor, anterior.get("mensagens", {}).get(nome))
+    for secao in ("http", "ponta_a_ponta"):
+        print(f"\nLatência {secao}")
+        for nome in ("n", "p50_ms", "p95_ms", "p99_ms", "max_ms"):
+            linha(nome, resultado[secao][nome], anterior.get(secao, {}).get(nome))
+    print(f"  {'status':<26} {resultado['http']['status']}")
+    print("\nVazão")
+    for nome, valor in resultado["vazao"].items():
+        linha(nome, valor, anterior.get("vazao", {}).get(nome))
+    print("\nChamadas aos upstreams por mensagem")
+    for nome, valor in resultado["upstream_por_mensagem"].items():
+        linha(nome, valor, anterior.get("upstream_por_mensagem", {}).get(nome))
+    if any(resultado["upstream_erros"].values()):
+        print(f"  {'erros simulados':<26} {resultado['upstream_erros']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga para /webhook e /webhook_fila")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--stubs", default="http://127.0.0.1:8900")
+    parser.add_argument("--rota", choices=("webhook", "webhook_fila"), default="webhook_fila")
+    parser.add_argument("--taxa", type=float, default=10, help="mensagens por segundo")
+    parser.add_argument("--duracao", type=float, default=30, help="segundos de carga")
+    parser.add_argument("--conversas", type=int, default=200)
+    parser.add_argument("--concorrencia", type=int, default=64, help="requisições HTTP simultâneas")
+    parser.add_argument("--reentregas", type=float, default=0.0, help="fração de webhooks reenviados com o mesmo key.id")
+    parser.add_argument("--timeout-http", type=float, default=120)
+    parser.add_argument("--timeout-entrega", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", help="grava o resultado em JSON")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    resultado = executar(args)
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+    imprimir(resultado, anterior)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
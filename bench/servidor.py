@@ -0,0 +1,61 @@
+import argparse
+import os
+
+from bench import stubs
+
+# Sobe o app apontado para os stubs (bench/stubs.py), com Redis local ou em memória.
+#   python -m bench.servidor --stubs http://127.0.0.1:8900 --porta 5000 [--redis fake] [--asgi]
+# --stubs embutido: sobe os stubs no mesmo processo (porta --porta-stubs).
+# --redis fake: usa fakeredis (pip install "fakeredis[lua]"; o outbox do WhatsApp usa script Lua)
+# no lugar do REDIS_URL; sem a opção, usa o Redis de REDIS_URL (padrão redis://localhost:6379/0).
+# As demais variáveis do app (FILA_WORKERS, WHATSAPP_TAXA, COALESCER_ATIVO...) valem como em produção;
+# os workers da fila sobem junto (FILA_INICIAR_NO_APP=1) para o /webhook_fila ser atendido.
+
+def usar_fakeredis():
+    """Troca as fábricas de cliente do redis-py por fakeredis antes de importar o app."""
+    import fakeredis
+    import redis
+    import redis.asyncio
+
+    servidor = fakeredis.FakeServer()
+    redis.StrictRedis.from_url = classmethod(lambda cls, url, **kwargs: fakeredis.FakeStrictRedis(server=servidor, **kwargs))
+    redis.asyncio.from_url = lambda url, **kwargs: fakeredis.aioredis.FakeRedis(server=servidor, **kwargs)
+
+def main():
+    parser = argparse.ArgumentParser(description="App apontado para os stubs locais")
+    parser.add_argument("--stubs", default="embutido", help="URL dos stubs ou 'embutido'")
+    parser.add_argument("--porta-stubs", type=int, default=8900)
+    parser.add_argument("--config-stubs", help="JSON com sobrescritas por upstream (só com --stubs embutido)")
+    parser.add_argument("--porta", type=int, default=5000)
+    parser.add_argument("--redis", choices=("local", "fake"), default="local")
+    parser.add_argument("--asgi", action="store_true", help="serve app_async com uvicorn")
+    args = parser.parse_args()
+
+    base_url = args.stubs
+    if args.stubs == "embutido":
+        config = None
+        if args.config_stubs:
+            import json
+            with open(args.config_stubs, encoding="utf-8") as f:
+                config = json.load(f)
+        stubs.iniciar(args.porta_stubs, config)
+        base_url = f"http://127.0.0.1:{args.porta_stubs}"
+    # Sobrescreve o .env (load_dotenv no app não substitui variáveis já definidas)
+    os.environ.update(stubs.variaveis_ambiente(base_url))
+    os.environ.setdefault("FILA_INICIAR_NO_APP", "1")
+    if args.redis == "fake":
+        usar_fakeredis()
+
+    if args.asgi:
+        import uvicorn
+        import app_async
+        uvicorn.run(app_async.asgi_app, host="127.0.0.1", port=args.porta, log_level="warning")
+        return
+
+    from werkzeug.serving import make_server
+    import app
+    print(f"App em http://127.0.0.1:{args.porta} (stubs em {base_url}, redis {args.redis})")
+    make_server("127.0.0.1", args.porta, app.app, threaded=True).serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import json
+import random
+import time
+
+import snapshot_ixc
+from bench.stubs import snapshot_ixc as snapshot_base
+
+# Compara o formato JSON do snapshot do IXC com o formato compacto (ver snapshot_ixc.py):
+# tamanho gravado no Redis e tempo de codificação/decodificação, sem Redis (só serialização).
+#   python -m bench.snapshot [--clientes 200] [--boletos 12] [--repeticoes 5]
+# A resposta simulada é a do stub (bench/stubs.py) engordada como a do IXC real: cada seção com os
+# campos crus do ERP e seções que o bot não usa (logins, OS, histórico de conexões).
+# Formatos: json (envelope como gravado hoje), json_indentado (JSON com indentação, como gravava o
+# salvar_ixc_redis antigo), compacto (HASH projetado, msgpack se instalado, senão JSON, zlib acima do
+# limiar) e compacto_parcial (leitura só de cliente + contrato).
+
+CAMPOS_PARCIAL = ("cliente", "contrato")
+
+def _campos_crus(rng, n, prefixo):
+    return {f"{prefixo}_{i}": rng.choice([str(rng.randint(0, 10 ** 6)), "", "N", "S", "2024-01-10 08:00:00", None])
+            for i in range(n)}
+
+def resposta_ixc(cpf, boletos, rng):
+    dados = snapshot_base(cpf)
+    dados["cliente"].update(_campos_crus(rng, 60, "cliente"))
+    dados["contrato"].update(_campos_crus(rng, 40, "contrato"))
+    base = dados["boletos"][0]
+    dados["boletos"] = [
+        {**base, "id": str(i), "data_vencimento": f"2024-{(i % 12) + 1:02d}-10", **_campos_crus(rng, 30, "boleto")}
+        for i in range(boletos)
+    ]
+    dados["logins"] = [_campos_crus(rng, 50, "login") for _ in range(2)]
+    dados["ordens_servico"] = [_campos_crus(rng, 25, "os") for _ in range(5)]
+    dados["conexoes"] = [_campos_crus(rng, 12, "conexao") for _ in range(30)]
+    return dados
+
+def _medir(fn, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        fn()
+    return (time.perf_counter() - inicio) / repeticoes
+
+def medir_formatos(envelopes, repeticoes, comprimir_acima):
+    formato = snapshot_ixc.FormatoCompacto(None, comprimir_acima=comprimir_acima)
+    jsons = [json.dumps(e, ensure_ascii=False) for e in envelopes]
+    indentados = [json.dumps(e, ensure_ascii=False, indent=2) for e in envelopes]
+    mapas = [formato._mapa(e) for e in envelopes]
+    # O que o HMGET/HGETALL devolve: nomes de campo em bytes e valores como gravados
+    hashes = [{c.encode(): v if isinstance(v, bytes) else v.encode() for c, v in m.items()} for m in mapas]
+    parciais = [[h.get(c.encode()) for c in (*snapshot_ixc.META, *CAMPOS_PARCIAL)] for h in hashes]
+    tamanho_hash = lambda h: sum(len(c) + len(v) for c, v in h.items())
+
+    resultados = {
+        "json": {
+            "bytes": sum(len(j.encode()) for j in jsons),
+            "codificar_s": _medir(lambda: [json.dumps(e, ensure_ascii=False) for e in envelopes], repeticoes),
+            "decodificar_s": _medir(lambda: [json.loads(j) for j in jsons], repeticoes),
+        },
+        "json_indentado": {
+            "bytes": sum(len(j.encode()) for j in indentados),
+            "codificar_s": _medir(lambda: [json.dumps(e, ensure_ascii=False, indent=2) for e in envelopes], repeticoes),
+            "decodificar_s": _medir(lambda: [json.loads(j) for j in indentados], repeticoes),
+        },
+        "compacto": {
+            "bytes": sum(tamanho_hash(h) for h in hashes),
+            "codificar_s": _medir(lambda: [formato._mapa(e) for e in envelopes], repeticoes),
+            "decodificar_s": _medir(lambda: [formato.envelope(h) for h in hashes], repeticoes),
+        },
+        "compacto_parcial": {
+            "bytes": sum(len(v) for p in parciais for v in p if v),
+            "codificar_s": None,
+            "decodificar_s": _medir(lambda: [formato.envelope(p, CAMPOS_PARCIAL) for p in parciais], repeticoes),
+        },
+    }
+    # Conferência: o compacto devolve exatamente as seções projetadas
+    for envelope, h in zip(envelopes, hashes):
+        assert formato.envelope(h)["dados"] == snapshot_ixc.projetar(envelope["dados"])
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser(description="Tamanho e custo de (de)serialização do snapshot do IXC")
+    parser.add_argument("--clientes", type=int, default=200)
+    parser.add_argument("--boletos", type=int, default=12)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--comprimir-acima", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    envelopes = [
+        {"dados": resposta_ixc(f"{rng.randint(0, 10 ** 11):011d}", args.boletos, rng), "ts": time.time(), "erro": False}
+        for _ in range(args.clientes)
+    ]
+    resultados = medir_formatos(envelopes, args.repeticoes, args.comprimir_acima)
+
+    print(f"{args.clientes} snapshots, {args.boletos} boletos cada; serialização: "
+          f"{'msgpack' if snapshot_ixc.msgpack else 'JSON (msgpack não instalado)'}")
+    base = resultados["json"]
+    print(f"{'formato':<18}{'bytes/cliente':>15}{'vs json':>10}{'codificar ms':>15}{'decodificar ms':>17}")
+    for nome, r in resultados.items():
+        codificar = f"{r['codificar_s'] * 1000 / args.clientes:.3f}" if r["codificar_s"] is not None else "-"
+        print(f"{nome:<18}{r['bytes'] // args.clientes:>15}{r['bytes'] / base['bytes']:>9.0%}"
+              f"{codificar:>15}{r['decodificar_s'] * 1000 / args.clientes:>17.3f}")
+
+if __name__ == "__main__":
+    main()
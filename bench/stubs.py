@@ -0,0 +1,307 @@
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Servidor local que faz o papel de todos os upstreams do app (MegaAPI, Mistral, DeepSeek, IXC/n8n,
+# Mem0AI e Make.com) para medir o app sem rede e sem custo. Um único processo/porta, roteado por prefixo:
+#   /megaapi   -> MEGAAPI_URL          /mistral/v1/agents/completions -> MISTRAL_URL
+#   /ixc       -> IXC_API_URL          /deepseek/v1/chat/completions  -> DEPSEEK_URL
+#   /mem0      -> MEM0_HOST            /make                          -> MAKE_WEBHOOK_URL
+# Cada upstream tem distribuição de latência e taxa de erro configuráveis (ver CONFIG_PADRAO); um JSON
+# passado em --config sobrescreve por upstream, ex: {"mistral": {"latencia": {"dist": "fixa", "ms": 50}}}.
+# O Mistral devolve tool_calls prontas (consultas ao IXC) numa fração das chamadas.
+# Endpoints de controle (usados por bench/carga.py):
+#   GET  /_stats            chamadas e erros por upstream
+#   GET  /_entregas?desde=N mensagens recebidas pela MegaAPI a partir da sequência N
+#   POST /_reset            zera contadores e entregas
+# Uso: python -m bench.stubs --porta 8900 [--config cenario.json] [--seed 42]
+
+CONFIG_PADRAO = {
+    # dist: fixa (ms) | uniforme (min_ms, max_ms) | lognormal (mediana_ms, p95_ms)
+    "megaapi": {"latencia": {"dist": "lognormal", "mediana_ms": 150, "p95_ms": 400}, "erro": 0.0},
+    "mistral": {"latencia": {"dist": "lognormal", "mediana_ms": 1200, "p95_ms": 3500}, "erro": 0.0, "tool_calls": 0.3},
+    "deepseek": {"latencia": {"dist": "lognormal", "mediana_ms": 500, "p95_ms": 1500}, "erro": 0.0},
+    "ixc": {"latencia": {"dist": "lognormal", "mediana_ms": 400, "p95_ms": 2000}, "erro": 0.0},
+    "mem0": {"latencia": {"dist": "lognormal", "mediana_ms": 250, "p95_ms": 800}, "erro": 0.0},
+    "make": {"latencia": {"dist": "fixa", "ms": 200}, "erro": 0.0},
+}
+
+# Tool calls devolvidas pelo stub do Mistral (o app sobrescreve o cpf com o do contexto)
+TOOL_CALLS_PRONTAS = [
+    ("consultar_boletos", {"cpf": "00000000000"}),
+    ("consultar_status_plano", {"cpf": "00000000000"}),
+    ("consultar_dados_cadastro", {"cpf": "00000000000"}),
+    ("consultar_valor_plano", {"cpf": "00000000000"}),
+]
+
+RESPOSTAS_MISTRAL = [
+    "Entendi! Verifiquei aqui e está tudo certo com o seu contrato. Posso ajudar em mais alguma coisa?",
+    "Obrigado por aguardar. Já registrei sua solicitação e nossa equipe vai acompanhar.",
+    "Certo! Se a conexão continuar instável, reinicie o roteador e me avise aqui.",
+]
+
+def mesclar_config(base, extra):
+    config = json.loads(json.dumps(base))
+    for upstream, valores in (extra or {}).items():
+        config.setdefault(upstream, {}).update(valores)
+    return config
+
+def sortear_latencia(cfg, rng):
+    """Latência em segundos para uma chamada, segundo a distribuição configurada."""
+    dist = cfg.get("dist", "fixa")
+    if dist == "uniforme":
+        return rng.uniform(cfg["min_ms"], cfg["max_ms"]) / 1000
+    if dist == "lognormal":
+        mediana = cfg["mediana_ms"]
+        sigma = math.log(max(cfg.get("p95_ms", mediana), mediana) / mediana) / 1.645
+        return rng.lognormvariate(math.log(mediana), sigma) / 1000
+    return cfg.get("ms", 0) / 1000
+
+def snapshot_ixc(cpf):
+    """Snapshot do IXC no formato consumido por respostas_template.py e montar_contexto_cliente."""
+    rng = random.Random(cpf)
+    id_cliente = str(rng.randint(1000, 99999))
+    return {
+        "cliente": {"id": id_cliente, "razao_social": f"Cliente {cpf[-4:]}", "telefone_celular": "11999999999", "endereco": "Rua Exemplo, 100"},
+        "contrato": {"id": str(rng.randint(1000, 99999)), "status": "Ativo", "status_internet": "Online", "valor": "99.90"},
+        "status_plano": {"status_contrato": "Ativo", "status_internet": "Online", "ultima_conexao_inicial": "2024-01-10 08:00:00"},
+        "cadastro": {"nome": f"Cliente {cpf[-4:]}", "telefone": "11999999999", "endereco": "Rua Exemplo, 100", "status": "Ativo"},
+        "valor_plano": {"valor": "99.90"},
+        "boletos": [
+            {"id": "1", "status": "A", "valor_aberto": "99.90", "data_vencimento": "2024-02-10",
+             "url_pdf": f"https://boletos.exemplo/{id_cliente}.pdf", "linha_digitavel": "00190000090000000000000000000000000000000000"},
+        ],
+    }
+
+class EstadoStubs:
+    def __init__(self, config, seed=None):
+        self.config = config
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.chamadas = {nome: 0 for nome in self.config}
+            self.erros = {nome: 0 for nome in self.config}
+            self.entregas = []  # (sequência, telefone, instante)
+
+    def registrar(self, upstream):
+        """Conta a chamada e sorteia (latência em s, falhar?) sob o lock (random.Random não é thread-safe)."""
+        cfg = self.config.get(upstream, {})
+        with self._lock:
+            self.chamadas[upstream] = self.chamadas.get(upstream, 0) + 1
+            latencia = sortear_latencia(cfg.get("latencia", {}), self.rng)
+            falhar = self.rng.random() < cfg.get("erro", 0.0)
+            if falhar:
+                self.erros[upstream] = self.erros.get(upstream, 0) + 1
+        return latencia, falhar
+
+    def sortear(self, probabilidade):
+        with self._lock:
+            return self.rng.random() < probabilidade
+
+    def escolher(self, opcoes):
+        with self._lock:
+            return self.rng.choice(opcoes)
+
+    def entregar(self, telefone):
+        with self._lock:
+            self.entregas.append((len(self.entregas), telefone, time.time()))
+
+    def stats(self):
+        with self._lock:
+            return {"chamadas": dict(self.chamadas), "erros": dict(self.erros), "entregas": len(self.entregas)}
+
+    def entregas_desde(self, seq):
+        with self._lock:
+            return self.entregas[seq:]
+
+def resposta_mistral(corpo, estado):
+    mensagens = corpo.get("messages") or []
+    ultima = mensagens[-1] if mensagens else {}
+    # Depois de resultados de tools, sempre responde com texto (o loop do app termina)
+    if ultima.get("role") != "tool" and estado.sortear(estado.config["mistral"].get("tool_calls", 0)):
+        nome, args = estado.escolher(TOOL_CALLS_PRONTAS)
+        mensagem = {
+            "role": "assistant",
+            "content": "",
+            "tool_calls": [{"id": uuid.uuid4().hex[:9], "type": "function", "function": {"name": nome, "arguments": json.dumps(args)}}],
+        }
+        fim = "tool_calls"
+    else:
+        mensagem = {"role": "assistant", "content": estado.escolher(RESPOSTAS_MISTRAL)}
+        fim = "stop"
+    return {
+        "id": uuid.uuid4().hex,
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": mensagem, "finish_reason": fim}],
+        "usage": {"prompt_tokens": 800, "completion_tokens": 60, "total_tokens": 860},
+    }
+
+def resposta_deepseek(corpo):
+    texto = ""
+    for m in corpo.get("messages") or []:
+        if m.get("role") == "user":
+            texto = (m.get("content") or "").lower()
+    intencao = "outros"
+    for palavra, candidata in (("boleto", "consulta_boleto"), ("internet", "suporte_internet"), ("plano", "consulta_valor_plano")):
+        if palavra in texto:
+            intencao = candidata
+            break
+    conteudo = json.dumps({"intencao": intencao, "entidades": {}})
+    return {"choices": [{"index": 0, "message": {"role": "assistant", "content": conteudo}, "finish_reason": "stop"}]}
+
+def resposta_ixc(operacao, corpo):
+    cpf = str(corpo.get("cpf") or corpo.get("id_cliente") or "00000000000")
+    snapshot = snapshot_ixc(cpf)
+    if not operacao:
+        return snapshot
+    if operacao == "consultarBoletos":
+        return snapshot["boletos"]
+    if operacao == "consultarStatusPlano":
+        return snapshot["status_plano"]
+    if operacao == "consultarContratos":
+        return [snapshot["contrato"]]
+    if operacao == "abrirOS":
+        return {"status": "ok", "id_os": uuid.uuid4().hex[:8]}
+    return snapshot["cliente"]
+
+def resposta_mem0(metodo, caminho):
+    if caminho.startswith("/v1/ping"):
+        return {"status": "ok", "user_email": "bench@local", "org_id": "bench", "project_id": "bench"}
+    if metodo == "POST" and caminho.startswith("/v1/memories"):
+        return [{"id": uuid.uuid4().hex, "event": "ADD"}]
+    return {"results": [], "count": 0, "next": None}
+
+_ROTA_MEGAAPI = re.compile(r"^/megaapi/rest/sendMessage/[^/]+/text$")
+
+def criar_handler(estado):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, como os upstreams reais
+
+        def log_message(self, *args):
+            pass
+
+        def _ler_corpo(self):
+            tamanho = int(self.headers.get("Content-Length") or 0)
+            if not tamanho:
+                return {}
+            try:
+                return json.loads(self.rfile.read(tamanho) or b"{}")
+            except ValueError:
+                return {}
+
+        def _responder(self, corpo, status=200):
+            dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def _upstream(self, caminho):
+            for nome in ("megaapi", "mistral", "deepseek", "ixc", "mem0", "make"):
+                if caminho == f"/{nome}" or caminho.startswith(f"/{nome}/"):
+                    return nome, caminho[len(nome) + 1:]
+            return None, caminho
+
+        def _tratar(self, metodo):
+            caminho, _, consulta = self.path.partition("?")
+            corpo = self._ler_corpo() if metodo == "POST" else {}
+            if caminho == "/_stats":
+                return self._responder(estado.stats())
+            if caminho == "/_entregas":
+                desde = int(dict(p.split("=", 1) for p in consulta.split("&") if "=" in p).get("desde", 0))
+                return self._responder([{"seq": s, "phone": t, "ts": ts} for s, t, ts in estado.entregas_desde(desde)])
+            if caminho == "/_reset":
+                estado.reset()
+                return self._responder({"status": "ok"})
+
+            upstream, resto = self._upstream(caminho)
+            if upstream is None:
+                return self._responder({"erro": "rota desconhecida"}, 404)
+            latencia, falhar = estado.registrar(upstream)
+            time.sleep(latencia)
+            if falhar:
+                return self._responder({"erro": "falha simulada"}, estado.config[upstream].get("status_erro", 500))
+
+            if upstream == "megaapi":
+                if not _ROTA_MEGAAPI.match(caminho):
+                    return self._responder({"erro": "rota desconhecida"}, 404)
+                estado.entregar(str((corpo.get("messageData") or {}).get("to")))
+                return self._responder({"error": False, "message": "ok", "key": {"id": uuid.uuid4().hex[:20].upper()}})
+            if upstream == "mistral":
+                return self._responder(resposta_mistral(corpo, estado))
+            if upstream == "deepseek":
+                return self._responder(resposta_deepseek(corpo))
+            if upstream == "ixc":
+                return self._responder(resposta_ixc(resto.strip("/"), corpo))
+            if upstream == "mem0":
+                return self._responder(resposta_mem0(metodo, resto))
+            return self._responder({"status": "ok"})
+
+        def do_GET(self):
+            self._tratar("GET")
+
+        def do_POST(self):
+            self._tratar("POST")
+
+    return Handler
+
+def iniciar(porta=8900, config=None, seed=None, host="127.0.0.1"):
+    """Sobe os stubs numa thread e retorna (servidor, estado). Útil para rodar no mesmo processo da carga."""
+    estado = EstadoStubs(mesclar_config(CONFIG_PADRAO, config), seed)
+    servidor = ThreadingHTTPServer((host, porta), criar_handler(estado))
+    servidor.daemon_threads = True
+    servidor.request_queue_size = 1024
+    threading.Thread(target=servidor.serve_forever, name="stubs", daemon=True).start()
+    return servidor, estado
+
+def variaveis_ambiente(base_url):
+    """Variáveis que apontam o app para os stubs."""
+    return {
+        "MEGAAPI_URL": f"{base_url}/megaapi",
+        "MEGAAPI_KEY": "bench",
+        "INSTANCE_KEY": "bench",
+        "MISTRAL_URL": f"{base_url}/mistral/v1/agents/completions",
+        "MISTRAL_API_KEY": "bench",
+        "MISTRAL_AGENT_ID": "bench",
+        "DEPSEEK_URL": f"{base_url}/deepseek/v1/chat/completions",
+        "DEPSEEK_API_KEY": "bench",
+        "IXC_API_URL": f"{base_url}/ixc",
+        "MEM0_HOST": f"{base_url}/mem0",
+        "MEM0_API_KEY": "bench",
+        "MAKE_WEBHOOK_URL": f"{base_url}/make",
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Stubs locais dos upstreams do app")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8900)
+    parser.add_argument("--config", help="JSON com sobrescritas por upstream")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    config = None
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            config = json.load(f)
+    servidor, _ = iniciar(args.porta, config, args.seed, args.host)
+    base_url = f"http://{args.host}:{args.porta}"
+    print(f"Stubs em {base_url}. Variáveis para o app:")
+    for nome, valor in variaveis_ambiente(base_url).items():
+        print(f"  export {nome}={valor}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+import asyncio
+import time
+import prazo
+from logs import obter_logger
+from metricas import contar_cache
+from disjuntor import CircuitoAberto
+from concurrent.futures import ThreadPoolExecutor
+from snapshot_ixc import FormatoJSON
+
+# Cache do IXC por CPF com single-flight e stale-while-revalidate.
+# - Entrada fresca (idade < soft_ttl): devolvida direto.
+# - Entrada velha (soft_ttl <= idade < hard_ttl): devolvida na hora e um refresh roda em background.
+# - Sem entrada: só quem pega o lock Redis do CPF consulta o IXC; os demais aguardam o resultado.
+# - Erro/timeout do IXC: cacheado por neg_ttl (cache negativo), para não martelar o IXC fora do ar.
+# - Último snapshot bom: cada snapshot válido também vai para ixc:{cpf}:ultimo_bom (TTL longo). Com
+#   erro do IXC ou disjuntor aberto (ver disjuntor.py), é ele que volta para quem chamou; com o
+#   disjuntor aberto nada é gravado, nem cache negativo. Um erro só chega ao chamador se o CPF
+#   nunca teve snapshot bom. Vale para qualquer caminho de obter: leitura direta, releitura sob o
+#   lock, espera pela consulta de outro worker e timeout dessa espera.
+# - A espera pela consulta de outro worker dura no máximo espera_max e nunca passa do que resta do
+#   orçamento do turno (ver prazo.py).
+# Como o snapshot é gravado no Redis (JSON inteiro ou projetado/compacto, com leitura parcial) fica a
+# cargo do `formato` (ver snapshot_ixc.py); o L1 guarda o envelope já decodificado nos dois casos.
+
+log = obter_logger("ixc")
+
+def is_erro(dados):
+    return isinstance(dados, dict) and "erro" in dados
+
+class CacheIXC:
+    def __init__(self, redis_client, buscar_upstream, soft_ttl=600, hard_ttl=1800, neg_ttl=60,
+                 lock_ttl=45, espera_max=35, refresh_workers=4, cache_local=None,
+                 redis_async=None, buscar_upstream_async=None, ultimo_bom_ttl=60 * 60 * 24 * 7, formato=None):
+        self.redis = redis_client
+        self.formato = formato or FormatoJSON(redis_client, redis_async)
+        self.buscar_upstream = buscar_upstream
+        # Variante asyncio (app_async.py): cliente redis.asyncio e corrotina de consulta ao IXC
+        self.redis_async = redis_async
+        self.buscar_upstream_async = buscar_upstream_async
+        self._refresh_tasks = set()
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.neg_ttl = neg_ttl
+        self.ultimo_bom_ttl = ultimo_bom_ttl
+        self.lock_ttl = lock_ttl
+        self.espera_max = espera_max
+        self.cache_local = cache_local  # L1 opcional (CacheLocal) com o envelope já decodificado
+        self._refresh_executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="ixc-refresh")
+
+    def chave(self, cpf):
+        # Chave do L1 e do canal de invalidação; a chave no Redis depende do formato
+        return f"ixc:{cpf}"
+
+    def chave_ultimo_bom(self, cpf):
+        return self.formato.chave_ultimo_bom(cpf)
+
+    def _lock(self, cpf):
+        # thread_local=False: o refresh em background pega o lock na thread do pedido e libera na ixc-refresh
+        return self.redis.lock(f"ixc:{cpf}:lock", timeout=self.lock_ttl, blocking=False, thread_local=False)
+
+    def _ler_redis(self, cpf):
+        return self.formato.ler(self.formato.chave(cpf))
+
+    def ler(self, cpf):
+        """Retorna o envelope {"dados", "ts", "erro"} do CPF ou None."""
+        if self.cache_local is not None:
+            return self.cache_local.obter(self.chave(cpf), lambda: self._ler_redis(cpf))
+        return self._ler_redis(cpf)
+
+    def ler_campos(self, cpf, campos):
+        """Envelope só com as seções pedidas do snapshot (leitura parcial no formato compacto)."""
+        envelope = self.cache_local.get(self.chave(cpf), None) if self.cache_local is not None else None
+        if envelope is not None:
+            dados = envelope["dados"]
+            if isinstance(dados, dict):
+                dados = {c: dados[c] for c in (*campos, "erro") if c in dados}
+            return {**envelope, "dados": dados}
+        return self.formato.ler(self.formato.chave(cpf), campos)
+
+    def ler_varios(self, cpfs, campos=None, ultimo_bom=False):
+        """Envelopes (ou None) de vários CPFs num round trip, direto do Redis; campos=() lê só ts/erro."""
+        if not cpfs:
+            return []
+        pipe = self.formato.redis.pipeline(transaction=False)
+        for cpf in cpfs:
+            chave = self.chave_ultimo_bom(cpf) if ultimo_bom else self.formato.chave(cpf)
+            self.formato.comando_ler(pipe, chave, campos)
+        return [self.formato.envelope(r, campos) for r in pipe.execute()]
+
+    def _invalidar_local(self, cpf):
+        if self.cache_local is not None:
+            self.cache_local.invalidar(self.chave(cpf))
+
+    def _envelope(self, dados, atual):
+        """(envelope, ttl) a gravar, ou None quando o snapshot atual deve ser mantido."""
+        erro = is_erro(dados)
+        if erro and atual and not atual.get("erro"):
+            # Nunca sobrescreve um snapshot bom com um erro; o snapshot velho continua servindo
+            return None
+        envelope = {"dados": dados, "ts": time.time(), "erro": erro}
+        return envelope, (self.neg_ttl if erro else self.hard_ttl)
+
+    def _pipeline_gravar(self, pipe, cpf, envelope, ttl):
+        self.formato.pipeline_gravar(pipe, cpf, envelope, ttl, self.ultimo_bom_ttl)
+
+    def gravar(self, cpf, dados):
+        gravacao = self._envelope(dados, self.ler(cpf) if is_erro(dados) else None)
+        if gravacao is None:
+            return
+        pipe = self.formato.redis.pipeline(transaction=False)
+        self._pipeline_gravar(pipe, cpf, *gravacao)
+        pipe.execute()
+        self._invalidar_local(cpf)
+
+    def _ultimo_bom(self, cpf, erro):
+        """Último snapshot bom do CPF no lugar de um erro do IXC; sem snapshot, o próprio erro."""
+        envelope = self.formato.ler(self.chave_ultimo_bom(cpf))
+        if not envelope:
+            return erro
+        contar_cache("ixc", "ultimo_bom")
+        log.aviso("servindo_ultimo_bom", cpf=cpf, erro=erro.get("erro"))
+        return envelope["dados"]
+
+    def invalidar(self, cpf):
+        self.formato.redis.delete(self.formato.chave(cpf))
+        self._invalidar_local(cpf)
+
+    def _buscar_e_gravar(self, cpf):
+        try:
+            dados = self.buscar_upstream(cpf)
+        except CircuitoAberto as e:
+            return self._ultimo_bom(cpf, {"erro": str(e)})
+        self.gravar(cpf, dados)
+        return self._ultimo_bom(cpf, dados) if is_erro(dados) else dados
+
+    def _refresh(self, cpf, lock):
+        try:
+            self._buscar_e_gravar(cpf)
+        except Exception as e:
+            log.erro("refresh_falhou", cpf=cpf, erro=str(e))
+        finally:
+            self._liberar(lock)
+
+    def _liberar(self, lock):
+        try:
+            lock.release()
+        except Exception:
+            pass  # lock expirou antes do fim da consulta; outro processo já pode ter assumido
+
+    def refresh_em_background(self, cpf):
+        lock = self._lock(cpf)
+        if lock.acquire():
+            self._refresh_executor.submit(self._refresh, cpf, lock)
+            return True
+        return False  # já existe um refresh em andamento para esse CPF
+
+    def atualizar(self, cpf):
+        """Refresh síncrono (aquecimento, ver aquecedor_ixc.py). False se o CPF já está sendo consultado."""
+        lock = self._lock(cpf)
+        if not lock.acquire():
+            return False
+        try:
+            dados = self.buscar_upstream(cpf)
+            self.gravar(cpf, dados)
+            return not is_erro(dados)
+        except CircuitoAberto:
+            return False
+        finally:
+            self._liberar(lock)
+
+    def _dados(self, cpf, envelope):
+        """Dados de um envelope lido do cache; cache negativo vira o último snapshot bom (se houver)."""
+        if envelope.get("erro"):
+            return self._ultimo_bom(cpf, envelope["dados"])
+        return envelope["dados"]
+
+    def _limite_espera(self):
+        """Instante limite para esperar a consulta de outro worker: espera_max, sem passar do prazo do turno."""
+        espera = prazo.limitar(self.espera_max)
+        return time.time() + max(0.0, espera)
+
+    def _contar(self, envelope):
+        """Classifica o envelope lido (negativo/fresco/velho/miss) para as métricas e o retorna."""
+        if not envelope:
+            resultado = "miss"
+        elif envelope.get("erro"):
+            resultado = "negativo"
+        elif time.time() - envelope["ts"] < self.soft_ttl:
+            resultado = "fresco"
+        else:
+            resultado = "velho"
+        contar_cache("ixc", resultado)
+        return resultado
+
+    def obter(self, cpf):
+        envelope = self.ler(cpf)
+        resultado = self._contar(envelope)
+        if envelope:
+            if resultado == "velho":
+                log.info("cache_velho", cpf=cpf, idade_s=round(time.time() - envelope["ts"]))
+                self.refresh_em_background(cpf)
+            return self._dados(cpf, envelope)
+        limite = self._limite_espera()
+        while True:
+            lock = self._lock(cpf)
+            if lock.acquire():
+                try:
+                    # Outro processo pode ter gravado entre a leitura e o lock (lê direto do Redis, sem L1)
+                    envelope = self._ler_redis(cpf)
+                    if envelope:
+                        return self._dados(cpf, envelope)
+                    return self._buscar_e_gravar(cpf)
+                finally:
+                    self._liberar(lock)
+            # Consulta em andamento em outro worker: aguarda o resultado no cache
+            while self.redis.exists(f"ixc:{cpf}:lock") and time.time() < limite:
+                time.sleep(0.1)
+            envelope = self._ler_redis(cpf)
+            if envelope:
+                return self._dados(cpf, envelope)
+            if time.time() >= limite:
+                return self._ultimo_bom(cpf, {"erro": "Timeout aguardando consulta ao IXC"})
+
+    # --- Variante asyncio: mesma política (SWR, single-flight, cache negativo) sem bloquear o event loop ---
+
+    async def _ler_redis_async(self, cpf):
+        return await self.formato.ler_async(self.formato.chave(cpf))
+
+    async def ler_async(self, cpf):
+        if self.cache_local is None:
+            return await self._ler_redis_async(cpf)
+        envelope = self.cache_local.get(self.chave(cpf), None)
+        if envelope is None:
+            versao = self.cache_local.versao(self.chave(cpf))
+            envelope = await self._ler_redis_async(cpf)
+            if envelope is not None:
+                self.cache_local.set(self.chave(cpf), envelope, versao=versao)
+        return envelope
+
+    async def gravar_async(self, cpf, dados):
+        gravacao = self._envelope(dados, await self.ler_async(cpf) if is_erro(dados) else None)
+        if gravacao is None:
+            return
+        pipe = self.formato.redis_async.pipeline(transaction=False)
+        self._pipeline_gravar(pipe, cpf, *gravacao)
+        await pipe.execute()
+        if self.cache_local is not None:
+            await self.cache_local.invalidar_async(self.chave(cpf), self.redis_async)
+
+    async def _ultimo_bom_async(self, cpf, erro):
+        envelope = await self.formato.ler_async(self.chave_ultimo_bom(cpf))
+        if not envelope:
+            return erro
+        contar_cache("ixc", "ultimo_bom")
+        log.aviso("servindo_ultimo_bom", cpf=cpf, erro=erro.get("erro"))
+        return envelope["dados"]
+
+    async def _dados_async(self, cpf, envelope):
+        if envelope.get("erro"):
+            return await self._ultimo_bom_async(cpf, envelope["dados"])
+        return envelope["dados"]
+
+    async def _buscar_e_gravar_async(self, cpf):
+        try:
+            dados = await self.buscar_upstream_async(cpf)
+        except CircuitoAberto as e:
+            return await self._ultimo_bom_async(cpf, {"erro": str(e)})
+        await self.gravar_async(cpf, dados)
+        return await self._ultimo_bom_async(cpf, dados) if is_erro(dados) else dados
+
+    def _lock_async(self, cpf):
+        return self.redis_async.lock(f"ixc:{cpf}:lock", timeout=self.lock_ttl, blocking=False)
+
+    async def _liberar_async(self, lock):
+        try:
+            await lock.release()
+        except Exception:
+            pass
+
+    async def _refresh_async(self, cpf, lock):
+        try:
+            await self._buscar_e_gravar_async(cpf)
+        except Exception as e:
+            log.erro("refresh_falhou", cpf=cpf, erro=str(e))
+        finally:
+            await self._liberar_async(lock)
+
+    async def refresh_em_background_async(self, cpf):
+        lock = self._lock_async(cpf)
+        if await lock.acquire():
+            task = asyncio.create_task(self._refresh_async(cpf, lock))
+            # Guarda referência até o fim, senão a task pode ser coletada no meio do refresh
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_tasks.discard)
+            return True
+        return False
+
+    async def obter_async(self, cpf):
+        envelope = await self.ler_async(cpf)
+        resultado = self._contar(envelope)
+        if envelope:
+            if resultado == "velho":
+                log.info("cache_velho", cpf=cpf, idade_s=round(time.time() - envelope["ts"]))
+                await self.refresh_em_background_async(cpf)
+            return await self._dados_async(cpf, envelope)
+        limite = self._limite_espera()
+        while True:
+            lock = self._lock_async(cpf)
+            if await lock.acquire():
+                try:
+                    envelope = await self._ler_redis_async(cpf)
+                    if envelope:
+                        return await self._dados_async(cpf, envelope)
+                    return await self._buscar_e_gravar_async(cpf)
+                finally:
+                    await self._liberar_async(lock)
+            while await self.redis_async.exists(f"ixc:{cpf}:lock") and time.time() < limite:
+                await asyncio.sleep(0.1)
+            envelope = await self._ler_redis_async(cpf)
+            if envelope:
+                return await self._dados_async(cpf, envelope)
+            if time.time() >= limite:
+                return await self._ultimo_bom_async(cpf, {"erro": "Timeout aguardando consulta ao IXC"})
@@ -0,0 +1,107 @@
+import time
+import threading
+from collections import OrderedDict
+from logs import obter_logger
+from metricas import contar_cache
+
+# Cache L1 em memória (por processo) na frente do Redis para dados quase estáticos da conversa
+# (CPF do contexto, flag de cumprimento, snapshot do IXC). Guarda os objetos já decodificados,
+# então um hit não custa round trip ao Redis nem json.loads.
+# Consistência entre processos: toda escrita publica a chave no canal de invalidação e cada
+# processo remove a chave do seu L1 ao receber a mensagem. O TTL curto limita o impacto de
+# uma mensagem perdida (pub/sub do Redis não tem garantia de entrega).
+# Os valores devolvidos são compartilhados entre threads: quem chama não deve alterá-los.
+
+_AUSENTE = object()
+log = obter_logger("cache")
+
+class CacheLocal:
+    def __init__(self, redis_client, max_itens=10000, ttl=30, canal="cache:invalidacao"):
+        self.redis = redis_client
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.canal = canal
+        self._itens = OrderedDict()  # chave -> (expira_em, valor)
+        self._versoes = {}  # chave -> contador de invalidações, evita gravar leitura anterior a uma escrita
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def versao(self, chave):
+        with self._lock:
+            return self._versoes.get(chave, 0)
+
+    def get(self, chave, padrao=_AUSENTE):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return padrao
+            expira_em, valor = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                return padrao
+            self._itens.move_to_end(chave)
+            return valor
+
+    def set(self, chave, valor, versao=None, ttl=None):
+        with self._lock:
+            if versao is not None and self._versoes.get(chave, 0) != versao:
+                return  # houve invalidação durante a leitura no Redis: o valor lido pode estar velho
+            self._itens[chave] = (time.monotonic() + (ttl or self.ttl), valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def descartar(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+            self._versoes[chave] = self._versoes.get(chave, 0) + 1
+            if len(self._versoes) > self.max_itens * 2:
+                self._versoes.clear()
+
+    def invalidar(self, chave):
+        """Remove a chave deste processo e avisa os demais processos pelo canal de pub/sub."""
+        self.descartar(chave)
+        try:
+            self.redis.publish(self.canal, chave)
+        except Exception as e:
+            log.erro("publicar_invalidacao_falhou", chave=chave, erro=str(e))
+
+    async def invalidar_async(self, chave, redis_async):
+        self.descartar(chave)
+        try:
+            await redis_async.publish(self.canal, chave)
+        except Exception as e:
+            log.erro("publicar_invalidacao_falhou", chave=chave, erro=str(e))
+
+    def obter(self, chave, carregar):
+        """Devolve o valor do L1 ou chama carregar() (leitura no Redis) e guarda o resultado."""
+        valor = self.get(chave)
+        if valor is not _AUSENTE:
+            contar_cache("l1", "hit")
+            return valor
+        contar_cache("l1", "miss")
+        versao = self.versao(chave)
+        valor = carregar()
+        self.set(chave, valor, versao=versao)
+        return valor
+
+    def _escutar(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.canal)
+                # Ao (re)conectar podemos ter perdido invalidações: começa do zero
+                with self._lock:
+                    self._itens.clear()
+                for mensagem in pubsub.listen():
+                    if mensagem.get("type") == "message":
+                        self.descartar(mensagem["data"])
+            except Exception as e:
+                log.erro("listener_desconectado", erro=str(e))
+                time.sleep(1)
+
+    def iniciar_listener(self):
+        if self._listener is None:
+            self._listener = threading.Thread(target=self._escutar, name="l1-invalidacao", daemon=True)
+            self._listener.start()
+        return self._listener
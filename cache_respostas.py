@@ -0,0 +1,252 @@
+import hashlib
+import json
+import time
+from classificador_intencao import normalizar_texto, hash_texto
+from logs import obter_logger
+from metricas import contar_cache
+from snapshot_ixc import CAMPOS
+
+# Cache de respostas do Mistral para perguntas repetidas, consultado antes do loop do Mistral.
+# Chave: (intenção, texto normalizado, impressão digital das seções do IXC de que a resposta depende).
+# - Impressão digital: hash das seções da política da intenção (ex: consulta_valor_plano só depende de
+#   valor_plano). Mudou o dado no IXC, muda a chave: nada de resposta com valor ou boleto antigo.
+# - Escopo: por CPF, salvo nas intenções marcadas como compartilhadas, em que clientes com as mesmas
+#   seções recebem a mesma resposta. O nome do cliente é guardado como {nome_cliente} e a resposta
+#   só é compartilhada se não citar nenhum dado do IXC fora das seções da chave.
+# - Quase duplicatas (opcional): simhash de 64 bits das palavras do texto normalizado (sem palavras
+#   vazias); dentro da mesma intenção e impressão digital, uma pergunta a até `distancia` bits de
+#   outra já respondida usa a mesma resposta.
+# - Não entram no cache: intenções em `sem_cache` (as que abrem OS ou transferem), turnos em que o
+#   Mistral executou uma tool com efeito colateral, respostas escritas com turnos anteriores da
+#   conversa no contexto (podem depender deles), e mensagens que só fazem sentido com o histórico:
+#   menos de `min_palavras` palavras fora das PALAVRAS_VAZIAS ("sim", "e o outro?") ou com palavras
+#   que remetem a algo dito antes (REFERENCIAS: "e o outro boleto?", "e desse?").
+# O valor guardado é a resposta crua do Mistral: quem usa aplica cumprimento e limpar_resposta no hit.
+# Chaves: resposta:{intencao}:{escopo}:{impressão}:{hash do texto} (JSON) e
+# resposta:{intencao}:{escopo}:{impressão}:simhash (HASH simhash -> hash do texto), com o TTL da intenção.
+
+log = obter_logger("cache")
+
+MARCADOR_NOME = "{nome_cliente}"
+
+class PoliticaResposta:
+    def __init__(self, campos=CAMPOS, ttl=None, compartilhada=False):
+        self.campos = tuple(campos)
+        self.ttl = ttl  # None: TTL padrão do cache
+        self.compartilhada = compartilhada
+
+# Palavras que não mudam a pergunta ("qual o valor do meu plano" = "qual o valor do plano")
+PALAVRAS_VAZIAS = {
+    "o", "a", "os", "as", "do", "da", "dos", "das", "de", "no", "na", "em", "um", "uma", "e", "eu", "me",
+    "meu", "minha", "meus", "minhas", "pra", "para", "por", "favor", "pf", "pfv", "esse", "essa", "este",
+}
+
+# Palavras que apontam para algo dito antes na conversa: a pergunta não se sustenta sozinha
+REFERENCIAS = {
+    "outro", "outra", "outros", "outras", "isso", "disso", "desse", "dessa", "deste", "desta", "nesse", "nessa",
+    "ele", "ela", "dele", "dela", "anterior", "mesmo", "mesma", "tambem", "entao", "ai",
+}
+
+def palavras(texto):
+    """Palavras do texto normalizado que contam para o cache (sem as palavras vazias)."""
+    return [p for p in texto.split() if p not in PALAVRAS_VAZIAS]
+
+def simhash(texto, bits=64):
+    """Simhash das palavras do texto normalizado, sem as palavras vazias. None se não sobra nenhuma."""
+    palavras_texto = palavras(texto)
+    if not palavras_texto:
+        return None
+    pesos = [0] * bits
+    for palavra in palavras_texto:
+        h = int.from_bytes(hashlib.md5(palavra.encode("utf-8")).digest()[:bits // 8], "big")
+        for i in range(bits):
+            pesos[i] += 1 if h >> i & 1 else -1
+    return sum(1 << i for i, peso in enumerate(pesos) if peso > 0)
+
+def distancia_hamming(a, b):
+    return bin(a ^ b).count("1")
+
+def _textos(valor):
+    if isinstance(valor, dict):
+        for v in valor.values():
+            yield from _textos(v)
+    elif isinstance(valor, list):
+        for v in valor:
+            yield from _textos(v)
+    elif valor is not None:
+        yield str(valor)
+
+class CacheRespostas:
+    def __init__(self, redis_client, politicas=None, ttl=3600, sem_cache=(), usar_simhash=True,
+                 distancia=3, max_similares=200, min_palavras=2, redis_async=None):
+        self.redis = redis_client
+        self.redis_async = redis_async
+        self.politicas = politicas or {}
+        self.ttl = ttl
+        self.sem_cache = set(sem_cache)
+        self.usar_simhash = usar_simhash
+        self.distancia = distancia
+        self.max_similares = max_similares
+        self.min_palavras = min_palavras
+
+    def politica(self, intencao):
+        return self.politicas.get(intencao) or PoliticaResposta()
+
+    def _ttl(self, politica):
+        return int(politica.ttl or self.ttl)
+
+    def impressao_digital(self, dados_ixc, campos):
+        secoes = {c: dados_ixc.get(c) for c in campos}
+        return hashlib.sha1(json.dumps(secoes, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+    def _preparar(self, intencao, user_message, dados_ixc, cpf):
+        """(texto normalizado, prefixo das chaves, política) ou None quando o turno não usa o cache."""
+        if not intencao or intencao in self.sem_cache:
+            return None
+        if not isinstance(dados_ixc, dict) or "erro" in dados_ixc:
+            return None
+        texto = normalizar_texto(user_message)
+        palavras_texto = palavras(texto)
+        if len(palavras_texto) < self.min_palavras or REFERENCIAS.intersection(palavras_texto):
+            return None
+        politica = self.politica(intencao)
+        escopo = "todos" if politica.compartilhada else cpf
+        prefixo = f"resposta:{intencao}:{escopo}:{self.impressao_digital(dados_ixc, politica.campos)}"
+        return texto, prefixo, politica
+
+    def _pipeline_buscar(self, pipe, texto, prefixo):
+        pipe.get(f"{prefixo}:{hash_texto(texto)}")
+        if self.usar_simhash:
+            pipe.hgetall(f"{prefixo}:simhash")
+
+    def _similar(self, texto, indice):
+        alvo = simhash(texto)
+        if alvo is None:
+            return None
+        melhor = None
+        for h, chave_texto in (indice or {}).items():
+            d = distancia_hamming(alvo, int(h))
+            if d <= self.distancia and (melhor is None or d < melhor[0]):
+                melhor = (d, chave_texto)
+        return melhor[1] if melhor else None
+
+    def _resposta(self, bruto, nome_cliente):
+        return json.loads(bruto)["resposta"].replace(MARCADOR_NOME, nome_cliente or "")
+
+    def buscar(self, intencao, user_message, dados_ixc, cpf, nome_cliente=None):
+        """Resposta guardada (ainda sem cumprimento/limpeza) ou None."""
+        try:
+            preparado = self._preparar(intencao, user_message, dados_ixc, cpf)
+            if preparado is None:
+                return None
+            texto, prefixo, _ = preparado
+            pipe = self.redis.pipeline(transaction=False)
+            self._pipeline_buscar(pipe, texto, prefixo)
+            exata, *indice = pipe.execute()
+            if exata:
+                contar_cache("respostas", "hit")
+                return self._resposta(exata, nome_cliente)
+            chave_texto = self._similar(texto, indice[0]) if indice else None
+            bruto = self.redis.get(f"{prefixo}:{chave_texto}") if chave_texto else None
+            if bruto:
+                contar_cache("respostas", "similar")
+                return self._resposta(bruto, nome_cliente)
+            contar_cache("respostas", "miss")
+        except Exception as e:
+            log.erro("cache_respostas_falhou", operacao="buscar", erro=str(e))
+        return None
+
+    async def buscar_async(self, intencao, user_message, dados_ixc, cpf, nome_cliente=None):
+        try:
+            preparado = self._preparar(intencao, user_message, dados_ixc, cpf)
+            if preparado is None:
+                return None
+            texto, prefixo, _ = preparado
+            pipe = self.redis_async.pipeline(transaction=False)
+            self._pipeline_buscar(pipe, texto, prefixo)
+            exata, *indice = await pipe.execute()
+            if exata:
+                contar_cache("respostas", "hit")
+                return self._resposta(exata, nome_cliente)
+            chave_texto = self._similar(texto, indice[0]) if indice else None
+            bruto = await self.redis_async.get(f"{prefixo}:{chave_texto}") if chave_texto else None
+            if bruto:
+                contar_cache("respostas", "similar")
+                return self._resposta(bruto, nome_cliente)
+            contar_cache("respostas", "miss")
+        except Exception as e:
+            log.erro("cache_respostas_falhou", operacao="buscar", erro=str(e))
+        return None
+
+    def _vaza_dados(self, resposta, dados_ixc, campos):
+        """True se a resposta cita algum dado do IXC fora das seções que formam a chave."""
+        resposta = resposta.lower()
+        for secao, valor in dados_ixc.items():
+            if secao in campos:
+                continue
+            if any(len(t) >= 4 and t.lower() in resposta for t in _textos(valor)):
+                return True
+        return False
+
+    def _gravacao(self, intencao, user_message, dados_ixc, cpf, nome_cliente, resposta, com_historico):
+        """(chave, valor, ttl, chave do índice, simhash) a gravar, ou None."""
+        if com_historico:
+            return None  # o Mistral viu turnos anteriores: a resposta pode depender deles
+        preparado = self._preparar(intencao, user_message, dados_ixc, cpf)
+        if preparado is None or not resposta:
+            return None
+        texto, prefixo, politica = preparado
+        if nome_cliente:
+            resposta = resposta.replace(nome_cliente, MARCADOR_NOME)
+        if politica.compartilhada and self._vaza_dados(resposta, dados_ixc, politica.campos):
+            log.debug("resposta_nao_compartilhada", intencao=intencao)
+            return None
+        chave_texto = hash_texto(texto)
+        valor = json.dumps({"resposta": resposta, "ts": time.time()}, ensure_ascii=False)
+        return f"{prefixo}:{chave_texto}", valor, self._ttl(politica), f"{prefixo}:simhash", (simhash(texto), chave_texto)
+
+    def _pipeline_gravar(self, pipe, chave, valor, ttl, chave_indice, similar):
+        pipe.setex(chave, ttl, valor)
+        if self.usar_simhash and similar[0] is not None:
+            pipe.hset(chave_indice, str(similar[0]), similar[1])
+            pipe.expire(chave_indice, ttl)
+            pipe.hlen(chave_indice)
+
+    def _podar(self, cliente, chave_indice, tamanho):
+        # Índice de similares limitado: acima do máximo, recomeça (as respostas exatas continuam valendo)
+        if tamanho and tamanho > self.max_similares:
+            return cliente.delete(chave_indice)
+        return None
+
+    def gravar(self, intencao, user_message, dados_ixc, cpf, nome_cliente, resposta, com_historico=False):
+        """Guarda a resposta crua do Mistral. com_historico: o contexto do Mistral tinha turnos anteriores."""
+        try:
+            gravacao = self._gravacao(intencao, user_message, dados_ixc, cpf, nome_cliente, resposta, com_historico)
+            if gravacao is None:
+                return False
+            pipe = self.redis.pipeline(transaction=False)
+            self._pipeline_gravar(pipe, *gravacao)
+            resultados = pipe.execute()
+            if len(resultados) > 1:  # HLEN do índice de similares no fim do pipeline
+                self._podar(self.redis, gravacao[3], resultados[-1])
+            return True
+        except Exception as e:
+            log.erro("cache_respostas_falhou", operacao="gravar", erro=str(e))
+            return False
+
+    async def gravar_async(self, intencao, user_message, dados_ixc, cpf, nome_cliente, resposta, com_historico=False):
+        try:
+            gravacao = self._gravacao(intencao, user_message, dados_ixc, cpf, nome_cliente, resposta, com_historico)
+            if gravacao is None:
+                return False
+            pipe = self.redis_async.pipeline(transaction=False)
+            self._pipeline_gravar(pipe, *gravacao)
+            resultados = await pipe.execute()
+            if len(resultados) > 1:
+                podar = self._podar(self.redis_async, gravacao[3], resultados[-1])
+                if podar is not None:
+                    await podar
+            return True
+        except Exception as e:
+            log.erro("cache_respostas_falhou", operacao="gravar", erro=str(e))
+            return False
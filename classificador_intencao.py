@@ -0,0 +1,261 @@
+import hashlib
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+# Classificador local de intenções, na frente do DeepSeek.
+# Camada 1: regras (regex compiladas) para as frases curtas e óbvias, incluindo CPF puro.
+# Camada 2: TF-IDF + centróide por intenção (classificador linear por similaridade de cosseno),
+#           treinado com os exemplos abaixo e, opcionalmente, com um JSONL de mensagens rotuladas.
+#           "outros" tem exemplos próprios (classe negativa): pedidos fora das intenções conhecidas
+#           vão para ela em vez de cair no centróide mais próximo.
+# O resultado do modelo só é aceito (confiavel) com confiança >= limiar, margem para a 2ª colocada
+# >= margem_min e intenção diferente de "outros"; o resto sobe para o DeepSeek. Limiar e margem
+# são calibrados (calibrar) num conjunto separado dos exemplos de treino (VALIDACAO e, opcionalmente,
+# um JSONL), pela maior cobertura com precisão mínima.
+
+# Rótulos usados pelo backend (regras de negócio e PROMPT do Mistral)
+INTENCOES = [
+    "consulta_boleto",
+    "consulta_status_plano",
+    "estou_sem_internet",
+    "consulta_dados_cadastro",
+    "consulta_valor_plano",
+    "falar_com_atendente",
+    "reclamacao",
+    "elogio",
+    "saudacao",
+    "despedida",
+    "informar_cpf",
+    "outros",
+]
+
+# Rótulos que o DeepSeek costuma devolver para as mesmas intenções
+INTENCOES_EQUIVALENTES = {
+    "suporte_internet": "estou_sem_internet",
+    "sem_internet": "estou_sem_internet",
+    "consulta_cadastro": "consulta_dados_cadastro",
+    "reclamar_atendimento": "reclamacao",
+    "elogiar_servico": "elogio",
+}
+
+def normalizar_intencao(intencao):
+    return INTENCOES_EQUIVALENTES.get(intencao, intencao or "outros")
+
+def normalizar_texto(texto):
+    texto = unicodedata.normalize("NFKD", (texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return re.sub(r"\s+", " ", texto).strip()
+
+def hash_texto(texto_normalizado):
+    return hashlib.sha1(texto_normalizado.encode("utf-8")).hexdigest()
+
+# Regras sobre o texto normalizado (sem acento, minúsculo). A mensagem inteira precisa casar,
+# para que "oi, estou sem internet" não seja classificado como saudação.
+REGRAS = [
+    ("informar_cpf", re.compile(r"^(\d{11}|\d{3} \d{3} \d{3} \d{2})$")),  # CPF sozinho, com ou sem pontuação
+    ("saudacao", re.compile(r"^(oi+|ola|ole|opa|eai|e ai|bom dia|boa tarde|boa noite|hello|hi)( tudo bem| tudo bom| geovana)?$")),
+    ("despedida", re.compile(r"^(obrigad[oa]|valeu|vlw|brigad[oa]|tchau|ate mais|ate logo|falou|ok obrigad[oa]|muito obrigad[oa])( geovana)?$")),
+    ("consulta_boleto", re.compile(r"^((quero|preciso|manda|me manda|envia|me envia|segunda via|2 via|2a via)( d?a| d?o| meu| minha)? )?(boleto|fatura|segunda via|2 via|2a via|conta)( por favor| pf| pfv)?$")),
+    ("estou_sem_internet", re.compile(r"^(estou |to |tou |fiquei |estamos )?sem (internet|net|conexao|sinal)( desde \w+| de novo| aqui)?$")),
+    ("consulta_valor_plano", re.compile(r"^(qual (e )?)?(o )?valor do (meu )?plano$")),
+    ("consulta_status_plano", re.compile(r"^(qual (e )?)?(o )?status do (meu )?(plano|contrato)$")),
+    ("falar_com_atendente", re.compile(r"^(quero |preciso )?(falar com )?(um |uma )?(atendente|humano|pessoa)$")),
+]
+
+EXEMPLOS = {
+    "consulta_boleto": [
+        "quero meu boleto", "preciso da segunda via do boleto", "me manda a fatura", "boleto do mes",
+        "quero pagar minha conta", "como pago o boleto", "qual o codigo de barras", "manda o pix para pagar",
+        "vencimento da fatura", "quando vence meu boleto", "link do boleto", "linha digitavel",
+    ],
+    "consulta_status_plano": [
+        "qual o status do meu plano", "meu contrato esta ativo", "meu plano esta bloqueado",
+        "minha internet foi cortada por falta de pagamento", "situacao do contrato", "status da minha conexao",
+    ],
+    "estou_sem_internet": [
+        "estou sem internet", "internet caiu", "a net nao funciona", "sem conexao desde ontem",
+        "internet muito lenta", "wifi nao conecta", "luz vermelha no roteador", "modem piscando",
+        "a internet parou", "nao tenho sinal", "caiu a conexao",
+    ],
+    "consulta_dados_cadastro": [
+        "quero ver meus dados cadastrais", "qual endereco esta no cadastro", "meus dados", "atualizar cadastro",
+        "qual telefone cadastrado", "confere meu cadastro",
+    ],
+    "consulta_valor_plano": [
+        "qual o valor do plano", "quanto pago por mes", "valor da mensalidade", "quanto custa meu plano",
+        "preco do plano", "qual minha mensalidade",
+    ],
+    "falar_com_atendente": [
+        "quero falar com um atendente", "me transfere para um humano", "falar com uma pessoa",
+        "atendimento humano", "chama um atendente",
+    ],
+    "reclamacao": [
+        "pessimo atendimento", "quero fazer uma reclamacao", "servico horrivel", "estou insatisfeito",
+        "absurdo isso", "vou cancelar essa porcaria",
+    ],
+    "elogio": [
+        "otimo atendimento", "parabens pelo servico", "voces sao otimos", "muito bom", "excelente atendimento",
+    ],
+    "saudacao": ["oi", "ola", "bom dia", "boa tarde", "boa noite", "oi tudo bem", "ola geovana"],
+    "despedida": ["obrigado", "valeu", "tchau", "ate mais", "obrigada pela ajuda", "era so isso"],
+    "outros": [
+        "qual o horario de funcionamento", "que horas voces abrem", "onde fica a loja de voces",
+        "quero contratar internet", "quais planos voces tem", "quero mudar de endereco", "voces atendem no meu bairro",
+        "qual o telefone da empresa", "quero trocar a senha do wifi", "tem fibra na minha rua",
+        "quero cancelar o contrato", "quero mudar meu plano", "voces vendem roteador", "como funciona a instalacao",
+    ],
+}
+
+# Conjunto separado dos EXEMPLOS (frases diferentes), usado só para calibrar limiar e margem
+VALIDACAO = {
+    "consulta_boleto": [
+        "me envia o boleto desse mes", "preciso pagar a fatura atrasada", "qual a data de vencimento",
+        "manda o codigo do boleto", "quero a segunda via da conta",
+    ],
+    "consulta_status_plano": ["meu plano esta ativo", "minha conexao foi bloqueada", "o contrato ta suspenso"],
+    "estou_sem_internet": [
+        "a internet nao ta funcionando", "roteador com luz vermelha", "internet lenta demais hoje",
+        "sem net desde cedo", "o wifi caiu de novo",
+    ],
+    "consulta_dados_cadastro": ["quais dados tenho no cadastro", "confere meu endereco cadastrado", "ver meu cadastro"],
+    "consulta_valor_plano": ["quanto custa a mensalidade", "qual o preco que eu pago", "valor do meu plano mensal"],
+    "falar_com_atendente": ["quero atendimento com uma pessoa", "me passa para um atendente humano"],
+    "reclamacao": ["atendimento pessimo de voces", "estou muito insatisfeito com o servico", "que absurdo"],
+    "elogio": ["parabens pelo atendimento", "servico excelente", "voces sao muito bons"],
+    "saudacao": ["ola bom dia", "oi boa tarde"],
+    "despedida": ["muito obrigado pela ajuda", "valeu ate mais"],
+    "outros": [
+        "qual o horario de atendimento de voces", "voces abrem no domingo", "onde eu pago em dinheiro na loja",
+        "quero contratar um plano novo", "tem plano de 500 mega", "como faco para mudar de endereco",
+        "voces tem loja no centro", "quero trocar o nome da rede wifi", "voces instalam em condominio",
+        "qual o cnpj da empresa",
+    ],
+}
+
+def _tokens(texto_normalizado):
+    palavras = texto_normalizado.split()
+    feats = list(palavras)
+    feats += [f"{a}_{b}" for a, b in zip(palavras, palavras[1:])]
+    # trigramas de caracteres deixam o modelo tolerante a erros de digitação ("bolto", "intenet")
+    for p in palavras:
+        p = f"#{p}#"
+        feats += [f"c:{p[i:i + 3]}" for i in range(len(p) - 2)]
+    return feats
+
+class ModeloTfidf:
+    def __init__(self, exemplos):
+        docs = [(intencao, _tokens(normalizar_texto(t))) for intencao, textos in exemplos.items() for t in textos]
+        df = Counter()
+        for _, feats in docs:
+            df.update(set(feats))
+        n = len(docs)
+        self.idf = {f: math.log((1 + n) / (1 + c)) + 1 for f, c in df.items()}
+        somas = defaultdict(Counter)
+        for intencao, feats in docs:
+            for f, v in self._vetor(feats).items():
+                somas[intencao][f] += v
+        self.centroides = {intencao: self._normalizar(vetor) for intencao, vetor in somas.items()}
+
+    def _vetor(self, feats):
+        tf = Counter(f for f in feats if f in self.idf)
+        return self._normalizar({f: (1 + math.log(c)) * self.idf[f] for f, c in tf.items()})
+
+    @staticmethod
+    def _normalizar(vetor):
+        norma = math.sqrt(sum(v * v for v in vetor.values())) or 1.0
+        return {f: v / norma for f, v in vetor.items()}
+
+    def prever(self, texto_normalizado):
+        """
+        Retorna (intencao, confianca, margem). A margem é a distância relativa para a 2ª colocada;
+        a confiança combina a similaridade e a margem.
+        """
+        vetor = self._vetor(_tokens(texto_normalizado))
+        if not vetor:
+            return "outros", 0.0, 0.0
+        scores = sorted(
+            ((sum(v * c.get(f, 0.0) for f, v in vetor.items()), intencao) for intencao, c in self.centroides.items()),
+            reverse=True,
+        )
+        (melhor, intencao), (segundo, _) = scores[0], scores[1]
+        margem = (melhor - segundo) / melhor if melhor > 0 else 0.0
+        return intencao, round(melhor * 0.5 + margem * 0.5, 4), round(margem, 4)
+
+def carregar_exemplos(caminho=None, embutidos=EXEMPLOS, variavel="CLASSIFICADOR_EXEMPLOS"):
+    """Exemplos embutidos + JSONL opcional ({"texto": ..., "intencao": ...} por linha)."""
+    exemplos = {k: list(v) for k, v in embutidos.items()}
+    caminho = caminho or os.getenv(variavel)
+    if caminho and os.path.exists(caminho):
+        with open(caminho, encoding="utf-8") as f:
+            for linha in f:
+                if linha.strip():
+                    item = json.loads(linha)
+                    exemplos.setdefault(normalizar_intencao(item["intencao"]), []).append(item["texto"])
+    return exemplos
+
+def carregar_validacao(caminho=None):
+    """VALIDACAO + JSONL opcional (CLASSIFICADOR_VALIDACAO), no mesmo formato dos exemplos."""
+    return carregar_exemplos(caminho, VALIDACAO, "CLASSIFICADOR_VALIDACAO")
+
+class ClassificadorLocal:
+    def __init__(self, exemplos=None, limiar=0.35, margem_min=0.15):
+        self.modelo = ModeloTfidf(exemplos or carregar_exemplos())
+        self.limiar = limiar
+        self.margem_min = margem_min
+
+    def confiavel(self, resultado):
+        """True se o resultado de classificar pode ser usado sem consultar o DeepSeek."""
+        if resultado["fonte"] == "regra":
+            return True
+        return (
+            resultado["intencao"] != "outros"
+            and resultado["confianca"] >= self.limiar
+            and resultado.get("margem", 0.0) >= self.margem_min
+        )
+
+    def calibrar(self, validacao=None, precisao_min=0.95, margens=(0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.4)):
+        """
+        Escolhe (limiar, margem_min) com a maior cobertura (mensagens aceitas sem DeepSeek) cuja precisão
+        no conjunto de validação é >= precisao_min. Mensagens de "outros" aceitas com outra intenção
+        contam como erro. Sem combinação que atinja a precisão, o modelo não aceita nada (limiar > 1).
+        Atualiza o classificador e retorna {"limiar", "margem_min", "precisao", "cobertura"}.
+        """
+        validacao = validacao or carregar_validacao()
+        previstos = []
+        for intencao, textos in validacao.items():
+            for texto in textos:
+                prevista, confianca, margem = self.modelo.prever(normalizar_texto(texto))
+                if prevista != "outros":
+                    previstos.append((confianca, margem, prevista == intencao))
+        total = sum(len(t) for t in validacao.values()) or 1
+        melhor = {"limiar": 1.01, "margem_min": max(margens), "precisao": 1.0, "cobertura": 0.0}
+        for margem_min in margens:
+            for limiar in sorted({c for c, _, _ in previstos}):
+                aceitos = [certo for c, m, certo in previstos if c >= limiar and m >= margem_min]
+                if not aceitos:
+                    continue
+                precisao = sum(aceitos) / len(aceitos)
+                cobertura = len(aceitos) / total
+                if precisao >= precisao_min and cobertura > melhor["cobertura"]:
+                    melhor = {"limiar": limiar, "margem_min": margem_min, "precisao": round(precisao, 4),
+                              "cobertura": round(cobertura, 4)}
+        self.limiar, self.margem_min = melhor["limiar"], melhor["margem_min"]
+        return melhor
+
+    def classificar(self, mensagem):
+        """Retorna {"intencao", "entidades", "confianca", "fonte"} sem nenhuma chamada de rede."""
+        texto = normalizar_texto(mensagem)
+        entidades = {}
+        cpf = re.search(r"\b\d{11}\b", texto)
+        if cpf:
+            entidades["cpf"] = cpf.group(0)
+        for intencao, regra in REGRAS:
+            if regra.match(texto):
+                return {"intencao": intencao, "entidades": entidades, "confianca": 1.0, "fonte": "regra"}
+        intencao, confianca, margem = self.modelo.prever(texto)
+        return {"intencao": intencao, "entidades": entidades, "confianca": confianca, "margem": margem, "fonte": "modelo"}
@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+import requests
+import prazo
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Cliente HTTP compartilhado para todos os serviços externos (MegaAPI, Mistral, DeepSeek, IXC/n8n, Make.com).
+# Cada upstream tem uma Session própria com keep-alive, então o handshake TCP+TLS é feito uma vez
+# por conexão do pool e não a cada chamada.
+
+# O pool deve acompanhar quantas threads podem chamar o mesmo upstream ao mesmo tempo: workers da fila,
+# executores de prefetch e de tools, senders do WhatsApp e threads do servidor web (WEB_THREADS, o
+# mesmo valor do --threads do gunicorn).
+# Com menos conexões que threads, o urllib3 descarta as excedentes ("Connection pool is full") e o
+# keep-alive se perde justamente sob carga. Mesmas variáveis e padrões de app.py.
+def _concorrencia_padrao():
+    return sum(int(os.getenv(var, padrao)) for var, padrao in (
+        ("FILA_WORKERS", 4),
+        ("PREFETCH_MAX_WORKERS", 32),
+        ("TOOLS_MAX_WORKERS", 16),
+        ("WHATSAPP_SENDERS", 2),
+        ("WEB_THREADS", 8),
+    ))
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", _concorrencia_padrao()))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05))
+
+# Configuração por upstream:
+# - timeout: timeout de leitura padrão (segundos), sobrescrevível por UPSTREAM_TIMEOUT_<NOME>
+# - status_retries: quantas vezes repetir em 429/502/503/504. Só para chamadas sem efeito colateral;
+#   MegaAPI, Make.com e escrita no IXC não repetem por status para não duplicar mensagem/OS.
+#   Feito em post()/post_async(), não no urllib3: a espera (Retry-After ou backoff) só acontece se
+#   couber no orçamento do turno (ver prazo.py).
+# Erros de conexão (requisição não chegou ao servidor) são sempre repetidos pelo urllib3.
+UPSTREAMS = {
+    "megaapi": {"timeout": 10, "status_retries": 0},
+    "mistral": {"timeout": 45, "status_retries": 1},
+    "deepseek": {"timeout": 15, "status_retries": 1},
+    "ixc": {"timeout": 30, "status_retries": 1},
+    "ixc_escrita": {"timeout": 30, "status_retries": 0},
+    "make": {"timeout": 30, "status_retries": 0},
+}
+
+for _nome, _cfg in UPSTREAMS.items():
+    _cfg["timeout"] = float(os.getenv(f"UPSTREAM_TIMEOUT_{_nome.upper()}", _cfg["timeout"]))
+
+HTTP_CONNECT_RETRIES = int(os.getenv("HTTP_CONNECT_RETRIES", 2))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", 0.3))
+
+_sessoes = {}
+_lock = threading.Lock()
+
+def _criar_sessao(nome):
+    retry = Retry(
+        total=None,
+        connect=HTTP_CONNECT_RETRIES,
+        read=0,
+        status=0,  # retry por status é feito em post(), respeitando o prazo do turno
+        allowed_methods=None,  # inclui POST; o controle fino é feito por connect/read acima
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session(nome):
+    session = _sessoes.get(nome)
+    if session is None:
+        with _lock:
+            session = _sessoes.get(nome)
+            if session is None:
+                session = _criar_sessao(nome)
+                _sessoes[nome] = session
+    return session
+
+def timeout_padrao(nome):
+    return (HTTP_CONNECT_TIMEOUT, UPSTREAMS[nome]["timeout"])
+
+STATUS_RETRY = (429, 502, 503, 504)
+
+def _espera_retry(resp, tentativa):
+    """Segundos até a próxima tentativa (Retry-After do upstream ou backoff), ou None se não cabe no turno."""
+    espera = resp.headers.get("Retry-After")
+    try:
+        espera = float(espera)
+    except (TypeError, ValueError):
+        espera = HTTP_RETRY_BACKOFF * (2 ** tentativa)
+    if prazo.esgotado(espera + prazo.TIMEOUT_MINIMO):
+        return None  # a nova tentativa não caberia no orçamento do turno
+    return espera
+
+def post(nome, url, timeout=None, **kwargs):
+    """
+    POST pelo pool do upstream `nome`. Sem timeout explícito, usa o padrão do upstream.
+    Dentro de um turno, o timeout fica limitado ao que resta do orçamento (ver prazo.py);
+    429/502/503/504 são repetidos até status_retries vezes, só se a espera couber no orçamento.
+    """
+    if timeout is None:
+        timeout = timeout_padrao(nome)
+    tentativas = UPSTREAMS[nome]["status_retries"]
+    for tentativa in range(tentativas + 1):
+        try:
+            resp = get_session(nome).post(url, timeout=prazo.timeout_chamada(timeout, nome), **kwargs)
+        except requests.exceptions.Timeout as e:
+            if prazo.esgotado():
+                raise prazo.OrcamentoEsgotado(f"Orçamento do turno esgotado em {nome}") from e
+            raise
+        if resp.status_code not in STATUS_RETRY or tentativa == tentativas:
+            return resp
+        espera = _espera_retry(resp, tentativa)
+        if espera is None:
+            return resp
+        resp.close()  # devolve a conexão ao pool antes de esperar
+        time.sleep(espera)
+    return resp
+
+# --- Cliente assíncrono (app_async.py) ---
+# Um httpx.AsyncClient por upstream, com os mesmos timeouts e a mesma política de retry do pool síncrono.
+# httpx só é importado quando a variante asyncio é usada.
+
+HTTP_ASYNC_POOL_SIZE = int(os.getenv("HTTP_ASYNC_POOL_SIZE", 100))
+
+_clientes_async = {}
+
+def get_async_client(nome):
+    cliente = _clientes_async.get(nome)
+    if cliente is None:
+        import httpx
+        limites = httpx.Limits(max_connections=HTTP_ASYNC_POOL_SIZE, max_keepalive_connections=HTTP_ASYNC_POOL_SIZE)
+        # retries do transport cobrem só falhas de conexão, como o connect= do Retry síncrono
+        transport = httpx.AsyncHTTPTransport(retries=HTTP_CONNECT_RETRIES, limits=limites)
+        cliente = httpx.AsyncClient(transport=transport, timeout=_timeout_async(timeout_padrao(nome)))
+        _clientes_async[nome] = cliente
+    return cliente
+
+def _timeout_async(timeout):
+    import httpx
+    if isinstance(timeout, tuple):
+        connect, leitura = timeout
+        return httpx.Timeout(leitura, connect=connect)
+    return httpx.Timeout(timeout)
+
+async def post_async(nome, url, timeout=None, **kwargs):
+    """Equivalente assíncrono de post(); repete 429/502/503/504 até status_retries vezes."""
+    import asyncio
+    import httpx
+    if timeout is None:
+        timeout = timeout_padrao(nome)
+    cliente = get_async_client(nome)
+    tentativas = UPSTREAMS[nome]["status_retries"]
+    for tentativa in range(tentativas + 1):
+        try:
+            resp = await cliente.post(url, timeout=_timeout_async(prazo.timeout_chamada(timeout, nome)), **kwargs)
+        except httpx.TimeoutException as e:
+            if prazo.esgotado():
+                raise prazo.OrcamentoEsgotado(f"Orçamento do turno esgotado em {nome}") from e
+            raise
+        if resp.status_code not in STATUS_RETRY or tentativa == tentativas:
+            return resp
+        espera = _espera_retry(resp, tentativa)
+        if espera is None:
+            return resp
+        await asyncio.sleep(espera)
+    return resp
+
+async def fechar_clientes_async():
+    for cliente in list(_clientes_async.values()):
+        await cliente.aclose()
+    _clientes_async.clear()
@@ -0,0 +1,117 @@
+import copy
+import json
+import re
+import time
+
+# Agrupamento de mensagens por conversa (remoteJid) antes da fila de processamento.
+# Usuários de WhatsApp costumam mandar várias mensagens curtas seguidas ("oi", "to sem internet",
+# "desde ontem"); em vez de um turno (DeepSeek + Mistral + envio) por mensagem, as mensagens que
+# chegam dentro da janela viram um único turno.
+# - coalescer:{remoteJid}:pendentes: lista com os payloads ainda não despachados.
+# - coalescer:prazos: ZSET remoteJid -> instante em que a janela fecha. Cada mensagem nova empurra o
+#   prazo para agora + janela, limitado a janela_max depois da primeira mensagem do grupo.
+# - coalescer:{remoteJid}:em_andamento: marca que um turno da conversa está na fila/em processamento.
+#   Enquanto existir, o despachante não solta o próximo turno: as mensagens que chegam nesse meio
+#   tempo se acumulam e saem juntas, na ordem, depois que o turno atual termina.
+# O texto agrupado tem uma linha por mensagem: quem procura o CPF informado usa cpf_informado, que
+# olha cada linha (um grupo "oi" + "123.456.789-01" não é um CPF, mas traz um).
+
+def cpf_informado(texto):
+    """CPF (só os 11 dígitos) mandado sozinho em alguma linha do texto, com ou sem pontuação; ou None."""
+    for linha in (texto or "").splitlines():
+        digitos = re.sub(r"[.\-\s]", "", linha)
+        if digitos.isdigit() and len(digitos) == 11:
+            return digitos
+    return None
+
+class CoalescedorMensagens:
+    PRAZOS = "coalescer:prazos"
+
+    def __init__(self, redis_client, janela=1.5, janela_max=5.0, ttl_em_andamento=360, lote=100):
+        self.redis = redis_client
+        self.janela = janela
+        self.janela_max = janela_max
+        # Deve cobrir todas as tentativas de um turno na fila; se o worker sumir, a conversa destrava sozinha
+        self.ttl_em_andamento = ttl_em_andamento
+        self.lote = lote
+
+    def _pendentes(self, remote_jid):
+        return f"coalescer:{remote_jid}:pendentes"
+
+    def _primeira(self, remote_jid):
+        return f"coalescer:{remote_jid}:primeira"
+
+    def _em_andamento(self, remote_jid):
+        return f"coalescer:{remote_jid}:em_andamento"
+
+    def _pipeline_adicionar(self, pipe, remote_jid, data, agora):
+        pipe.rpush(self._pendentes(remote_jid), json.dumps(data, ensure_ascii=False))
+        pipe.set(self._primeira(remote_jid), agora, nx=True, ex=int(self.janela_max) + 60)
+        pipe.get(self._primeira(remote_jid))
+
+    def _prazo(self, agora, primeira):
+        return min(agora + self.janela, float(primeira or agora) + self.janela_max)
+
+    def adicionar(self, remote_jid, data):
+        """Guarda a mensagem no grupo da conversa e (re)agenda o fechamento da janela."""
+        agora = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        self._pipeline_adicionar(pipe, remote_jid, data, agora)
+        _, _, primeira = pipe.execute()
+        self.redis.zadd(self.PRAZOS, {remote_jid: self._prazo(agora, primeira)})
+
+    async def adicionar_async(self, redis_async, remote_jid, data):
+        agora = time.time()
+        pipe = redis_async.pipeline(transaction=False)
+        self._pipeline_adicionar(pipe, remote_jid, data, agora)
+        _, _, primeira = await pipe.execute()
+        await redis_async.zadd(self.PRAZOS, {remote_jid: self._prazo(agora, primeira)})
+
+    def agrupar(self, payloads):
+        """Um único payload com os textos de todas as mensagens, na ordem em que chegaram."""
+        base = copy.deepcopy(payloads[-1])
+        textos = [
+            p.get("message", {}).get("extendedTextMessage", {}).get("text")
+            for p in payloads
+        ]
+        textos = [t for t in textos if t]
+        if len(payloads) > 1 and textos:
+            base.setdefault("message", {}).setdefault("extendedTextMessage", {})["text"] = "\n".join(textos)
+            base["mensagens_agrupadas"] = len(payloads)
+        recebidos = [p["recebido_em"] for p in payloads if p.get("recebido_em")]
+        if recebidos:
+            # A espera na fila conta desde a primeira mensagem do grupo (ver prazo.py)
+            base["recebido_em"] = min(recebidos)
+        return base
+
+    def liberar_prontas(self):
+        """
+        Fecha as janelas vencidas e devolve [(remoteJid, payload agrupado)] para enfileirar.
+        Seguro com vários despachantes: só quem remove a conversa do ZSET fica com ela.
+        """
+        agora = time.time()
+        prontas = []
+        for remote_jid in self.redis.zrangebyscore(self.PRAZOS, "-inf", agora, start=0, num=self.lote):
+            if not self.redis.zrem(self.PRAZOS, remote_jid):
+                continue  # outro despachante pegou
+            if not self.redis.set(self._em_andamento(remote_jid), "1", nx=True, ex=self.ttl_em_andamento):
+                # Turno anterior ainda em andamento: mantém as mensagens esperando e tenta de novo depois
+                self.redis.zadd(self.PRAZOS, {remote_jid: agora + self.janela}, nx=True)
+                continue
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.lrange(self._pendentes(remote_jid), 0, -1)
+            pipe.delete(self._pendentes(remote_jid), self._primeira(remote_jid))
+            brutos, _ = pipe.execute()
+            if not brutos:
+                self.redis.delete(self._em_andamento(remote_jid))
+                continue
+            prontas.append((remote_jid, self.agrupar([json.loads(b) for b in brutos])))
+        return prontas
+
+    def concluir(self, remote_jid):
+        """Chamado ao fim do turno (ack ou dead-letter): libera o próximo grupo da conversa."""
+        self.redis.delete(self._em_andamento(remote_jid))
+
+    def lock_turno(self, remote_jid, timeout=120, espera=30):
+        """Lock por conversa para o caminho síncrono (/webhook): turnos da mesma conversa em série."""
+        return self.redis.lock(f"coalescer:{remote_jid}:turno", timeout=timeout, blocking_timeout=espera)
@@ -0,0 +1,84 @@
+import json
+import math
+
+# Montagem do contexto e do corpo das requisições ao Mistral.
+# - montar_mensagens: corta memórias e histórico para caber em um orçamento de tokens, na ordem de
+#   prioridade: prompt do sistema, dados do cliente, turnos recentes da mesma intenção, memórias.
+# - PayloadMistral: serializa uma única vez (na subida do app) as partes constantes do corpo
+#   (PROMPT, schema das tools, parâmetros) e, no loop de tool_calls, só serializa as mensagens novas.
+
+CHARS_POR_TOKEN = 3.5  # estimativa conservadora para português
+TOKENS_POR_MENSAGEM = 4  # overhead de role/separadores por mensagem
+
+def estimar_tokens(mensagem):
+    conteudo = mensagem.get("content") or ""
+    if not isinstance(conteudo, str):
+        conteudo = json.dumps(conteudo, ensure_ascii=False)
+    return math.ceil(len(conteudo) / CHARS_POR_TOKEN) + TOKENS_POR_MENSAGEM
+
+def _dentro_do_orcamento(candidatas, disponivel):
+    """Seleciona das mais recentes para as mais antigas enquanto couber; devolve em ordem cronológica."""
+    escolhidas = []
+    for m in reversed(candidatas):
+        custo = estimar_tokens(m)
+        if custo > disponivel:
+            break
+        disponivel -= custo
+        escolhidas.append(m)
+    escolhidas.reverse()
+    return escolhidas, disponivel
+
+def montar_mensagens(mensagem_prompt, fatos_cliente, turnos, memorias, mensagem_usuario, mensagem_intencao, orcamento):
+    """
+    Monta a lista de mensagens do Mistral dentro de `orcamento` tokens (estimados).
+    Prompt, dados do cliente, mensagem do usuário e intenção detectada sempre entram; turnos da mesma
+    intenção preenchem o que sobrar, e as memórias do Mem0AI só entram se ainda houver espaço.
+    """
+    obrigatorias = [mensagem_prompt] + fatos_cliente + [mensagem_usuario, mensagem_intencao]
+    disponivel = orcamento - sum(estimar_tokens(m) for m in obrigatorias)
+    turnos_escolhidos, disponivel = _dentro_do_orcamento(turnos, disponivel)
+    # A mensagem atual do usuário sempre vai por último: não deixa dois "user" seguidos no fim do histórico
+    while turnos_escolhidos and turnos_escolhidos[-1].get("role") == "user":
+        disponivel += estimar_tokens(turnos_escolhidos.pop())
+    memorias_escolhidas, disponivel = _dentro_do_orcamento(memorias, disponivel)
+    return (
+        [mensagem_prompt]
+        + fatos_cliente
+        + memorias_escolhidas
+        + turnos_escolhidos
+        + [mensagem_usuario, mensagem_intencao]
+    )
+
+class PayloadMistral:
+    def __init__(self, agent_id, prompt, tools, parametros):
+        self.mensagem_prompt = {"role": "system", "content": prompt}
+        self.tools = tools
+        self._prompt_json = json.dumps(self.mensagem_prompt, ensure_ascii=False)
+        self._tools_json = json.dumps(tools, ensure_ascii=False)
+        base = dict(parametros, agent_id=agent_id)
+        # Corpo fixo sem as chaves finais; as mensagens (e tools) entram no fim
+        self._prefixo = json.dumps(base, ensure_ascii=False)[:-1]
+        self.tokens_prompt = estimar_tokens(self.mensagem_prompt)
+
+    def serializar(self, messages, tools=None, memo=None):
+        """
+        Corpo JSON da requisição. `memo` (dict id(mensagem) -> JSON) evita reserializar, a cada
+        iteração do loop de tool_calls, as mensagens que já foram enviadas na iteração anterior.
+        """
+        partes = []
+        for m in messages:
+            if m is self.mensagem_prompt:
+                partes.append(self._prompt_json)
+                continue
+            if memo is None:
+                partes.append(json.dumps(m, ensure_ascii=False))
+                continue
+            s = memo.get(id(m))
+            if s is None:
+                s = memo[id(m)] = json.dumps(m, ensure_ascii=False)
+            partes.append(s)
+        if tools is self.tools:
+            tools_json = self._tools_json
+        else:
+            tools_json = json.dumps(tools, ensure_ascii=False)
+        return f'{self._prefixo},"tools":{tools_json},"messages":[{",".join(partes)}]}}'
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Ingestão idempotente dos webhooks da MegaAPI pelo key.id da mensagem.
+# Quando o handler demora, a MegaAPI reentrega a mesma mensagem; sem deduplicação isso vira outra
+# classificação, outra chamada ao Mistral e outra resposta no WhatsApp.
+# - Checagem autoritativa: SET NX webhook:visto:{id} com TTL (vale entre processos).
+# - Filtro local: os últimos IDs vistos por este processo, para responder a duplicatas quentes
+#   (reentregas em sequência) sem round trip ao Redis.
+# Contadores de recebidas/duplicadas ficam no hash webhook:deduplicacao (todos os processos), inclusive
+# para as duplicatas barradas no filtro local (só os HINCRBY, sem o SET NX); quantas dessas foram
+# barradas localmente fica só no processo.
+
+class DeduplicadorMensagens:
+    CONTADORES = "webhook:deduplicacao"
+
+    def __init__(self, redis_client, ttl=60 * 60 * 24, max_recentes=5000):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.max_recentes = max_recentes
+        self._recentes = OrderedDict()  # id -> instante em que foi visto
+        self._lock = threading.Lock()
+        self.duplicadas_locais = 0
+
+    def _chave(self, msg_id):
+        return f"webhook:visto:{msg_id}"
+
+    @staticmethod
+    def id_mensagem(data):
+        if not isinstance(data, dict):
+            return None
+        return (data.get("key") or {}).get("id")
+
+    def _visto_localmente(self, msg_id):
+        with self._lock:
+            visto_em = self._recentes.get(msg_id)
+            if visto_em is None:
+                return False
+            if visto_em + self.ttl < time.monotonic():
+                del self._recentes[msg_id]
+                return False
+            self.duplicadas_locais += 1
+            return True
+
+    def _lembrar(self, msg_id):
+        with self._lock:
+            self._recentes[msg_id] = time.monotonic()
+            self._recentes.move_to_end(msg_id)
+            while len(self._recentes) > self.max_recentes:
+                self._recentes.popitem(last=False)
+
+    def _pipeline_registrar(self, pipe, msg_id):
+        pipe.set(self._chave(msg_id), "1", nx=True, ex=self.ttl)
+        pipe.hincrby(self.CONTADORES, "recebidas", 1)
+
+    def _pipeline_contar_local(self, pipe):
+        # Duplicata barrada no filtro local também entra na taxa de /webhook/estatisticas
+        pipe.hincrby(self.CONTADORES, "recebidas", 1)
+        pipe.hincrby(self.CONTADORES, "duplicadas", 1)
+
+    def duplicada(self, data):
+        """True se a mensagem já foi recebida antes. Sem key.id, nunca é tratada como duplicada."""
+        msg_id = self.id_mensagem(data)
+        if not msg_id:
+            return False
+        if self._visto_localmente(msg_id):
+            pipe = self.redis.pipeline(transaction=False)
+            self._pipeline_contar_local(pipe)
+            pipe.execute()
+            return True
+        pipe = self.redis.pipeline(transaction=False)
+        self._pipeline_registrar(pipe, msg_id)
+        nova, _ = pipe.execute()
+        self._lembrar(msg_id)
+        if not nova:
+            self.redis.hincrby(self.CONTADORES, "duplicadas", 1)
+        return not nova
+
+    async def duplicada_async(self, redis_async, data):
+        msg_id = self.id_mensagem(data)
+        if not msg_id:
+            return False
+        if self._visto_localmente(msg_id):
+            pipe = redis_async.pipeline(transaction=False)
+            self._pipeline_contar_local(pipe)
+            await pipe.execute()
+            return True
+        pipe = redis_async.pipeline(transaction=False)
+        self._pipeline_registrar(pipe, msg_id)
+        nova, _ = await pipe.execute()
+        self._lembrar(msg_id)
+        if not nova:
+            await redis_async.hincrby(self.CONTADORES, "duplicadas", 1)
+        return not nova
+
+    def esquecer(self, data):
+        """Libera o ID para uma nova entrega (ex: o processamento falhou e a reentrega deve ser aceita)."""
+        msg_id = self.id_mensagem(data)
+        if not msg_id:
+            return
+        with self._lock:
+            self._recentes.pop(msg_id, None)
+        self.redis.delete(self._chave(msg_id))
+
+    async def esquecer_async(self, redis_async, data):
+        msg_id = self.id_mensagem(data)
+        if not msg_id:
+            return
+        with self._lock:
+            self._recentes.pop(msg_id, None)
+        await redis_async.delete(self._chave(msg_id))
+
+    def estatisticas(self):
+        contadores = self.redis.hgetall(self.CONTADORES)
+        recebidas = int(contadores.get("recebidas", 0))
+        duplicadas = int(contadores.get("duplicadas", 0))
+        return {
+            "recebidas": recebidas,
+            "duplicadas": duplicadas,
+            "taxa_duplicadas": round(duplicadas / recebidas, 4) if recebidas else 0.0,
+            "duplicadas_filtro_local": self.duplicadas_locais,  # só deste processo
+        }
@@ -0,0 +1,241 @@
+import threading
+import time
+from logs import obter_logger
+from metricas import DISJUNTOR_TOTAL
+from prazo import OrcamentoEsgotado
+
+# Circuit breaker por upstream (IXC/n8n, Mistral, DeepSeek), com estado compartilhado entre processos no Redis.
+# - fechado: chamadas passam; resultados entram numa janela de `janela` segundos. Com pelo menos
+#   `min_chamadas` na janela e taxa de falhas >= `limiar`, abre. Chamadas mais lentas que
+#   `latencia_max` contam como falha (upstream degradado segura threads tanto quanto um fora do ar).
+# - aberto: chamadas falham na hora com CircuitoAberto (sem rede e, em geral, sem Redis: o estado é
+#   lido do Redis no máximo a cada `cache_estado` segundos) e quem chama usa o fallback.
+# - meio aberto: passado `tempo_aberto`, uma única chamada de sonda (SET NX no Redis) testa o upstream;
+#   sucesso fecha o disjuntor, falha reabre por mais `tempo_aberto`.
+# Chaves: disjuntor:{nome} (HASH estado/aberto_ate), disjuntor:{nome}:janela:{n} (HASH total/falhas),
+# disjuntor:{nome}:sonda (dono da sonda). Sem Redis, o disjuntor fica fechado (não derruba o atendimento).
+
+# Registra o resultado de uma chamada e devolve {estado, aberto_ate} resultantes
+_SCRIPT_REGISTRAR = """
+local sucesso = tonumber(ARGV[1])
+local agora = tonumber(ARGV[2])
+local janela = tonumber(ARGV[3])
+local min_chamadas = tonumber(ARGV[4])
+local limiar = tonumber(ARGV[5])
+local tempo_aberto = tonumber(ARGV[6])
+local sonda = tonumber(ARGV[7])
+if sonda == 1 then
+    redis.call('DEL', KEYS[3])
+    if sucesso == 1 then
+        redis.call('DEL', KEYS[1], KEYS[2])
+        return {'fechado', '0'}
+    end
+    redis.call('HSET', KEYS[1], 'estado', 'aberto', 'aberto_ate', agora + tempo_aberto)
+    return {'aberto', tostring(agora + tempo_aberto)}
+end
+local atual = redis.call('HMGET', KEYS[1], 'estado', 'aberto_ate')
+if atual[1] == 'aberto' or atual[1] == 'meio_aberto' then
+    return {atual[1], atual[2] or '0'}
+end
+local total = redis.call('HINCRBY', KEYS[2], 'total', 1)
+local falhas = tonumber(redis.call('HGET', KEYS[2], 'falhas') or '0')
+if sucesso == 0 then
+    falhas = redis.call('HINCRBY', KEYS[2], 'falhas', 1)
+end
+if total == 1 then
+    redis.call('EXPIRE', KEYS[2], math.ceil(janela * 2))
+end
+if total >= min_chamadas and falhas / total >= limiar then
+    redis.call('HSET', KEYS[1], 'estado', 'aberto', 'aberto_ate', agora + tempo_aberto)
+    redis.call('DEL', KEYS[2])
+    return {'aberto', tostring(agora + tempo_aberto)}
+end
+return {'fechado', '0'}
+"""
+
+log = obter_logger("disjuntor")
+
+class CircuitoAberto(Exception):
+    pass
+
+class Disjuntor:
+    def __init__(self, redis_client, nome, falha=None, limiar=0.5, min_chamadas=10, janela=30.0,
+                 tempo_aberto=30.0, latencia_max=None, tempo_sonda=60, cache_estado=0.5):
+        self.redis = redis_client
+        self.nome = nome
+        self.falha = falha  # falha(resultado) -> True quando o retorno (sem exceção) indica erro do upstream
+        self.limiar = limiar
+        self.min_chamadas = min_chamadas
+        self.janela = janela
+        self.tempo_aberto = tempo_aberto
+        self.latencia_max = latencia_max
+        self.tempo_sonda = tempo_sonda
+        self.cache_estado = cache_estado
+        self.chave = f"disjuntor:{nome}"
+        self._chave_sonda = f"disjuntor:{nome}:sonda"
+        self._registrar = redis_client.register_script(_SCRIPT_REGISTRAR)
+        self._registrar_async = None
+        self._local = ("fechado", 0.0, 0.0)  # (estado, aberto_ate, lido_em)
+        self._lock = threading.Lock()
+
+    def _chave_janela(self, agora):
+        return f"{self.chave}:janela:{int(agora // self.janela)}"
+
+    def _atualizar_local(self, estado, aberto_ate=0.0):
+        anterior = self._local[0]
+        with self._lock:
+            self._local = (estado, aberto_ate, time.monotonic())
+        if estado != anterior:
+            DISJUNTOR_TOTAL.labels(self.nome, estado).inc()
+            log.aviso("estado_alterado", disjuntor=self.nome, de=anterior, para=estado)
+
+    def _estado_local(self):
+        """(estado, aberto_ate) do cache local, ou None se precisa reler do Redis."""
+        estado, aberto_ate, lido_em = self._local
+        if time.monotonic() - lido_em < self.cache_estado:
+            return estado, aberto_ate
+        return None
+
+    def _de_redis(self, valores):
+        estado, aberto_ate = valores
+        estado = estado or "fechado"
+        aberto_ate = float(aberto_ate or 0)
+        self._atualizar_local(estado, aberto_ate)
+        return estado, aberto_ate
+
+    def _decidir(self, estado, aberto_ate):
+        """True: passa; False: falha rápido; None: tentar virar a sonda (meio aberto)."""
+        if estado == "fechado":
+            return True
+        if estado == "aberto" and time.time() < aberto_ate:
+            return False
+        return None
+
+    def _rejeitar(self):
+        DISJUNTOR_TOTAL.labels(self.nome, "rejeitada").inc()
+        raise CircuitoAberto(f"Disjuntor {self.nome} aberto")
+
+    def _falhou(self, resultado, duracao):
+        if self.latencia_max is not None and duracao > self.latencia_max:
+            return True
+        return bool(self.falha and self.falha(resultado))
+
+    def _args_registro(self, sucesso, sonda):
+        agora = time.time()
+        return (
+            [self.chave, self._chave_janela(agora), self._chave_sonda],
+            [1 if sucesso else 0, agora, self.janela, self.min_chamadas, self.limiar, self.tempo_aberto, 1 if sonda else 0],
+        )
+
+    def _de_registro(self, resultado):
+        estado, aberto_ate = (v.decode() if isinstance(v, bytes) else v for v in resultado)
+        self._atualizar_local(estado, float(aberto_ate or 0))
+
+    # --- síncrono ---
+
+    def permitir(self):
+        """Retorna True se a chamada é a sonda do meio aberto; levanta CircuitoAberto se deve falhar rápido."""
+        local = self._estado_local()
+        try:
+            estado, aberto_ate = local or self._de_redis(self.redis.hmget(self.chave, "estado", "aberto_ate"))
+            decisao = self._decidir(estado, aberto_ate)
+            if decisao is None:
+                if not self.redis.set(self._chave_sonda, "1", nx=True, ex=self.tempo_sonda):
+                    self._rejeitar()
+                self.redis.hset(self.chave, "estado", "meio_aberto")
+                self._atualizar_local("meio_aberto")
+                DISJUNTOR_TOTAL.labels(self.nome, "sonda").inc()
+                return True
+        except CircuitoAberto:
+            raise
+        except Exception as e:
+            log.erro("redis_indisponivel", disjuntor=self.nome, erro=str(e))
+            return False
+        if decisao is False:
+            self._rejeitar()
+        return False
+
+    def registrar(self, sucesso, sonda=False):
+        try:
+            chaves, args = self._args_registro(sucesso, sonda)
+            self._de_registro(self._registrar(keys=chaves, args=args))
+        except Exception as e:
+            log.erro("redis_indisponivel", disjuntor=self.nome, erro=str(e))
+
+    def _liberar_sonda(self, sonda):
+        # Chamada não chegou a testar o upstream (ex: orçamento do turno): outra pode sondar
+        if sonda:
+            try:
+                self.redis.delete(self._chave_sonda)
+            except Exception:
+                pass
+
+    def executar(self, fn, *args, **kwargs):
+        """Chama fn passando pelo disjuntor. CircuitoAberto quando aberto; exceções de fn contam como falha."""
+        sonda = self.permitir()
+        inicio = time.monotonic()
+        try:
+            resultado = fn(*args, **kwargs)
+        except OrcamentoEsgotado:
+            self._liberar_sonda(sonda)
+            raise
+        except Exception:
+            self.registrar(False, sonda)
+            raise
+        self.registrar(not self._falhou(resultado, time.monotonic() - inicio), sonda)
+        return resultado
+
+    # --- asyncio (app_async.py): mesma lógica com redis.asyncio ---
+
+    async def permitir_async(self, redis_async):
+        local = self._estado_local()
+        try:
+            if local is None:
+                local = self._de_redis(await redis_async.hmget(self.chave, "estado", "aberto_ate"))
+            decisao = self._decidir(*local)
+            if decisao is None:
+                if not await redis_async.set(self._chave_sonda, "1", nx=True, ex=self.tempo_sonda):
+                    self._rejeitar()
+                await redis_async.hset(self.chave, "estado", "meio_aberto")
+                self._atualizar_local("meio_aberto")
+                DISJUNTOR_TOTAL.labels(self.nome, "sonda").inc()
+                return True
+        except CircuitoAberto:
+            raise
+        except Exception as e:
+            log.erro("redis_indisponivel", disjuntor=self.nome, erro=str(e))
+            return False
+        if decisao is False:
+            self._rejeitar()
+        return False
+
+    async def registrar_async(self, redis_async, sucesso, sonda=False):
+        try:
+            if self._registrar_async is None:
+                self._registrar_async = redis_async.register_script(_SCRIPT_REGISTRAR)
+            chaves, args = self._args_registro(sucesso, sonda)
+            self._de_registro(await self._registrar_async(keys=chaves, args=args))
+        except Exception as e:
+            log.erro("redis_indisponivel", disjuntor=self.nome, erro=str(e))
+
+    async def executar_async(self, redis_async, fn, *args, **kwargs):
+        sonda = await self.permitir_async(redis_async)
+        inicio = time.monotonic()
+        try:
+            resultado = await fn(*args, **kwargs)
+        except OrcamentoEsgotado:
+            if sonda:
+                try:
+                    await redis_async.delete(self._chave_sonda)
+                except Exception:
+                    pass
+            raise
+        except Exception:
+            await self.registrar_async(redis_async, False, sonda)
+            raise
+        await self.registrar_async(redis_async, not self._falhou(resultado, time.monotonic() - inicio), sonda)
+        return resultado
+
+    def status(self):
+        estado, aberto_ate = self.redis.hmget(self.chave, "estado", "aberto_ate")
+        return {"estado": estado or "fechado", "aberto_ate": float(aberto_ate) if aberto_ate else None}
@@ -0,0 +1,179 @@
+import time
+
+# Estado da conversa em um único hash Redis por remoteJid (conversa:{remoteJid}).
+# Carregado com um round trip no início do turno (HGETALL em pipeline) e gravado com um round trip
+# no fim (pipeline com HSET/HDEL/EXPIRE), não importa quantos helpers leiam ou alterem campos.
+# Hash do Redis não tem TTL por campo, então cada campo tem um campo irmão "<campo>:expira" com o
+# timestamp de expiração; campos vencidos são descartados na leitura e removidos na próxima gravação.
+# O TTL da chave acompanha o campo que expira por último.
+
+SUFIXO_EXPIRA = ":expira"
+
+# Chaves separadas usadas antes do hash; migradas para o hash na primeira gravação da conversa.
+# Só são lidas (um round trip a mais) enquanto o hash não tem o campo MIGRADO, gravado junto com a
+# migração; com ler_legado=False (ESTADO_LER_LEGADO=0, depois da janela de migração) nunca são lidas.
+CHAVES_LEGADAS = {
+    "cpf": "conversa:{remoteJid}:cpf",
+    "cumprimentou": "conversa:{remoteJid}:cumprimentou",
+}
+MIGRADO = "_migrado"
+
+class EstadoConversa:
+    def __init__(self, redis_client, remoteJid, campos=None, cache_local=None, legado=None, redis_async=None):
+        self.redis = redis_client
+        self.redis_async = redis_async  # cliente redis.asyncio, usado por carregar_async/salvar_async
+        self.remoteJid = remoteJid
+        self.chave = f"conversa:{remoteJid}"
+        self.cache_local = cache_local
+        self._campos = dict(campos or {})  # campo -> (valor, expira_em)
+        self._alterados = set()
+        self._removidos = set()
+        self._legado = legado or []  # chaves legadas a apagar na próxima gravação
+        self._migrado = False  # hash já tem o marcador MIGRADO
+
+    @staticmethod
+    def _precisa_legado(bruto, ler_legado):
+        return ler_legado and MIGRADO not in bruto
+
+    @staticmethod
+    def _pipeline_legado(pipe, remoteJid):
+        for modelo in CHAVES_LEGADAS.values():
+            pipe.get(modelo.format(remoteJid=remoteJid))
+
+    @classmethod
+    def _montar(cls, redis_client, remoteJid, bruto, legados, cache_local, ttls_legado, redis_async=None):
+        agora = time.time()
+        campos = {}
+        removidos = set()
+        for campo, valor in bruto.items():
+            if campo.endswith(SUFIXO_EXPIRA) or campo == MIGRADO:
+                continue
+            expira_em = float(bruto.get(campo + SUFIXO_EXPIRA) or "inf")
+            if expira_em <= agora:
+                removidos.add(campo)
+                continue
+            campos[campo] = (valor, expira_em)
+        estado = cls(redis_client, remoteJid, campos, cache_local=cache_local, redis_async=redis_async)
+        estado._removidos = removidos
+        estado._migrado = MIGRADO in bruto
+        ttls_legado = ttls_legado or {}
+        for campo, valor in legados.items():
+            if valor is None:
+                continue
+            estado._legado.append(CHAVES_LEGADAS[campo].format(remoteJid=remoteJid))
+            if campo not in campos:
+                estado.set(campo, valor, ttls_legado.get(campo))
+        return estado
+
+    @classmethod
+    def carregar(cls, redis_client, remoteJid, cache_local=None, ttls_legado=None, ler_legado=True):
+        chave = f"conversa:{remoteJid}"
+
+        def _ler():
+            bruto = redis_client.hgetall(chave)
+            if not cls._precisa_legado(bruto, ler_legado):
+                return bruto, {}
+            pipe = redis_client.pipeline(transaction=False)
+            cls._pipeline_legado(pipe, remoteJid)
+            return bruto, dict(zip(CHAVES_LEGADAS, pipe.execute()))
+
+        if cache_local is not None:
+            bruto, legados = cache_local.obter(chave, _ler)
+        else:
+            bruto, legados = _ler()
+        return cls._montar(redis_client, remoteJid, bruto, legados, cache_local, ttls_legado)
+
+    @classmethod
+    async def carregar_async(cls, redis_client, redis_async, remoteJid, cache_local=None, ttls_legado=None,
+                             ler_legado=True):
+        chave = f"conversa:{remoteJid}"
+        lido = cache_local.get(chave, None) if cache_local is not None else None
+        if lido is None:
+            versao = cache_local.versao(chave) if cache_local is not None else None
+            bruto = await redis_async.hgetall(chave)
+            legados = {}
+            if cls._precisa_legado(bruto, ler_legado):
+                pipe = redis_async.pipeline(transaction=False)
+                cls._pipeline_legado(pipe, remoteJid)
+                legados = dict(zip(CHAVES_LEGADAS, await pipe.execute()))
+            lido = (bruto, legados)
+            if cache_local is not None:
+                cache_local.set(chave, lido, versao=versao)
+        bruto, legados = lido
+        return cls._montar(redis_client, remoteJid, bruto, legados, cache_local, ttls_legado, redis_async=redis_async)
+
+    def get(self, campo, padrao=None):
+        item = self._campos.get(campo)
+        if item is None:
+            return padrao
+        valor, expira_em = item
+        if expira_em <= time.time():
+            return padrao
+        return valor
+
+    def set(self, campo, valor, ttl=None):
+        expira_em = time.time() + ttl if ttl else float("inf")
+        self._campos[campo] = (str(valor), expira_em)
+        self._alterados.add(campo)
+        self._removidos.discard(campo)
+
+    def remover(self, campo):
+        self._campos.pop(campo, None)
+        self._alterados.discard(campo)
+        self._removidos.add(campo)
+
+    def _marcar_migrado(self):
+        # Só marca hash com campos: um hash só com o marcador ficaria sem TTL
+        return not self._migrado and bool(self._campos)
+
+    def pendente(self):
+        return bool(self._alterados or self._removidos or self._legado or self._marcar_migrado())
+
+    def _pipeline_salvar(self, pipe):
+        if self._alterados or self._marcar_migrado():
+            mapping = {}
+            for campo in self._alterados:
+                valor, expira_em = self._campos[campo]
+                mapping[campo] = valor
+                mapping[campo + SUFIXO_EXPIRA] = "inf" if expira_em == float("inf") else f"{expira_em:.3f}"
+            if self._marcar_migrado():
+                mapping[MIGRADO] = "1"
+            pipe.hset(self.chave, mapping=mapping)
+        if self._removidos:
+            pipe.hdel(self.chave, *[c for campo in self._removidos for c in (campo, campo + SUFIXO_EXPIRA)])
+        if self._legado:
+            pipe.delete(*self._legado)
+        expiracoes = [expira_em for _, expira_em in self._campos.values()]
+        if expiracoes and max(expiracoes) != float("inf"):
+            pipe.expireat(self.chave, int(max(expiracoes)) + 1)
+        elif expiracoes:
+            pipe.persist(self.chave)
+
+    def _limpar_pendencias(self):
+        self._migrado = self._migrado or bool(self._campos)
+        self._alterados.clear()
+        self._removidos.clear()
+        self._legado = []
+
+    def salvar(self):
+        """Grava todas as alterações do turno em um único pipeline. Sem alterações, não faz round trip."""
+        if not self.pendente():
+            return False
+        pipe = self.redis.pipeline(transaction=True)
+        self._pipeline_salvar(pipe)
+        pipe.execute()
+        self._limpar_pendencias()
+        if self.cache_local is not None:
+            self.cache_local.invalidar(self.chave)
+        return True
+
+    async def salvar_async(self):
+        if not self.pendente():
+            return False
+        pipe = self.redis_async.pipeline(transaction=True)
+        self._pipeline_salvar(pipe)
+        await pipe.execute()
+        self._limpar_pendencias()
+        if self.cache_local is not None:
+            await self.cache_local.invalidar_async(self.chave, self.redis_async)
+        return True
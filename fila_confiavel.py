@@ -0,0 +1,101 @@
+import json
+import random
+import time
+from logs import obter_logger
+
+# Fila confiável de turnos no Redis (o webhook só enfileira; os workers de app.py processam).
+# - fila:mensagens: LIST com os itens a processar (LPUSH na entrada, consumo pela direita).
+# - fila:processando: LIST com os itens entregues a um worker. O worker move o item atomicamente de
+#   fila:mensagens para cá (BRPOPLPUSH) e, ao terminar, faz o ack (remove daqui).
+# - fila:processando:prazos: ZSET item -> prazo de visibilidade. Se o worker morrer ou travar, o
+#   reaper (devolver_travadas) devolve o item para a fila depois do prazo.
+# - fila:tentativas: HASH id -> número de entregas do item.
+# - fila:mensagens:mortas: LIST com os itens que esgotaram as tentativas (ou nem deram para ler).
+# Falha transitória (exceção ou status 5xx do turno): o item fica em processamento com o prazo de
+# visibilidade trocado pelo backoff, e o reaper o devolve para a fila quando o backoff vence. Só vai
+# para a lista de mortas depois de max_tentativas entregas.
+
+log = obter_logger("fila")
+
+class FilaConfiavel:
+    MENSAGENS = "fila:mensagens"
+    PROCESSANDO = "fila:processando"
+    PRAZOS = "fila:processando:prazos"
+    TENTATIVAS = "fila:tentativas"
+    MORTAS = "fila:mensagens:mortas"
+
+    def __init__(self, redis_client, visibilidade=120, max_tentativas=3, backoff_base=5.0, backoff_max=60.0):
+        self.redis = redis_client
+        self.visibilidade = visibilidade
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def enfileirar(self, msg):
+        self.redis.lpush(self.MENSAGENS, json.dumps(msg))
+
+    def reservar(self, timeout=5):
+        """Próximo item (JSON bruto) já em processamento com prazo de visibilidade, ou None."""
+        raw = self.redis.brpoplpush(self.MENSAGENS, self.PROCESSANDO, timeout=timeout)
+        if raw:
+            self.redis.zadd(self.PRAZOS, {raw: time.time() + self.visibilidade})
+        return raw
+
+    def registrar_entrega(self, msg_id):
+        """Conta mais uma entrega do item e devolve o total."""
+        return self.redis.hincrby(self.TENTATIVAS, msg_id, 1)
+
+    def _pipeline_remover(self, pipe, raw, msg_id):
+        pipe.lrem(self.PROCESSANDO, 1, raw)
+        pipe.zrem(self.PRAZOS, raw)
+        if msg_id:
+            pipe.hdel(self.TENTATIVAS, msg_id)
+
+    def ack(self, raw, msg_id=None):
+        pipe = self.redis.pipeline()
+        self._pipeline_remover(pipe, raw, msg_id)
+        pipe.execute()
+
+    def mover_para_mortas(self, raw, msg_id=None):
+        pipe = self.redis.pipeline()
+        pipe.lpush(self.MORTAS, raw)
+        self._pipeline_remover(pipe, raw, msg_id)
+        pipe.execute()
+
+    def reagendar(self, raw, msg_id, tentativas):
+        """Falha transitória: deixa o item em processamento para o reaper devolver depois do backoff."""
+        espera = min(self.backoff_max, self.backoff_base * (2 ** (tentativas - 1))) * random.uniform(0.5, 1.5)
+        self.redis.zadd(self.PRAZOS, {raw: time.time() + espera})
+        log.aviso("reagendada", msg_id=msg_id, tentativa=tentativas, espera_s=round(espera, 1))
+        return espera
+
+    def falhar(self, raw, msg_id, tentativas):
+        """Reagenda com backoff ou, esgotadas as tentativas (ou sem id), move para mortas. True se morreu."""
+        if msg_id is None or tentativas >= self.max_tentativas:
+            self.mover_para_mortas(raw, msg_id)
+            return True
+        self.reagendar(raw, msg_id, tentativas)
+        return False
+
+    def devolver_travadas(self):
+        """
+        Devolve para a fila os itens cujo prazo de visibilidade expirou.
+        Itens em processamento sem prazo registrado (worker morreu entre o BRPOPLPUSH e o ZADD)
+        recebem um prazo agora e serão devolvidos no próximo ciclo.
+        """
+        agora = time.time()
+        for raw in self.redis.lrange(self.PROCESSANDO, 0, -1):
+            self.redis.zadd(self.PRAZOS, {raw: agora + self.visibilidade}, nx=True)
+        devolvidas = 0
+        for raw in self.redis.zrangebyscore(self.PRAZOS, "-inf", agora):
+            pipe = self.redis.pipeline()
+            pipe.lrem(self.PROCESSANDO, 1, raw)
+            pipe.zrem(self.PRAZOS, raw)
+            removidos, _ = pipe.execute()
+            if removidos:
+                # RPUSH: volta para a frente da fila (o consumo é pela direita)
+                self.redis.rpush(self.MENSAGENS, raw)
+                devolvidas += 1
+        if devolvidas:
+            log.aviso("travadas_devolvidas", quantidade=devolvidas)
+        return devolvidas
@@ -0,0 +1,125 @@
+import json
+import time
+
+# Histórico local da conversa no Redis, com o Mem0AI como armazenamento de apoio.
+# - historico:{user_id}: ring buffer (lista limitada por LTRIM) com os turnos user/assistant.
+# - historico:{user_id}:intencao:{intencao}: índice secundário por intenção, com a mesma entrada.
+# Cada entrada é marcada na escrita com a intenção e a flag de dado sensível, então montar o
+# contexto do Mistral é um LRANGE dos últimos N da intenção, sem varrer memórias nem palavras.
+# O Mem0AI só é lido no cold start (conversa sem histórico local) para popular o store.
+
+PALAVRAS_SENSIVEIS = [
+    "cpf", "endereço", "address", "contrato", "boleto de r$", "nome", "razao_social", "telefone", "pix",
+    "linha_digitavel", "url_pdf", "gateway_link", "senha", "login", "mac", "ipv4",
+]
+
+def contem_dado_sensivel(texto):
+    texto = (texto or "").lower()
+    return any(x in texto for x in PALAVRAS_SENSIVEIS)
+
+class HistoricoConversa:
+    def __init__(self, redis_client, max_turnos=50, max_por_intencao=20, ttl=60 * 60 * 24 * 7, redis_async=None):
+        self.redis = redis_client
+        self.redis_async = redis_async  # cliente redis.asyncio para as variantes *_async
+        self.max_turnos = max_turnos
+        self.max_por_intencao = max_por_intencao
+        self.ttl = ttl
+
+    def _chave(self, user_id):
+        return f"historico:{user_id}"
+
+    def _chave_intencao(self, user_id, intencao):
+        return f"historico:{user_id}:intencao:{intencao}"
+
+    def _chave_sincronizado(self, user_id):
+        return f"historico:{user_id}:sincronizado"
+
+    def entrada(self, role, content, intencao=None, origem="turno"):
+        return {
+            "role": role,
+            "content": content,
+            "intencao": intencao or "outros",
+            "sensivel": contem_dado_sensivel(content),
+            "origem": origem,  # "turno" (mensagem da conversa) ou "mem0" (memória importada)
+            "ts": time.time(),
+        }
+
+    def _pipeline_adicionar(self, pipe, user_id, entradas):
+        chave = self._chave(user_id)
+        indices = set()
+        for e in entradas:
+            bruto = json.dumps(e, ensure_ascii=False)
+            pipe.rpush(chave, bruto)
+            chave_intencao = self._chave_intencao(user_id, e["intencao"])
+            pipe.rpush(chave_intencao, bruto)
+            indices.add(chave_intencao)
+        pipe.ltrim(chave, -self.max_turnos, -1)
+        pipe.expire(chave, self.ttl)
+        for chave_intencao in indices:
+            pipe.ltrim(chave_intencao, -self.max_por_intencao, -1)
+            pipe.expire(chave_intencao, self.ttl)
+        pipe.set(self._chave_sincronizado(user_id), "1", ex=self.ttl)
+
+    def adicionar(self, user_id, entradas):
+        """Grava as entradas no ring buffer e nos índices por intenção em um único pipeline."""
+        if not entradas:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        self._pipeline_adicionar(pipe, user_id, entradas)
+        pipe.execute()
+
+    async def adicionar_async(self, user_id, entradas):
+        if not entradas:
+            return
+        pipe = self.redis_async.pipeline(transaction=False)
+        self._pipeline_adicionar(pipe, user_id, entradas)
+        await pipe.execute()
+
+    def _chave_leitura(self, user_id, intencao):
+        return self._chave_intencao(user_id, intencao) if intencao else self._chave(user_id)
+
+    def ultimos(self, user_id, intencao=None, n=10):
+        """Últimas n entradas (da intenção, se informada), em ordem cronológica."""
+        return [json.loads(b) for b in self.redis.lrange(self._chave_leitura(user_id, intencao), -n, -1)]
+
+    async def ultimos_async(self, user_id, intencao=None, n=10):
+        return [json.loads(b) for b in await self.redis_async.lrange(self._chave_leitura(user_id, intencao), -n, -1)]
+
+    def sincronizado(self, user_id):
+        return bool(self.redis.exists(self._chave_sincronizado(user_id)))
+
+    async def sincronizado_async(self, user_id):
+        return bool(await self.redis_async.exists(self._chave_sincronizado(user_id)))
+
+    def _entradas_mem0(self, historico, classificar):
+        memorias = historico.get("results", []) if isinstance(historico, dict) else (historico or [])
+        entradas = []
+        for m in memorias:
+            if not isinstance(m, dict):
+                continue
+            texto = m.get("memory") or m.get("content")
+            if not texto:
+                continue
+            entradas.append(self.entrada(m.get("role", "user"), texto, classificar(texto), origem="mem0"))
+        return entradas
+
+    def importar_mem0(self, user_id, historico, classificar):
+        """
+        Cold start: popula o store com o retorno do mem0_client.get_all.
+        classificar(texto) -> intenção é usado para indexar as memórias importadas.
+        """
+        entradas = self._entradas_mem0(historico, classificar)
+        if entradas:
+            self.adicionar(user_id, entradas)
+        else:
+            # Marca como sincronizado mesmo sem memórias, para não consultar o Mem0AI de novo
+            self.redis.set(self._chave_sincronizado(user_id), "1", ex=self.ttl)
+        return len(entradas)
+
+    async def importar_mem0_async(self, user_id, historico, classificar):
+        entradas = self._entradas_mem0(historico, classificar)
+        if entradas:
+            await self.adicionar_async(user_id, entradas)
+        else:
+            await self.redis_async.set(self._chave_sincronizado(user_id), "1", ex=self.ttl)
+        return len(entradas)
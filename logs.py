@@ -0,0 +1,176 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+
+# Logs estruturados (uma linha JSON por evento) com níveis, amostragem por categoria e redação de PII.
+# O thread que processa o turno só monta o LogRecord e o coloca numa fila em memória; serialização,
+# redação e escrita no stdout ficam num QueueListener em background. Com a fila cheia o evento é
+# descartado (e contado) em vez de bloquear o atendimento.
+# Uso:
+#   log = obter_logger("ixc")
+#   log.info("consulta_ixc", cpf=cpf, duracao_ms=12)
+# Configuração:
+#   LOG_NIVEL=INFO                          nível mínimo (DEBUG, INFO, WARNING, ERROR)
+#   LOG_AMOSTRAGEM="mistral=0.1,fila=0.5"   fração dos eventos DEBUG/INFO mantida por categoria
+#   LOG_FILA_MAX=10000                      eventos pendentes antes de descartar
+
+LOG_NIVEL = os.getenv("LOG_NIVEL", "INFO").upper()
+LOG_FILA_MAX = int(os.getenv("LOG_FILA_MAX", 10000))
+
+# Campos mascarados pelo nome; o valor vira "***" + últimos 2 caracteres
+CAMPOS_SENSIVEIS = {
+    "cpf", "cpf_contexto", "phone", "telefone", "remote_jid", "remotejid", "user_id", "nome", "nome_cliente",
+    "razao_social", "endereco", "mensagem", "message", "user_message", "resposta", "content", "text",
+    "linha_digitavel", "url_pdf", "gateway_link", "senha", "login", "payload", "dados", "resumo", "args",
+}
+# Sequências de 10 a 13 dígitos (CPF, telefone) em texto livre
+_NUMERO_LONGO = re.compile(r"\d{10,13}")
+MAX_TAMANHO_CAMPO = 200
+
+def _parse_amostragem(valor):
+    taxas = {}
+    for item in (valor or "").split(","):
+        if "=" in item:
+            categoria, taxa = item.split("=", 1)
+            try:
+                taxas[categoria.strip()] = float(taxa)
+            except ValueError:
+                pass
+    return taxas
+
+AMOSTRAGEM = _parse_amostragem(os.getenv("LOG_AMOSTRAGEM"))
+
+# Identificador do turno em andamento; entra em todo evento logado dentro do turno (ver metricas.py)
+trace_id_atual = contextvars.ContextVar("trace_id", default=None)
+
+def mascarar(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, (dict, list, tuple)):
+        return f"<{type(valor).__name__} {len(valor)}>"
+    texto = str(valor)
+    return "***" + texto[-2:] if len(texto) > 4 else "***"
+
+def redigir(campos):
+    redigidos = {}
+    for nome, valor in campos.items():
+        if nome.lower() in CAMPOS_SENSIVEIS:
+            redigidos[nome] = mascarar(valor)
+        elif isinstance(valor, str):
+            valor = _NUMERO_LONGO.sub(lambda m: "***" + m.group()[-2:], valor)
+            redigidos[nome] = valor if len(valor) <= MAX_TAMANHO_CAMPO else valor[:MAX_TAMANHO_CAMPO] + "..."
+        elif isinstance(valor, (int, float, bool)):
+            redigidos[nome] = valor
+        elif isinstance(valor, (dict, list, tuple)):
+            redigidos[nome] = f"<{type(valor).__name__} {len(valor)}>"
+        else:
+            redigidos[nome] = str(valor)[:MAX_TAMANHO_CAMPO]
+    return redigidos
+
+# Chaves escritas pelo formatador; um campo de quem loga com o mesmo nome vai para "campo_<nome>"
+CHAVES_RESERVADAS = ("ts", "nivel", "categoria", "evento", "exc")
+
+class FormatadorJson(logging.Formatter):
+    def format(self, record):
+        campos = getattr(record, "campos", None)
+        evento = redigir(campos) if campos else {}
+        for chave in CHAVES_RESERVADAS:
+            if chave in evento:
+                evento[f"campo_{chave}"] = evento.pop(chave)
+        evento.update({
+            "ts": round(record.created, 3),
+            "nivel": record.levelname,
+            "categoria": record.name.rsplit(".", 1)[-1],
+            "evento": record.getMessage(),
+        })
+        if record.exc_text:
+            evento["exc"] = record.exc_text
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+class _QueueHandlerDescartando(logging.handlers.QueueHandler):
+    descartados = 0
+
+    def prepare(self, record):
+        # Não formata no thread de quem loga: só resolve a exceção (objetos de traceback não podem esperar na fila)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _QueueHandlerDescartando.descartados += 1
+
+class Log:
+    """Logger de uma categoria. Os campos são passados como kwargs e só serializados em background."""
+
+    def __init__(self, categoria):
+        self.categoria = categoria
+        self._logger = logging.getLogger(f"geovana.{categoria}")
+        self.taxa = AMOSTRAGEM.get(categoria, 1.0)
+
+    def _log(self, nivel, evento, campos, exc_info=False):
+        if not self._logger.isEnabledFor(nivel):
+            return
+        if nivel < logging.WARNING and self.taxa < 1.0 and random.random() >= self.taxa:
+            return
+        trace_id = trace_id_atual.get()
+        if trace_id:
+            campos["trace_id"] = trace_id
+        self._logger.log(nivel, evento, extra={"campos": campos}, exc_info=exc_info)
+
+    def ativo(self, nivel=logging.DEBUG):
+        """Para evitar montar valores caros (ex: dumps de debug) quando o nível está desligado."""
+        return self._logger.isEnabledFor(nivel)
+
+    def debug(self, evento, **campos):
+        self._log(logging.DEBUG, evento, campos)
+
+    def info(self, evento, **campos):
+        self._log(logging.INFO, evento, campos)
+
+    def aviso(self, evento, **campos):
+        self._log(logging.WARNING, evento, campos)
+
+    def erro(self, evento, exc_info=False, **campos):
+        self._log(logging.ERROR, evento, campos, exc_info=exc_info)
+
+_listener = None
+
+def configurar_logs(nivel=None, saida=None):
+    """Instala a fila + listener no logger "geovana". Idempotente."""
+    global _listener
+    if _listener is not None:
+        return _listener
+    raiz = logging.getLogger("geovana")
+    raiz.setLevel(getattr(logging, (nivel or LOG_NIVEL), logging.INFO))
+    raiz.propagate = False
+    fila = queue.Queue(maxsize=LOG_FILA_MAX)
+    raiz.addHandler(_QueueHandlerDescartando(fila))
+    destino = logging.StreamHandler(saida or sys.stdout)
+    destino.setFormatter(FormatadorJson())
+    _listener = logging.handlers.QueueListener(fila, destino, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+def descartados():
+    return _QueueHandlerDescartando.descartados
+
+_loggers = {}
+
+def obter_logger(categoria):
+    configurar_logs()
+    log = _loggers.get(categoria)
+    if log is None:
+        log = _loggers[categoria] = Log(categoria)
+    return log
@@ -0,0 +1,130 @@
+import asyncio
+import contextvars
+import functools
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from logs import trace_id_atual
+
+# Métricas de latência por etapa do webhook e contadores (cache, tools, intenções, erros), exportadas
+# no formato Prometheus em /metrics.
+# Vários processos (gunicorn, workers da fila): defina PROMETHEUS_MULTIPROC_DIR com um diretório
+# vazio e compartilhado antes de subir os processos; cada processo grava seus valores lá e o
+# /metrics agrega todos. Sem a variável, cada processo expõe só os próprios valores.
+# Só há Counters e Histograms (somados entre processos, inclusive os que já terminaram) e a
+# profundidade das filas, lida do Redis na hora do scrape: nenhum Gauge multiprocess, então não é
+# preciso marcar processos mortos (mark_process_dead só afeta gauges livesum/liveall).
+# trace_id: identificador do turno, propagado por contextvars para os logs (ver logs.py) e para as
+# threads de prefetch/tools (ver submeter_com_contexto).
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+
+ETAPA_SEGUNDOS = Histogram(
+    "geovana_etapa_segundos", "Duração de cada etapa do atendimento", ["etapa"], buckets=BUCKETS_SEGUNDOS,
+)
+# Espera entre o recebimento do webhook e o início do turno (fila, janela do coalescedor, reentregas);
+# fica fora do orçamento do turno (ver prazo.py)
+FILA_ESPERA_SEGUNDOS = Histogram(
+    "geovana_fila_espera_segundos", "Espera do recebimento do webhook até o início do turno",
+    buckets=BUCKETS_SEGUNDOS + (120, 300, 600),
+)
+CACHE_TOTAL = Counter("geovana_cache_total", "Consultas a caches por resultado", ["cache", "resultado"])
+TOOL_CALLS_TOTAL = Counter("geovana_tool_calls_total", "Tool calls executadas", ["tool"])
+INTENCOES_TOTAL = Counter("geovana_intencoes_total", "Intenções classificadas", ["intencao", "fonte"])
+RESPOSTAS_TOTAL = Counter("geovana_respostas_total", "Respostas por caminho (fixa, regra, template, cache, mistral)", ["caminho"])
+ERROS_TOTAL = Counter("geovana_erros_total", "Erros por etapa", ["etapa"])
+DISJUNTOR_TOTAL = Counter(
+    "geovana_disjuntor_total", "Eventos dos disjuntores (mudança de estado, sonda, chamada rejeitada)", ["disjuntor", "evento"],
+)
+
+def novo_trace_id(base=None):
+    """Define o trace_id do turno (usa o id da mensagem quando houver) e o retorna."""
+    trace_id = base or uuid.uuid4().hex[:16]
+    trace_id_atual.set(trace_id)
+    return trace_id
+
+def submeter_com_contexto(executor, fn, *args, **kwargs):
+    """executor.submit preservando o trace_id (ThreadPoolExecutor não copia contextvars)."""
+    contexto = contextvars.copy_context()
+    return executor.submit(contexto.run, fn, *args, **kwargs)
+
+@contextmanager
+def medir(etapa):
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERROS_TOTAL.labels(etapa).inc()
+        raise
+    finally:
+        ETAPA_SEGUNDOS.labels(etapa).observe(time.perf_counter() - inicio)
+
+def cronometrar(etapa):
+    """Decorador equivalente a `with medir(etapa)` em volta da função (síncrona ou corrotina)."""
+    def decorador(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def envolvida_async(*args, **kwargs):
+                with medir(etapa):
+                    return await fn(*args, **kwargs)
+            return envolvida_async
+
+        @functools.wraps(fn)
+        def envolvida(*args, **kwargs):
+            with medir(etapa):
+                return fn(*args, **kwargs)
+        return envolvida
+    return decorador
+
+def contar_cache(cache, resultado):
+    CACHE_TOTAL.labels(cache, resultado).inc()
+
+def contar_erro(etapa):
+    ERROS_TOTAL.labels(etapa).inc()
+
+class ColetorFilas:
+    """Profundidade das filas no Redis, lida na hora do scrape (vale para todos os processos)."""
+
+    def __init__(self, redis_client, filas):
+        self.redis = redis_client
+        self.filas = filas  # nome da métrica -> (chave, tipo: "list", "zset" ou "set")
+
+    def collect(self):
+        profundidade = GaugeMetricFamily("geovana_fila_profundidade", "Itens em cada fila do Redis", labels=["fila"])
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for chave, tipo in self.filas.values():
+                if tipo == "zset":
+                    pipe.zcard(chave)
+                elif tipo == "set":
+                    pipe.scard(chave)
+                else:
+                    pipe.llen(chave)
+            for nome, total in zip(self.filas, pipe.execute()):
+                profundidade.add_metric([nome], total)
+        except Exception:
+            ERROS_TOTAL.labels("metricas_filas").inc()
+        yield profundidade
+
+def exportar(coletor_filas=None):
+    """(corpo, content_type) do /metrics."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        if coletor_filas is not None:
+            registro.register(coletor_filas)
+        return generate_latest(registro), CONTENT_TYPE_LATEST
+    corpo = generate_latest(REGISTRY)
+    if coletor_filas is not None:
+        registro = CollectorRegistry()
+        registro.register(coletor_filas)
+        corpo += generate_latest(registro)
+    return corpo, CONTENT_TYPE_LATEST
@@ -0,0 +1,159 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from logs import obter_logger
+
+# Write-behind para o Mem0AI: o webhook só faz RPUSH da mensagem em um outbox no Redis e segue.
+# Um flusher em background agrupa as mensagens pendentes de cada user_id em uma única chamada
+# mem0_client.add, preservando a ordem (lista por user_id + lock por user_id, então só um
+# flusher envia para o mesmo usuário por vez), repete falhas com backoff e limita o número de
+# requisições por segundo ao Mem0 em rajadas.
+# O lock por user_id é renovado enquanto a chamada ao Mem0 (com os retries do próprio cliente) não
+# volta, então uma chamada lenta não deixa o lock expirar no meio; se mesmo assim o lock for perdido,
+# o lote não é removido da lista (quem assumiu o lock cuida dele).
+
+log = obter_logger("mem0")
+
+class OutboxMem0:
+    PENDENTES = "mem0:outbox:pendentes"  # SET de user_ids com mensagens no outbox
+    MORTAS = "mem0:outbox:mortas"
+
+    def __init__(self, redis_client, mem0_client, agent_id="geovana", tamanho_lote=20, intervalo=1.0,
+                 max_rps=5.0, max_tentativas=5, lock_ttl=60):
+        self.redis = redis_client
+        self.mem0 = mem0_client
+        self.agent_id = agent_id
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self.max_rps = max_rps
+        self.max_tentativas = max_tentativas
+        self.lock_ttl = lock_ttl
+        self._ultimo_envio = 0.0
+        self._rps_lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _fila(self, user_id):
+        return f"mem0:outbox:{user_id}"
+
+    def enfileirar(self, user_id, mensagem):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.rpush(self._fila(user_id), json.dumps(mensagem, ensure_ascii=False))
+        pipe.sadd(self.PENDENTES, user_id)
+        pipe.execute()
+
+    async def enfileirar_async(self, redis_async, user_id, mensagem):
+        pipe = redis_async.pipeline(transaction=False)
+        pipe.rpush(self._fila(user_id), json.dumps(mensagem, ensure_ascii=False))
+        pipe.sadd(self.PENDENTES, user_id)
+        await pipe.execute()
+
+    def _aguardar_vez(self):
+        # Limite simples de taxa por processo: no máximo max_rps chamadas ao Mem0 por segundo
+        if not self.max_rps:
+            return
+        with self._rps_lock:
+            espera = self._ultimo_envio + 1.0 / self.max_rps - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            self._ultimo_envio = time.monotonic()
+
+    @contextmanager
+    def _renovar_lock(self, lock):
+        """Renova o lock a cada lock_ttl/3 segundos até o bloco terminar."""
+        parar = threading.Event()
+
+        def renovar():
+            while not parar.wait(self.lock_ttl / 3):
+                try:
+                    lock.extend(self.lock_ttl, replace_ttl=True)
+                except Exception as e:
+                    log.aviso("renovar_lock_falhou", erro=str(e))
+                    return
+
+        thread = threading.Thread(target=renovar, name="mem0-outbox-lock", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            parar.set()
+            thread.join()
+
+    def flush_usuario(self, user_id):
+        """Envia o próximo lote do user_id. Retorna quantas mensagens foram confirmadas."""
+        # thread_local=False: o token precisa ser visível na thread que renova o lock (mem0-outbox-lock)
+        lock = self.redis.lock(f"mem0:outbox:{user_id}:lock", timeout=self.lock_ttl, blocking=False, thread_local=False)
+        if not lock.acquire():
+            return 0  # outro flusher já está enviando para esse usuário
+        try:
+            fila = self._fila(user_id)
+            brutos = self.redis.lrange(fila, 0, self.tamanho_lote - 1)
+            if not brutos:
+                self.redis.srem(self.PENDENTES, user_id)
+                # Uma mensagem pode ter chegado entre o LRANGE e o SREM
+                if self.redis.llen(fila):
+                    self.redis.sadd(self.PENDENTES, user_id)
+                return 0
+            mensagens = [json.loads(b) for b in brutos]
+            chave_tentativas = f"mem0:outbox:{user_id}:tentativas"
+            try:
+                self._aguardar_vez()
+                with self._renovar_lock(lock):
+                    self.mem0.add(mensagens, user_id=user_id, agent_id=self.agent_id)
+            except Exception as e:
+                tentativas = self.redis.incr(chave_tentativas)
+                self.redis.expire(chave_tentativas, 60 * 60)
+                log.erro("envio_falhou", user_id=user_id, mensagens=len(mensagens), tentativa=tentativas, erro=str(e))
+                if tentativas < self.max_tentativas:
+                    # Backoff exponencial: o lock fica preso até lá, então ninguém reenvia antes
+                    lock.extend(min(2 ** tentativas, self.lock_ttl), replace_ttl=True)
+                    lock = None
+                    return 0
+                # Desiste do lote, move para a lista de mortas e segue com as próximas mensagens
+                self.redis.rpush(self.MORTAS, json.dumps({"user_id": user_id, "mensagens": mensagens}, ensure_ascii=False))
+            if not lock.owned():
+                # Outro flusher assumiu o usuário e já leu o mesmo lote: não remove nada da lista
+                log.aviso("lock_perdido", user_id=user_id, mensagens=len(mensagens))
+                lock = None
+                return 0
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.ltrim(fila, len(brutos), -1)
+            pipe.delete(chave_tentativas)
+            pipe.execute()
+            log.debug("lote_gravado", user_id=user_id, mensagens=len(mensagens))
+            return len(mensagens)
+        finally:
+            if lock is not None:
+                try:
+                    lock.release()
+                except Exception:
+                    pass
+
+    def flush(self):
+        enviadas = 0
+        for user_id in self.redis.smembers(self.PENDENTES):
+            try:
+                enviadas += self.flush_usuario(user_id)
+            except Exception as e:
+                log.erro("flush_falhou", user_id=user_id, erro=str(e))
+        return enviadas
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                enviadas = self.flush()
+            except Exception as e:
+                log.erro("flusher_falhou", erro=str(e))
+                enviadas = 0
+            if not enviadas:
+                self._parar.wait(self.intervalo)
+
+    def iniciar(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="mem0-outbox", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def parar(self):
+        self._parar.set()
@@ -0,0 +1,233 @@
+import json
+import random
+import threading
+import time
+import uuid
+from logs import obter_logger
+
+# Envio de mensagens WhatsApp (MegaAPI) desacoplado do processamento da conversa.
+# Quem processa o turno só registra o envio no Redis e segue; threads de envio dedicadas entregam
+# respeitando um token bucket por INSTANCE_KEY (compartilhado entre processos), repetem falhas com
+# backoff exponencial + jitter e, esgotadas as tentativas, movem o envio para a lista de mortas.
+# - whatsapp:envio:{id}: HASH com telefone, mensagem, status, tentativas, último erro e horários.
+#   Sem TTL enquanto o envio está na fila; ttl_status conta a partir de enviada/morta.
+# - whatsapp:outbox:{instancia}:agendados: ZSET id -> instante a partir do qual pode ser enviado.
+# - whatsapp:outbox:{instancia}:enviando: ZSET id -> prazo; envios de um sender que morreu voltam
+#   para agendados depois do prazo.
+# - whatsapp:outbox:{instancia}:telefone:{phone}: LIST com os envios do telefone, na ordem em que
+#   foram registrados. Só o primeiro da lista fica em agendados/enviando: o próximo só é agendado
+#   quando o anterior termina (enviada ou morta). Assim as mensagens de um telefone saem na ordem,
+#   com qualquer número de senders e mesmo quando uma falha é repetida com backoff (a nova tentativa
+#   segura as mensagens seguintes do mesmo telefone; telefones diferentes seguem em paralelo).
+# Status: pendente -> enviando -> enviada | pendente (nova tentativa) | morta.
+
+# Token bucket atômico no Redis: devolve quantos segundos esperar pelo próximo token (0 = pode enviar)
+_SCRIPT_TOKEN_BUCKET = """
+local tokens_ts = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local taxa = tonumber(ARGV[1])
+local capacidade = tonumber(ARGV[2])
+local agora = tonumber(ARGV[3])
+local tokens = tonumber(tokens_ts[1]) or capacidade
+local ts = tonumber(tokens_ts[2]) or agora
+tokens = math.min(capacidade, tokens + math.max(0, agora - ts) * taxa)
+local espera = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    espera = (1 - tokens) / taxa
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', agora)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacidade / taxa) + 60)
+return tostring(espera)
+"""
+
+# Registra o envio na fila do telefone; só agenda se for o primeiro da fila
+_SCRIPT_ENFILEIRAR = """
+if redis.call('RPUSH', KEYS[1], ARGV[1]) == 1 then
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+end
+return 1
+"""
+
+# Tira o envio concluído da fila do telefone e agenda o próximo; devolve o id agendado (ou nada)
+_SCRIPT_PROXIMO = """
+if redis.call('LINDEX', KEYS[1], 0) ~= ARGV[1] then
+    redis.call('LREM', KEYS[1], 1, ARGV[1])
+    return false
+end
+redis.call('LPOP', KEYS[1])
+local proximo = redis.call('LINDEX', KEYS[1], 0)
+if proximo then
+    redis.call('ZADD', KEYS[2], ARGV[2], proximo)
+end
+return proximo
+"""
+
+log = obter_logger("whatsapp")
+
+class OutboxWhatsApp:
+    MORTAS = "whatsapp:outbox:mortas"
+
+    def __init__(self, redis_client, enviar, instancia, taxa=5.0, rajada=10, max_tentativas=5,
+                 backoff_base=1.0, backoff_max=60.0, visibilidade=60, ttl_status=60 * 60 * 24, lote=50):
+        self.redis = redis_client
+        self.enviar = enviar  # enviar(phone, message) -> resposta da MegaAPI; exceção em caso de falha
+        self.instancia = instancia or "padrao"
+        self.taxa = taxa
+        self.rajada = rajada
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.visibilidade = visibilidade
+        self.ttl_status = ttl_status
+        self.lote = lote
+        self.agendados = f"whatsapp:outbox:{self.instancia}:agendados"
+        self.enviando = f"whatsapp:outbox:{self.instancia}:enviando"
+        self._chave_bucket = f"whatsapp:bucket:{self.instancia}"
+        self._token_bucket = redis_client.register_script(_SCRIPT_TOKEN_BUCKET)
+        self._parar = threading.Event()
+        self._threads = []
+
+    def _chave(self, envio_id):
+        return f"whatsapp:envio:{envio_id}"
+
+    def _fila_telefone(self, phone):
+        return f"whatsapp:outbox:{self.instancia}:telefone:{phone}"
+
+    def _pipeline_enfileirar(self, pipe, phone, message):
+        envio_id = str(uuid.uuid4())
+        agora = time.time()
+        pipe.hset(self._chave(envio_id), mapping={
+            "phone": phone,
+            "message": message,
+            "status": "pendente",
+            "tentativas": 0,
+            "criado_em": agora,
+        })
+        pipe.eval(_SCRIPT_ENFILEIRAR, 2, self._fila_telefone(phone), self.agendados, envio_id, agora)
+        return envio_id
+
+    def enfileirar(self, phone, message):
+        """Registra o envio e retorna o id para consulta de status. Não faz chamada à MegaAPI."""
+        pipe = self.redis.pipeline(transaction=True)
+        envio_id = self._pipeline_enfileirar(pipe, phone, message)
+        pipe.execute()
+        return envio_id
+
+    async def enfileirar_async(self, redis_async, phone, message):
+        pipe = redis_async.pipeline(transaction=True)
+        envio_id = self._pipeline_enfileirar(pipe, phone, message)
+        await pipe.execute()
+        return envio_id
+
+    def status(self, envio_id):
+        dados = self.redis.hgetall(self._chave(envio_id))
+        if not dados:
+            return None
+        dados.pop("message", None)  # o status não precisa devolver o texto enviado
+        return dados
+
+    def _esperar_token(self):
+        """Segundos até haver token no bucket da instância (0 = token consumido, pode enviar)."""
+        return float(self._token_bucket(keys=[self._chave_bucket], args=[self.taxa, self.rajada, time.time()]))
+
+    def _backoff(self, tentativas):
+        espera = min(self.backoff_max, self.backoff_base * (2 ** (tentativas - 1)))
+        return espera * random.uniform(0.5, 1.5)
+
+    def _reagendar_travados(self):
+        agora = time.time()
+        for envio_id in self.redis.zrangebyscore(self.enviando, "-inf", agora):
+            if self.redis.zrem(self.enviando, envio_id):
+                self.redis.zadd(self.agendados, {envio_id: agora})
+                self.redis.hset(self._chave(envio_id), "status", "pendente")
+
+    def _reivindicar(self, envio_id):
+        # Só quem remove o id de agendados fica com o envio (vários senders/processos)
+        if not self.redis.zrem(self.agendados, envio_id):
+            return False
+        self.redis.zadd(self.enviando, {envio_id: time.time() + self.visibilidade})
+        return True
+
+    def _enviar(self, envio_id):
+        chave = self._chave(envio_id)
+        dados = self.redis.hgetall(chave)
+        if not dados:
+            self.redis.zrem(self.enviando, envio_id)
+            return  # status expirou: nada a enviar
+        tentativas = int(dados.get("tentativas", 0)) + 1
+        self.redis.hset(chave, mapping={"status": "enviando", "tentativas": tentativas})
+        try:
+            self.enviar(dados["phone"], dados["message"])
+        except Exception as e:
+            erro = str(e)
+            if tentativas >= self.max_tentativas:
+                log.erro("envio_morto", envio_id=envio_id, tentativas=tentativas, erro=erro)
+                pipe = self.redis.pipeline(transaction=True)
+                pipe.hset(chave, mapping={"status": "morta", "erro": erro})
+                pipe.lpush(self.MORTAS, json.dumps({"id": envio_id, "phone": dados["phone"], "message": dados["message"], "erro": erro}, ensure_ascii=False))
+                self._pipeline_concluir(pipe, envio_id, dados["phone"])
+                pipe.execute()
+                return
+            espera = self._backoff(tentativas)
+            log.aviso("envio_reagendado", envio_id=envio_id, tentativa=tentativas, espera_s=round(espera, 1), erro=erro)
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.hset(chave, mapping={"status": "pendente", "erro": erro})
+            pipe.zadd(self.agendados, {envio_id: time.time() + espera})
+            pipe.zrem(self.enviando, envio_id)
+            pipe.execute()
+            return
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(chave, mapping={"status": "enviada", "enviado_em": time.time()})
+        pipe.hdel(chave, "erro")
+        self._pipeline_concluir(pipe, envio_id, dados["phone"])
+        pipe.execute()
+
+    def _pipeline_concluir(self, pipe, envio_id, phone):
+        # Envio terminado (enviada/morta): status expira em ttl_status e o próximo do telefone é agendado
+        pipe.expire(self._chave(envio_id), self.ttl_status)
+        pipe.zrem(self.enviando, envio_id)
+        pipe.eval(_SCRIPT_PROXIMO, 2, self._fila_telefone(phone), self.agendados, envio_id, time.time())
+
+    def processar_prontos(self):
+        """Envia os envios vencidos, respeitando o token bucket. Retorna quantos foram tentados."""
+        tentados = 0
+        for envio_id in self.redis.zrangebyscore(self.agendados, "-inf", time.time(), start=0, num=self.lote):
+            if self._parar.is_set():
+                break
+            if not self._reivindicar(envio_id):
+                continue
+            # Sem token: segura o envio até o bucket da instância encher (não estoura o limite da MegaAPI)
+            espera = self._esperar_token()
+            while espera > 0:
+                time.sleep(espera)
+                espera = self._esperar_token()
+            self._enviar(envio_id)
+            tentados += 1
+        return tentados
+
+    def _loop(self, intervalo):
+        ultimo_reaper = 0.0
+        while not self._parar.is_set():
+            try:
+                if time.time() - ultimo_reaper >= self.visibilidade / 2:
+                    self._reagendar_travados()
+                    ultimo_reaper = time.time()
+                if not self.processar_prontos():
+                    self._parar.wait(intervalo)
+            except Exception as e:
+                log.erro("sender_falhou", erro=str(e))
+                self._parar.wait(1)
+
+    def iniciar(self, num_threads=1, intervalo=0.1):
+        if not self._threads:
+            self._threads = [
+                threading.Thread(target=self._loop, args=(intervalo,), name=f"whatsapp-sender-{i}", daemon=True)
+                for i in range(num_threads)
+            ]
+            for t in self._threads:
+                t.start()
+        return self._threads
+
+    def parar(self):
+        self._parar.set()
@@ -0,0 +1,89 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+# Orçamento de tempo por turno (do início do processamento até a resposta ao cliente).
+# O prazo é fixado quando o turno começa a ser processado (processar_payload, já no worker da fila),
+# não no recebimento do webhook: a espera na fila, a janela do coalescedor e as reentregas do reaper
+# não consomem o orçamento (um turno atrasado ainda tenta IXC e Mistral). Essa espera é medida à
+# parte, a partir do campo "recebido_em" do payload (ver espera_fila). O prazo vive num
+# contextvar, então vale para todas as chamadas do turno, inclusive nas threads de prefetch/tools
+# (submeter_com_contexto) e nas tasks do asyncio. Cada chamada HTTP usa como timeout o menor entre
+# o seu padrão e o que resta do orçamento (ver cliente_http.post). Sem orçamento suficiente, a
+# chamada nem é feita: OrcamentoEsgotado leva o turno para a resposta degradada.
+# O envio da resposta ao WhatsApp tem uma reserva própria (TURNO_RESERVA_ENVIO_S) além do orçamento,
+# então o pior caso de um turno é TURNO_ORCAMENTO_S + TURNO_RESERVA_ENVIO_S.
+
+TURNO_ORCAMENTO = float(os.getenv("TURNO_ORCAMENTO_S", 30))
+TURNO_RESERVA_ENVIO = float(os.getenv("TURNO_RESERVA_ENVIO_S", 5))
+# Abaixo disso não vale a pena abrir uma chamada: ela só terminaria em timeout
+TIMEOUT_MINIMO = float(os.getenv("TURNO_TIMEOUT_MINIMO_S", 0.5))
+
+prazo_atual = contextvars.ContextVar("prazo_turno", default=None)  # instante (time.time) em que o turno estoura
+
+class OrcamentoEsgotado(Exception):
+    pass
+
+def iniciar(orcamento=None):
+    """Fixa o prazo do turno a partir de agora. Retorna o token para encerrar()."""
+    return prazo_atual.set(time.time() + (TURNO_ORCAMENTO if orcamento is None else orcamento))
+
+def espera_fila(recebido_em):
+    """Segundos entre o recebimento do webhook e o início do turno; None sem recebido_em."""
+    if not recebido_em:
+        return None
+    return max(0.0, time.time() - float(recebido_em))
+
+def encerrar(token):
+    prazo_atual.reset(token)
+
+def restante():
+    """Segundos que restam no turno; None fora de um turno (sem limite)."""
+    prazo = prazo_atual.get()
+    if prazo is None:
+        return None
+    return prazo - time.time()
+
+def esgotado(margem=0.0):
+    r = restante()
+    return r is not None and r <= margem
+
+def verificar(etapa):
+    """Ponto de controle entre etapas: levanta OrcamentoEsgotado se não sobra tempo para a próxima."""
+    if esgotado(TIMEOUT_MINIMO):
+        raise OrcamentoEsgotado(f"Orçamento do turno esgotado antes de {etapa}")
+
+def limitar(timeout):
+    """Timeout (segundos) limitado ao restante do turno; pode ser <= 0. Para esperas locais (futures)."""
+    r = restante()
+    if r is None:
+        return timeout
+    return min(timeout, r) if timeout is not None else r
+
+def timeout_chamada(timeout, nome=None):
+    """
+    Timeout de uma chamada de rede dentro do turno. Aceita número ou (connect, leitura).
+    Levanta OrcamentoEsgotado se sobra menos que TIMEOUT_MINIMO.
+    """
+    r = restante()
+    if r is None:
+        return timeout
+    if r < TIMEOUT_MINIMO:
+        raise OrcamentoEsgotado(f"Orçamento do turno esgotado antes de chamar {nome or 'upstream'}")
+    if isinstance(timeout, tuple):
+        return tuple(min(t, r) for t in timeout)
+    return min(timeout, r) if timeout is not None else r
+
+@contextmanager
+def reserva_envio():
+    """Garante ao envio da resposta pelo menos TURNO_RESERVA_ENVIO segundos, mesmo com o orçamento esgotado."""
+    prazo = prazo_atual.get()
+    if prazo is None:
+        yield
+        return
+    token = prazo_atual.set(max(prazo, time.time() + TURNO_RESERVA_ENVIO))
+    try:
+        yield
+    finally:
+        prazo_atual.reset(token)
@@ -0,0 +1,134 @@
+import json
+import threading
+from cache_ixc import is_erro
+from metricas import contar_cache
+
+# Registro das tools expostas ao Mistral. Cada tool declara, num só lugar:
+# - o schema que vai no corpo do Mistral (nome, descrição, parâmetros);
+# - o handler: handler(**args) para tools comuns, ou projecao(dados_ixc) para leituras que saem do
+#   snapshot do IXC (boletos, status do plano...);
+# - a política de cache (campos que formam a chave e TTL opcional no L1 entre turnos);
+# - se tem efeito colateral (abrir OS, transferir): essas nunca são servidas de cache nem do snapshot.
+# As leituras do IXC usam primeiro o snapshot que o turno já carregou no prefetch e, sem ele, o
+# CacheIXC compartilhado (Redis/L1). Dentro de um turno (TurnoTools), o resultado de cada chamada
+# fica memorizado: o Mistral pedindo a mesma consulta em rodadas diferentes não custa nada, e a mesma
+# tool com efeito colateral repetida com os mesmos argumentos roda uma vez só (não abre duas OS).
+
+class PoliticaCache:
+    def __init__(self, campos=("cpf",), ttl=None):
+        self.campos = tuple(campos)
+        self.ttl = ttl  # segundos no L1 entre turnos; None: só a memorização do turno
+
+class Tool:
+    def __init__(self, nome, descricao, parametros, handler=None, projecao=None,
+                 cache=None, efeito_colateral=False):
+        if (handler is None) == (projecao is None):
+            raise ValueError(f"Tool {nome}: informe handler ou projecao")
+        self.nome = nome
+        self.descricao = descricao
+        self.parametros = parametros
+        self.handler = handler
+        self.projecao = projecao
+        self.cache = cache or PoliticaCache()
+        self.efeito_colateral = efeito_colateral
+
+    def schema(self):
+        return {
+            "type": "function",
+            "function": {"name": self.nome, "description": self.descricao, "parameters": self.parametros},
+        }
+
+    def validar(self, args):
+        """(argumentos só com os parâmetros declarados, erro ou None)."""
+        faltando = [p for p in self.parametros if p not in args]
+        if faltando:
+            return None, {"erro": f"Argumentos ausentes para {self.nome}: {', '.join(faltando)}"}
+        return {p: args[p] for p in self.parametros}, None
+
+    def chave(self, args):
+        if self.efeito_colateral:
+            # Memorização do turno só para a mesma chamada exata
+            return (self.nome, json.dumps(args, sort_keys=True, ensure_ascii=False))
+        return (self.nome,) + tuple(str(args.get(c)) for c in self.cache.campos)
+
+class TurnoTools:
+    """Estado das tools num turno: CPF do contexto, snapshot do IXC já carregado e resultados memorizados."""
+
+    def __init__(self, cpf, dados_ixc=None):
+        self.cpf = cpf
+        self.dados_ixc = dados_ixc if dados_ixc and not is_erro(dados_ixc) else None
+        self.efeito_colateral = False  # alguma tool com efeito colateral rodou no turno (ver cache_respostas.py)
+        self._memo = {}
+        self._travas = {}
+        self._lock = threading.Lock()
+
+    def memorizar(self, chave, calcular):
+        # Tools de uma mesma rodada rodam em paralelo: a trava por chave faz a repetida esperar a primeira
+        with self._lock:
+            trava = self._travas.setdefault(chave, threading.Lock())
+        with trava:
+            if chave in self._memo:
+                contar_cache("tools", "memo")
+                return self._memo[chave]
+            resultado = calcular()
+            if not is_erro(resultado):
+                self._memo[chave] = resultado
+            return resultado
+
+class RegistroTools:
+    def __init__(self, carregar_snapshot, cache_local=None):
+        self.carregar_snapshot = carregar_snapshot  # carregar_snapshot(cpf) -> dados do IXC (CacheIXC)
+        self.cache_local = cache_local
+        self._tools = {}
+
+    def registrar(self, tool):
+        self._tools[tool.nome] = tool
+        return tool
+
+    def nomes(self):
+        return set(self._tools)
+
+    def parametros(self, nome):
+        tool = self._tools.get(nome)
+        return tool.parametros if tool else {}
+
+    def schemas(self):
+        return [t.schema() for t in self._tools.values()]
+
+    def executar(self, nome, args, turno=None):
+        tool = self._tools.get(nome)
+        if tool is None:
+            return {"erro": f"Tool {nome} não implementada"}
+        args, erro = tool.validar(args)
+        if erro:
+            return erro
+        if turno is None:
+            turno = TurnoTools(args.get("cpf"))
+        if tool.efeito_colateral:
+            turno.efeito_colateral = True
+        return turno.memorizar(tool.chave(args), lambda: self._calcular(tool, args, turno))
+
+    def _calcular(self, tool, args, turno):
+        if tool.projecao is not None:
+            return tool.projecao(self._snapshot(args.get("cpf"), turno))
+        if tool.efeito_colateral or not tool.cache.ttl or self.cache_local is None:
+            return tool.handler(**args)
+        chave = "tool:" + ":".join(tool.chave(args))
+        resultado = self.cache_local.get(chave, None)
+        if resultado is not None:
+            contar_cache("tools", "l1")
+            return resultado
+        resultado = tool.handler(**args)
+        if not is_erro(resultado):
+            self.cache_local.set(chave, resultado, ttl=tool.cache.ttl)
+        return resultado
+
+    def _snapshot(self, cpf, turno):
+        if cpf == turno.cpf and turno.dados_ixc is not None:
+            contar_cache("tools", "snapshot")
+            return turno.dados_ixc
+        contar_cache("tools", "cache_ixc")
+        dados = self.carregar_snapshot(cpf)
+        if cpf == turno.cpf and not is_erro(dados):
+            turno.dados_ixc = dados
+        return dados
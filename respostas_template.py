@@ -0,0 +1,124 @@
+import json
+import os
+import string
+from datetime import datetime
+
+# Respostas determinísticas para as consultas que são só preenchimento de campos do IXC
+# (boleto, status do plano, cadastro, valor do plano). Se faltar algum campo exigido pelo template
+# ou a consulta for ambígua (ex: mais de um boleto em aberto), retorna None e o fluxo segue para o Mistral.
+# Os templates podem ser sobrescritos por um JSON {intencao: template} em TEMPLATES_RESPOSTA.
+
+TEMPLATES = {
+    "consulta_boleto": (
+        "Seu boleto de R$ {valor} vence em {data_vencimento}. Segue o link para pagamento: {url_pdf}\n"
+        "Se precisar do código de barras: {linha_digitavel}\n"
+        "Posso te ajudar com mais alguma coisa, {nome_cliente}?"
+    ),
+    "consulta_status_plano": (
+        "Seu plano está *{status_contrato}* e sua internet está *{status_internet}*. "
+        "Última conexão: {ultima_conexao_inicial}. Se precisar de suporte, posso abrir uma ordem de serviço.\n"
+        "Posso te ajudar com mais alguma coisa, {nome_cliente}?"
+    ),
+    "consulta_dados_cadastro": (
+        "Seus dados cadastrais:\n"
+        "- *Nome:* {nome_cliente}\n"
+        "- *Telefone:* {telefone}\n"
+        "- *Endereço:* {endereco}\n"
+        "- *Status:* {status}\n"
+        "Posso te ajudar com mais alguma coisa, {nome_cliente}?"
+    ),
+    "consulta_valor_plano": (
+        "O valor do seu plano é *R$ {valor_plano}* por mês.\n"
+        "Posso te ajudar com mais alguma coisa, {nome_cliente}?"
+    ),
+}
+
+# Status de boleto que não contam como "em aberto"
+STATUS_BOLETO_QUITADO = {"r", "recebido", "pago", "paga", "c", "cancelado", "quitado"}
+
+def carregar_templates(caminho=None):
+    templates = dict(TEMPLATES)
+    caminho = caminho or os.getenv("TEMPLATES_RESPOSTA")
+    if caminho and os.path.exists(caminho):
+        with open(caminho, encoding="utf-8") as f:
+            templates.update(json.load(f))
+    return templates
+
+def formatar_valor(valor):
+    try:
+        return f"{float(str(valor).replace(',', '.')):.2f}".replace(".", ",")
+    except (TypeError, ValueError):
+        return valor
+
+def formatar_data(data):
+    for formato in ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(str(data), formato).strftime("%d/%m/%Y" if formato == "%Y-%m-%d" else "%d/%m/%Y %H:%M")
+        except ValueError:
+            continue
+    return data
+
+def _primeiro(*valores):
+    for v in valores:
+        if v not in (None, "", [], {}):
+            return v
+    return None
+
+def _dict(valor):
+    return valor if isinstance(valor, dict) else {}
+
+def boletos_em_aberto(dados_ixc):
+    boletos = dados_ixc.get("boletos")
+    if isinstance(boletos, dict):
+        boletos = boletos.get("registros") or boletos.get("boletos") or [boletos]
+    if not isinstance(boletos, list):
+        return []
+    return [b for b in boletos if isinstance(b, dict) and str(b.get("status", "")).lower() not in STATUS_BOLETO_QUITADO]
+
+def extrair_campos(dados_ixc):
+    """Achata o snapshot do IXC nos campos usados pelos templates. Campos ausentes ficam de fora."""
+    cliente = _dict(dados_ixc.get("cliente"))
+    contrato = _dict(dados_ixc.get("contrato"))
+    status_plano = _dict(dados_ixc.get("status_plano"))
+    cadastro = _dict(dados_ixc.get("cadastro"))
+    valor_plano = dados_ixc.get("valor_plano")
+    campos = {
+        "nome_cliente": _primeiro(cliente.get("razao_social"), cliente.get("nome"), cadastro.get("nome")),
+        "telefone": _primeiro(cadastro.get("telefone"), cliente.get("telefone_celular"), cliente.get("fone"), cliente.get("telefone")),
+        "endereco": _primeiro(cadastro.get("endereco"), cliente.get("endereco")),
+        "status": _primeiro(cadastro.get("status"), contrato.get("status")),
+        "status_contrato": _primeiro(status_plano.get("status_contrato"), contrato.get("status")),
+        "status_internet": _primeiro(status_plano.get("status_internet"), contrato.get("status_internet")),
+        "ultima_conexao_inicial": formatar_data(_primeiro(status_plano.get("ultima_conexao_inicial"), contrato.get("ultima_conexao_inicial"))),
+        "valor_plano": formatar_valor(_primeiro(_dict(valor_plano).get("valor"), valor_plano if not isinstance(valor_plano, dict) else None, contrato.get("valor"))),
+    }
+    abertos = boletos_em_aberto(dados_ixc)
+    campos["boletos_em_aberto"] = len(abertos)
+    if len(abertos) == 1:
+        boleto = abertos[0]
+        campos.update({
+            "valor": formatar_valor(_primeiro(boleto.get("valor_aberto"), boleto.get("valor"))),
+            "data_vencimento": formatar_data(boleto.get("data_vencimento")),
+            "url_pdf": _primeiro(boleto.get("url_pdf"), boleto.get("gateway_link")),
+            "linha_digitavel": boleto.get("linha_digitavel"),
+        })
+    return {k: v for k, v in campos.items() if v not in (None, "")}
+
+def campos_do_template(template):
+    return {nome for _, nome, _, _ in string.Formatter().parse(template) if nome}
+
+class RespostasTemplate:
+    def __init__(self, templates=None):
+        self.templates = templates or carregar_templates()
+
+    def responder(self, intencao, dados_ixc):
+        """Resposta pronta para a intenção ou None quando o Mistral precisa assumir."""
+        template = self.templates.get(intencao)
+        if not template or not isinstance(dados_ixc, dict) or "erro" in dados_ixc:
+            return None
+        campos = extrair_campos(dados_ixc)
+        if intencao == "consulta_boleto" and campos.get("boletos_em_aberto") != 1:
+            return None  # nenhum ou vários boletos em aberto: o Mistral explica/lista
+        if not campos_do_template(template) <= campos.keys():
+            return None
+        return template.format(**campos)
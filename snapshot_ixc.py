@@ -0,0 +1,162 @@
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # sem msgpack, o formato compacto usa JSON (ainda projetado e comprimido)
+    msgpack = None
+
+# Formatos de gravação do snapshot do IXC no Redis (usados pelo CacheIXC, ver cache_ixc.py).
+# - FormatoJSON: o envelope {"dados", "ts", "erro"} inteiro como JSON em ixc:{cpf} (formato original).
+# - FormatoCompacto: a resposta do IXC projetada para os campos que o bot usa (CAMPOS) e gravada num
+#   HASH ixc:{cpf}:h, um campo do HASH por seção (cliente, contrato, boletos...) em msgpack, com zlib
+#   acima de `comprimir_acima` bytes. Metadados (_ts, _erro) ficam em campos próprios, em texto.
+#   Leitura parcial: HMGET só das seções pedidas, sem decodificar as demais (ex: o aquecedor lê só
+#   _ts/_erro; o nome do cliente sai só de "cliente").
+# Cada valor codificado começa com um byte que diz como foi gravado (m/z: msgpack puro/zlib, j/J: JSON
+# puro/zlib), então trocar de msgpack para JSON (ou o limiar de compressão) não invalida o que já está
+# no Redis. O formato compacto precisa de um cliente Redis sem decode_responses (valores binários).
+# Último snapshot bom: mesma estrutura na chave de ultimo_bom do formato; o compacto ainda lê a chave
+# JSON antiga (ixc:{cpf}:ultimo_bom) enquanto ela existir, para a troca de formato não perder o fallback.
+
+CAMPOS = ("cliente", "contrato", "boletos", "status_plano", "cadastro", "valor_plano")
+META_TS = "_ts"
+META_ERRO = "_erro"
+BRUTO = "_dados"  # resposta do IXC que não é um objeto: gravada inteira
+# Lidos em toda leitura parcial; "erro" é a mensagem do cache negativo (dados {"erro": ...})
+META = (META_TS, META_ERRO, BRUTO, "erro")
+
+def projetar(dados):
+    """Só as seções do IXC usadas pelo bot (respostas, templates, tools); erros passam inteiros."""
+    if not isinstance(dados, dict):
+        return dados
+    if "erro" in dados:
+        return dados
+    return {campo: dados[campo] for campo in CAMPOS if campo in dados}
+
+def codificar(valor, comprimir_acima=512):
+    if msgpack is not None:
+        bruto, tipo = msgpack.packb(valor, use_bin_type=True), b"m"
+    else:
+        bruto, tipo = json.dumps(valor, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), b"j"
+    if len(bruto) > comprimir_acima:
+        bruto, tipo = zlib.compress(bruto, 6), {b"m": b"z", b"j": b"J"}[tipo]
+    return tipo + bruto
+
+def decodificar(bruto):
+    tipo, corpo = bruto[:1], bruto[1:]
+    if tipo in (b"z", b"J"):
+        corpo = zlib.decompress(corpo)
+    if tipo in (b"m", b"z"):
+        if msgpack is None:
+            raise RuntimeError("Snapshot do IXC gravado em msgpack e o pacote msgpack não está instalado")
+        return msgpack.unpackb(corpo, raw=False)
+    return json.loads(corpo)
+
+def _texto(valor):
+    return valor.decode() if isinstance(valor, bytes) else valor
+
+class FormatoJSON:
+    def __init__(self, redis_client, redis_async=None):
+        self.redis = redis_client
+        self.redis_async = redis_async
+
+    def chave(self, cpf):
+        return f"ixc:{cpf}"
+
+    def chave_ultimo_bom(self, cpf):
+        return f"ixc:{cpf}:ultimo_bom"
+
+    padrao_ultimo_bom = "ixc:*:ultimo_bom"
+
+    def pipeline_gravar(self, pipe, cpf, envelope, ttl, ultimo_bom_ttl):
+        bruto = json.dumps(envelope, ensure_ascii=False)
+        pipe.setex(self.chave(cpf), ttl, bruto)
+        if not envelope["erro"]:
+            pipe.setex(self.chave_ultimo_bom(cpf), ultimo_bom_ttl, bruto)
+
+    def comando_ler(self, cliente, chave, campos=None):
+        """Comando de leitura em `cliente` (Redis, pipeline ou redis.asyncio); o retorno vai para envelope()."""
+        return cliente.get(chave)
+
+    def envelope(self, resultado, campos=None):
+        """Envelope {"dados", "ts", "erro"} a partir do resultado de comando_ler, ou None."""
+        if not resultado:
+            return None
+        envelope = json.loads(resultado)
+        if campos is not None and isinstance(envelope.get("dados"), dict):
+            envelope["dados"] = {c: envelope["dados"][c] for c in (*campos, "erro") if c in envelope["dados"]}
+        return envelope
+
+    def ler(self, chave, campos=None):
+        return self.envelope(self.comando_ler(self.redis, chave, campos), campos)
+
+    async def ler_async(self, chave, campos=None):
+        return self.envelope(await self.comando_ler(self.redis_async, chave, campos), campos)
+
+class FormatoCompacto(FormatoJSON):
+    def __init__(self, redis_client, redis_async=None, comprimir_acima=512):
+        super().__init__(redis_client, redis_async)
+        self.comprimir_acima = comprimir_acima
+
+    def chave(self, cpf):
+        return f"ixc:{cpf}:h"
+
+    def chave_ultimo_bom(self, cpf):
+        return f"ixc:{cpf}:ultimo_bom:h"
+
+    padrao_ultimo_bom = "ixc:*:ultimo_bom:h"
+
+    def _mapa(self, envelope):
+        dados = projetar(envelope["dados"])
+        mapa = {META_TS: repr(envelope["ts"]), META_ERRO: "1" if envelope["erro"] else "0"}
+        if isinstance(dados, dict):
+            for campo, valor in dados.items():
+                mapa[campo] = codificar(valor, self.comprimir_acima)
+        else:
+            mapa[BRUTO] = codificar(dados, self.comprimir_acima)
+        return mapa
+
+    def pipeline_gravar(self, pipe, cpf, envelope, ttl, ultimo_bom_ttl):
+        mapa = self._mapa(envelope)
+        chaves = [(self.chave(cpf), ttl)]
+        if not envelope["erro"]:
+            chaves.append((self.chave_ultimo_bom(cpf), ultimo_bom_ttl))
+        for chave, expira in chaves:
+            # DEL antes: uma seção que sumiu da resposta não pode sobrar do snapshot anterior
+            pipe.delete(chave)
+            pipe.hset(chave, mapping=mapa)
+            pipe.expire(chave, expira)
+
+    def comando_ler(self, cliente, chave, campos=None):
+        if campos is None:
+            return cliente.hgetall(chave)
+        return cliente.hmget(chave, [*META, *campos])
+
+    def envelope(self, resultado, campos=None):
+        if not resultado:
+            return None
+        if campos is None:
+            valores = {_texto(c): v for c, v in resultado.items()}
+        else:
+            valores = dict(zip([*META, *campos], resultado))
+        if valores.get(META_TS) is None:
+            return None
+        if valores.get(BRUTO) is not None:
+            dados = decodificar(valores[BRUTO])
+        else:
+            dados = {c: decodificar(v) for c, v in valores.items() if v is not None and c not in (META_TS, META_ERRO)}
+        return {"dados": dados, "ts": float(_texto(valores[META_TS])), "erro": _texto(valores.get(META_ERRO)) == "1"}
+
+    def ler(self, chave, campos=None):
+        envelope = super().ler(chave, campos)
+        if envelope is None and chave.endswith(":ultimo_bom:h"):
+            # Snapshot bom gravado no formato JSON, antes da troca de formato
+            return FormatoJSON.envelope(self, self.redis.get(chave[:-2]), campos)
+        return envelope
+
+    async def ler_async(self, chave, campos=None):
+        envelope = await super().ler_async(chave, campos)
+        if envelope is None and chave.endswith(":ultimo_bom:h"):
+            return FormatoJSON.envelope(self, await self.redis_async.get(chave[:-2]), campos)
+        return envelope
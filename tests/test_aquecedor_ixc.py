@@ -0,0 +1,44 @@
+from datetime import date
+
+import pytest
+
+pytest.importorskip("prometheus_client")  # aquecedor_ixc -> cache_ixc registra métricas
+
+from aquecedor_ixc import provavel_contato  # noqa: E402
+
+HOJE = date(2024, 5, 10)
+ATIVO = {"contrato": {"status": "A"}}
+
+
+def test_boleto_em_aberto_vencendo():
+    dados = {**ATIVO, "boletos": [{"status": "A", "data_vencimento": "2024-05-12"}]}
+    assert provavel_contato(dados, hoje=HOJE)
+
+
+def test_boletos_no_formato_registros():
+    dados = {**ATIVO, "boletos": {"registros": [{"status": "A", "data_vencimento": "2024-05-09"}]}}
+    assert provavel_contato(dados, hoje=HOJE)
+
+
+def test_boleto_unico_como_objeto():
+    dados = {**ATIVO, "boletos": {"status": "aberto", "data_vencimento": "10/05/2024"}}
+    assert provavel_contato(dados, hoje=HOJE)
+
+
+@pytest.mark.parametrize("status", ["R", "pago", "C", "cancelado"])
+def test_boleto_quitado_nao_conta(status):
+    dados = {**ATIVO, "boletos": [{"status": status, "data_vencimento": "2024-05-10"}]}
+    assert not provavel_contato(dados, hoje=HOJE)
+
+
+def test_vencimento_distante_nao_conta():
+    dados = {**ATIVO, "boletos": [{"status": "A", "data_vencimento": "2024-06-10"}]}
+    assert not provavel_contato(dados, hoje=HOJE)
+
+
+def test_contrato_nao_ativo():
+    assert provavel_contato({"contrato": {"status": "Bloqueado"}}, hoje=HOJE)
+
+
+def test_erro_nunca_e_contato():
+    assert not provavel_contato({"erro": "IXC fora"}, hoje=HOJE)
@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("prometheus_client")  # cache_ixc registra métricas
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # o Lock do redis-py usa scripts Lua para liberar
+
+from cache_ixc import CacheIXC  # noqa: E402
+
+CPF = "12345678909"
+LOCK = f"ixc:{CPF}:lock"
+
+
+class Ixc:
+    """Upstream do IXC: conta as consultas e pode demorar ou devolver erro."""
+
+    def __init__(self, demora=0.0, dados=None):
+        self.chamadas = 0
+        self.demora = demora
+        self.dados = dados or {"cliente": {"nome": "Maria"}}
+        self._lock = threading.Lock()
+
+    def __call__(self, cpf):
+        with self._lock:
+            self.chamadas += 1
+        if self.demora:
+            time.sleep(self.demora)
+        return self.dados
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def novo(redis_client, ixc, **kwargs):
+    return CacheIXC(redis_client, ixc, **kwargs)
+
+
+def esperar_refresh(cache):
+    cache._refresh_executor.shutdown(wait=True)
+    cache._refresh_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def envelhecer(redis_client, cpf, segundos):
+    envelope = json.loads(redis_client.get(f"ixc:{cpf}"))
+    envelope["ts"] -= segundos
+    redis_client.set(f"ixc:{cpf}", json.dumps(envelope))
+
+
+def test_miss_consulta_e_grava(redis_client):
+    ixc = Ixc()
+    cache = novo(redis_client, ixc)
+    assert cache.obter(CPF) == ixc.dados
+    assert cache.obter(CPF) == ixc.dados
+    assert ixc.chamadas == 1
+    assert not redis_client.exists(LOCK)
+
+
+def test_single_flight_no_miss(redis_client):
+    ixc = Ixc(demora=0.3)
+    cache = novo(redis_client, ixc)
+    resultados = []
+    threads = [threading.Thread(target=lambda: resultados.append(cache.obter(CPF))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert ixc.chamadas == 1
+    assert resultados == [ixc.dados] * 5
+
+
+def test_velho_serve_na_hora_e_atualiza_em_background(redis_client):
+    ixc = Ixc()
+    cache = novo(redis_client, ixc, soft_ttl=60)
+    cache.gravar(CPF, {"cliente": {"nome": "Antigo"}})
+    envelhecer(redis_client, CPF, 120)
+    assert cache.obter(CPF) == {"cliente": {"nome": "Antigo"}}
+    esperar_refresh(cache)
+    assert ixc.chamadas == 1
+    assert cache.obter(CPF) == ixc.dados
+
+
+def test_refresh_em_background_libera_o_lock(redis_client):
+    cache = novo(redis_client, Ixc())
+    assert cache.refresh_em_background(CPF)
+    esperar_refresh(cache)
+    assert not redis_client.exists(LOCK)
+    # Próximo refresh do mesmo CPF não fica preso esperando o lock expirar
+    assert cache.refresh_em_background(CPF)
+    esperar_refresh(cache)
+
+
+def test_refresh_em_andamento_nao_duplica(redis_client):
+    ixc = Ixc(demora=0.3)
+    cache = novo(redis_client, ixc)
+    assert cache.refresh_em_background(CPF)
+    assert not cache.refresh_em_background(CPF)
+    esperar_refresh(cache)
+    assert ixc.chamadas == 1
+
+
+def test_erro_serve_ultimo_bom(redis_client):
+    ixc = Ixc()
+    cache = novo(redis_client, ixc, soft_ttl=60)
+    cache.obter(CPF)
+    redis_client.delete(f"ixc:{CPF}")
+    ixc.dados = {"erro": "IXC fora"}
+    assert cache.obter(CPF) == {"cliente": {"nome": "Maria"}}
+    # Cache negativo gravado, mas a leitura seguinte continua no último bom
+    assert json.loads(redis_client.get(f"ixc:{CPF}"))["erro"]
+    assert cache.obter(CPF) == {"cliente": {"nome": "Maria"}}
+
+
+def test_espera_limitada_sem_snapshot(redis_client):
+    cache = novo(redis_client, Ixc(), espera_max=0.2)
+    redis_client.set(LOCK, "outro-worker", ex=30)
+    inicio = time.monotonic()
+    assert cache.obter(CPF) == {"erro": "Timeout aguardando consulta ao IXC"}
+    assert time.monotonic() - inicio < 1
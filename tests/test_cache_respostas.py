@@ -0,0 +1,95 @@
+import pytest
+
+pytest.importorskip("prometheus_client")  # cache_respostas registra métricas
+
+from cache_respostas import CacheRespostas, PoliticaResposta, distancia_hamming, simhash  # noqa: E402
+
+
+class RedisMemoria:
+    """Só o que o CacheRespostas usa do Redis (GET/SETEX/HGETALL/HSET/EXPIRE/HLEN/DEL e pipeline)."""
+
+    def __init__(self):
+        self.dados = {}
+
+    def pipeline(self, transaction=False):
+        return PipelineMemoria(self)
+
+    def get(self, chave):
+        return self.dados.get(chave)
+
+    def setex(self, chave, ttl, valor):
+        self.dados[chave] = valor
+        return True
+
+    def hgetall(self, chave):
+        return dict(self.dados.get(chave, {}))
+
+    def hset(self, chave, campo, valor):
+        self.dados.setdefault(chave, {})[campo] = valor
+        return 1
+
+    def expire(self, chave, ttl):
+        return True
+
+    def hlen(self, chave):
+        return len(self.dados.get(chave, {}))
+
+    def delete(self, chave):
+        return int(self.dados.pop(chave, None) is not None)
+
+
+class PipelineMemoria:
+    def __init__(self, redis):
+        self.redis = redis
+        self.comandos = []
+
+    def __getattr__(self, nome):
+        return lambda *args: self.comandos.append((nome, args))
+
+    def execute(self):
+        return [getattr(self.redis, nome)(*args) for nome, args in self.comandos]
+
+
+DADOS = {"valor_plano": {"valor": "99,90"}, "cliente": {"nome": "Maria Silva", "endereco": "Rua das Flores"}}
+
+
+@pytest.fixture
+def cache():
+    politicas = {"consulta_valor_plano": PoliticaResposta(("valor_plano",), compartilhada=True)}
+    return CacheRespostas(RedisMemoria(), politicas, sem_cache={"falar_com_atendente"})
+
+
+def test_simhash_ignora_palavras_vazias():
+    assert simhash("qual o valor do meu plano") == simhash("qual valor plano")
+    assert simhash("o a de") is None
+    assert distancia_hamming(0b1010, 0b0110) == 2
+
+
+def test_hit_compartilhado_troca_o_nome(cache):
+    assert cache.gravar("consulta_valor_plano", "qual o valor do meu plano?", DADOS, "1", "Maria", "Oi Maria, são R$ 99,90")
+    assert cache.buscar("consulta_valor_plano", "qual o valor do plano", DADOS, "2", "João") == "Oi João, são R$ 99,90"
+
+
+def test_dado_do_ixc_muda_a_chave(cache):
+    cache.gravar("consulta_valor_plano", "qual o valor do meu plano?", DADOS, "1", "Maria", "São R$ 99,90")
+    novos = dict(DADOS, valor_plano={"valor": "109,90"})
+    assert cache.buscar("consulta_valor_plano", "qual o valor do meu plano?", novos, "1", "Maria") is None
+
+
+def test_nao_compartilha_resposta_com_outros_dados(cache):
+    assert not cache.gravar("consulta_valor_plano", "valor plano endereco", DADOS, "1", "Maria", "Rua das Flores, R$ 99,90")
+
+
+@pytest.mark.parametrize("mensagem", ["sim", "e o outro?", "e desse plano qual valor?"])
+def test_mensagens_que_dependem_do_historico(cache, mensagem):
+    assert not cache.gravar("consulta_valor_plano", mensagem, DADOS, "1", "Maria", "R$ 99,90")
+    assert cache.buscar("consulta_valor_plano", mensagem, DADOS, "1", "Maria") is None
+
+
+def test_resposta_com_historico_no_contexto_nao_e_guardada(cache):
+    assert not cache.gravar("consulta_valor_plano", "qual o valor do meu plano?", DADOS, "1", "Maria", "R$ 99,90",
+                            com_historico=True)
+
+
+def test_intencao_sem_cache(cache):
+    assert not cache.gravar("falar_com_atendente", "quero falar com atendente", DADOS, "1", "Maria", "Transferindo")
@@ -0,0 +1,81 @@
+import pytest
+
+from classificador_intencao import EXEMPLOS, VALIDACAO, ClassificadorLocal, normalizar_intencao, normalizar_texto
+
+
+@pytest.fixture(scope="module")
+def classificador():
+    classificador = ClassificadorLocal()
+    classificador.calibrar()
+    return classificador
+
+
+def test_normalizar_texto():
+    assert normalizar_texto("  Olá, TUDO   bem?! ") == "ola tudo bem"
+
+
+def test_normalizar_intencao():
+    assert normalizar_intencao("suporte_internet") == "estou_sem_internet"
+    assert normalizar_intencao(None) == "outros"
+
+
+def test_validacao_separada_do_treino():
+    treino = {normalizar_texto(t) for textos in EXEMPLOS.values() for t in textos}
+    assert not treino & {normalizar_texto(t) for textos in VALIDACAO.values() for t in textos}
+
+
+@pytest.mark.parametrize("mensagem, intencao", [
+    ("quero meu boleto", "consulta_boleto"),
+    ("bom dia", "saudacao"),
+    ("to sem internet", "estou_sem_internet"),
+    ("12345678901", "informar_cpf"),
+    ("123.456.789-01", "informar_cpf"),
+])
+def test_regras(classificador, mensagem, intencao):
+    resultado = classificador.classificar(mensagem)
+    assert (resultado["intencao"], resultado["fonte"]) == (intencao, "regra")
+    assert classificador.confiavel(resultado)
+
+
+def test_cpf_vira_entidade(classificador):
+    assert classificador.classificar("meu cpf 12345678901")["entidades"] == {"cpf": "12345678901"}
+
+
+@pytest.mark.parametrize("mensagem, intencao", [
+    ("internet caiu", "estou_sem_internet"),
+    ("quanto custa meu plano mensal", "consulta_valor_plano"),
+    ("parabens pelo servico de voces", "elogio"),
+])
+def test_modelo_aceita_casos_claros(classificador, mensagem, intencao):
+    resultado = classificador.classificar(mensagem)
+    assert resultado["intencao"] == intencao
+    assert classificador.confiavel(resultado)
+
+
+@pytest.mark.parametrize("mensagem", [
+    "qual o horario de atendimento de voces",
+    "quero contratar um plano de 1 giga",
+    "xyz",
+])
+def test_fora_das_intencoes_sobe_para_o_deepseek(classificador, mensagem):
+    assert not classificador.confiavel(classificador.classificar(mensagem))
+
+
+def test_margem_minima(classificador):
+    resultado = {"intencao": "elogio", "confianca": 0.9, "margem": classificador.margem_min / 2, "fonte": "modelo"}
+    assert not classificador.confiavel(resultado)
+
+
+def test_calibrar_atinge_a_precisao(classificador):
+    calibracao = classificador.calibrar(precisao_min=0.9)
+    assert calibracao["precisao"] >= 0.9
+    assert calibracao["cobertura"] > 0
+    assert classificador.limiar == calibracao["limiar"]
+
+
+def test_calibrar_sem_combinacao_nao_aceita_nada():
+    classificador = ClassificadorLocal()
+    validacao = {"elogio": ["quero meu boleto"], "consulta_boleto": ["parabens pelo servico"]}
+    calibracao = classificador.calibrar(validacao, precisao_min=1.0)
+    assert calibracao["cobertura"] == 0.0
+    assert classificador.limiar > 1
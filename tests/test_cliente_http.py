@@ -0,0 +1,99 @@
+import pytest
+
+pytest.importorskip("requests")
+
+import cliente_http  # noqa: E402
+import prazo  # noqa: E402
+
+
+class Resposta:
+    def __init__(self, status_code, retry_after=None):
+        self.status_code = status_code
+        self.headers = {"Retry-After": retry_after} if retry_after is not None else {}
+        self.fechada = False
+
+    def close(self):
+        self.fechada = True
+
+
+class Sessao:
+    """Devolve as respostas na ordem e registra os timeouts usados."""
+
+    def __init__(self, *respostas):
+        self.respostas = list(respostas)
+        self.timeouts = []
+
+    def post(self, url, timeout=None, **kwargs):
+        self.timeouts.append(timeout)
+        return self.respostas.pop(0)
+
+
+@pytest.fixture
+def sessao(monkeypatch):
+    def usar(*respostas):
+        sessao = Sessao(*respostas)
+        monkeypatch.setattr(cliente_http, "get_session", lambda nome: sessao)
+        return sessao
+    return usar
+
+
+@pytest.fixture
+def esperas(monkeypatch):
+    esperas = []
+    monkeypatch.setattr(cliente_http.time, "sleep", esperas.append)
+    return esperas
+
+
+@pytest.fixture
+def turno():
+    token = prazo.iniciar(5)
+    yield
+    prazo.encerrar(token)
+
+
+def test_repete_status_com_retry_after(sessao, esperas):
+    s = sessao(Resposta(503, "1"), Resposta(200))
+    assert cliente_http.post("mistral", "http://mistral").status_code == 200
+    assert esperas == [1.0]
+    assert len(s.timeouts) == 2
+
+
+def test_retry_after_maior_que_o_turno_devolve_na_hora(sessao, esperas, turno):
+    s = sessao(Resposta(429, "30"), Resposta(200))
+    assert cliente_http.post("mistral", "http://mistral").status_code == 429
+    assert esperas == []
+    assert len(s.timeouts) == 1
+
+
+def test_backoff_sem_retry_after(sessao, esperas, turno):
+    primeira = Resposta(502)
+    sessao(primeira, Resposta(200))
+    assert cliente_http.post("ixc", "http://ixc").status_code == 200
+    assert esperas == [cliente_http.HTTP_RETRY_BACKOFF]
+    assert primeira.fechada
+
+
+def test_upstream_com_efeito_colateral_nao_repete(sessao, esperas):
+    s = sessao(Resposta(503, "0"), Resposta(200))
+    assert cliente_http.post("megaapi", "http://megaapi").status_code == 503
+    assert len(s.timeouts) == 1
+
+
+def test_timeout_limitado_ao_turno(sessao, turno):
+    s = sessao(Resposta(200))
+    cliente_http.post("mistral", "http://mistral")
+    conexao, leitura = s.timeouts[0]
+    assert leitura <= 5
+
+
+def test_urllib3_nao_repete_por_status():
+    retry = cliente_http.get_session("mistral").get_adapter("https://x").max_retries
+    assert retry.status == 0
+    assert not retry.respect_retry_after_header
+
+
+def test_pool_padrao_cobre_os_executores(monkeypatch):
+    for var, valor in (("FILA_WORKERS", "4"), ("PREFETCH_MAX_WORKERS", "32"), ("TOOLS_MAX_WORKERS", "16"),
+                       ("WHATSAPP_SENDERS", "2"), ("WEB_THREADS", "8")):
+        monkeypatch.setenv(var, valor)
+    assert cliente_http._concorrencia_padrao() == 62
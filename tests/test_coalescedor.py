@@ -0,0 +1,52 @@
+from coalescedor import CoalescedorMensagens, cpf_informado
+
+
+def payload(texto, recebido_em=None):
+    data = {"key": {"remoteJid": "5511999999999@s.whatsapp.net"}, "message": {"extendedTextMessage": {"text": texto}}}
+    if recebido_em is not None:
+        data["recebido_em"] = recebido_em
+    return data
+
+
+def texto(data):
+    return data["message"]["extendedTextMessage"]["text"]
+
+
+def test_agrupar_junta_textos_na_ordem():
+    grupo = CoalescedorMensagens(None).agrupar([payload("oi"), payload("to sem internet"), payload("desde ontem")])
+    assert texto(grupo) == "oi\nto sem internet\ndesde ontem"
+    assert grupo["mensagens_agrupadas"] == 3
+
+
+def test_agrupar_uma_mensagem_fica_igual():
+    grupo = CoalescedorMensagens(None).agrupar([payload("oi")])
+    assert texto(grupo) == "oi"
+    assert "mensagens_agrupadas" not in grupo
+
+
+def test_agrupar_usa_o_primeiro_recebimento():
+    grupo = CoalescedorMensagens(None).agrupar([payload("oi", 10.0), payload("tudo bem?", 12.5)])
+    assert grupo["recebido_em"] == 10.0
+
+
+def test_agrupar_nao_altera_os_payloads():
+    original = payload("oi")
+    CoalescedorMensagens(None).agrupar([original, payload("tudo bem?")])
+    assert texto(original) == "oi"
+
+
+def test_cpf_em_grupo_de_mensagens():
+    grupo = CoalescedorMensagens(None).agrupar([payload("oi"), payload("123.456.789-01")])
+    assert cpf_informado(texto(grupo)) == "12345678901"
+
+
+def test_cpf_informado_sozinho():
+    assert cpf_informado("12345678901") == "12345678901"
+    assert cpf_informado(" 123 456 789 01 ") == "12345678901"
+
+
+def test_cpf_informado_ignora_numeros_no_meio_do_texto():
+    assert cpf_informado("meu cpf é 12345678901") is None
+    assert cpf_informado("1234567890") is None
+    assert cpf_informado("") is None
+    assert cpf_informado(None) is None
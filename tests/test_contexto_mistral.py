@@ -0,0 +1,76 @@
+import json
+
+from contexto_mistral import PayloadMistral, estimar_tokens, montar_mensagens
+
+PROMPT = {"role": "system", "content": "p" * 70}  # 20 + 4 tokens
+FATOS = [{"role": "system", "content": "f" * 35}]  # 10 + 4
+USUARIO = {"role": "user", "content": "u" * 7}  # 2 + 4
+INTENCAO = {"role": "system", "content": "i" * 7}  # 2 + 4
+OBRIGATORIAS = 24 + 14 + 6 + 6
+
+
+def turno(role, n, tokens=10):
+    return {"role": role, "content": f"{n}".ljust(int((tokens - 4) * 3.5), ".")}
+
+
+def test_estimar_tokens():
+    assert estimar_tokens({"content": ""}) == 4
+    assert estimar_tokens({"content": "a" * 7}) == 6
+    assert estimar_tokens({"content": None}) == 4
+    assert estimar_tokens({"content": [{"a": 1}]}) == 4 + 3
+
+
+def test_orcamento_so_com_as_obrigatorias():
+    turnos = [turno("user", 1), turno("assistant", 2)]
+    mensagens = montar_mensagens(PROMPT, FATOS, turnos, [], USUARIO, INTENCAO, OBRIGATORIAS)
+    assert mensagens == [PROMPT, *FATOS, USUARIO, INTENCAO]
+
+
+def test_obrigatorias_entram_mesmo_acima_do_orcamento():
+    mensagens = montar_mensagens(PROMPT, FATOS, [turno("assistant", 1)], [turno("system", 2)], USUARIO, INTENCAO, 0)
+    assert mensagens == [PROMPT, *FATOS, USUARIO, INTENCAO]
+
+
+def test_turnos_mais_recentes_primeiro_em_ordem_cronologica():
+    turnos = [turno("user", 1), turno("assistant", 2), turno("user", 3), turno("assistant", 4)]
+    mensagens = montar_mensagens(PROMPT, FATOS, turnos, [], USUARIO, INTENCAO, OBRIGATORIAS + 20)
+    assert mensagens[len(FATOS) + 1:-2] == turnos[2:]
+
+
+def test_turno_exatamente_no_limite_entra():
+    turnos = [turno("assistant", 1)]
+    assert turnos[0] in montar_mensagens(PROMPT, FATOS, turnos, [], USUARIO, INTENCAO, OBRIGATORIAS + 10)
+    assert turnos[0] not in montar_mensagens(PROMPT, FATOS, turnos, [], USUARIO, INTENCAO, OBRIGATORIAS + 9)
+
+
+def test_turno_grande_interrompe_a_selecao():
+    # Não pula o turno que não coube para pegar um mais antigo: o histórico não fica com buracos
+    turnos = [turno("assistant", 1), turno("user", 2, tokens=100), turno("assistant", 3)]
+    mensagens = montar_mensagens(PROMPT, FATOS, turnos, [], USUARIO, INTENCAO, OBRIGATORIAS + 30)
+    assert mensagens[len(FATOS) + 1:-2] == [turnos[2]]
+
+
+def test_nao_termina_historico_com_user():
+    turnos = [turno("assistant", 1), turno("user", 2)]
+    mensagens = montar_mensagens(PROMPT, FATOS, turnos, [], USUARIO, INTENCAO, OBRIGATORIAS + 100)
+    assert mensagens[len(FATOS) + 1:-2] == [turnos[0]]
+
+
+def test_memorias_so_com_sobra_e_antes_dos_turnos():
+    turnos = [turno("assistant", 1)]
+    memorias = [turno("system", "m1"), turno("system", "m2")]
+    mensagens = montar_mensagens(PROMPT, FATOS, turnos, memorias, USUARIO, INTENCAO, OBRIGATORIAS + 20)
+    assert mensagens == [PROMPT, *FATOS, memorias[1], turnos[0], USUARIO, INTENCAO]
+    sem_sobra = montar_mensagens(PROMPT, FATOS, turnos, memorias, USUARIO, INTENCAO, OBRIGATORIAS + 10)
+    assert memorias[1] not in sem_sobra
+
+
+def test_payload_serializado_igual_ao_json_completo():
+    tools = [{"type": "function", "function": {"name": "consultar_boleto"}}]
+    payload = PayloadMistral("agente", "prompt", tools, {"max_tokens": 500})
+    mensagens = [payload.mensagem_prompt, {"role": "user", "content": "olá"}]
+    memo = {}
+    for _ in range(2):  # a segunda vez usa o memo
+        corpo = json.loads(payload.serializar(mensagens, tools, memo))
+        assert corpo == {"max_tokens": 500, "agent_id": "agente", "tools": tools, "messages": mensagens}
+    assert memo[id(mensagens[1])] == json.dumps(mensagens[1], ensure_ascii=False)
@@ -0,0 +1,49 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from deduplicador import DeduplicadorMensagens  # noqa: E402
+
+
+def payload(msg_id):
+    return {"key": {"id": msg_id, "remoteJid": "5511@s.whatsapp.net"}}
+
+
+@pytest.fixture
+def deduplicador():
+    return DeduplicadorMensagens(fakeredis.FakeRedis(decode_responses=True))
+
+
+def test_primeira_entrega_passa_e_reentrega_e_duplicada(deduplicador):
+    assert not deduplicador.duplicada(payload("a"))
+    assert deduplicador.duplicada(payload("a"))
+
+
+def test_duplicata_do_filtro_local_entra_nas_estatisticas(deduplicador):
+    deduplicador.duplicada(payload("a"))
+    deduplicador.duplicada(payload("a"))
+    deduplicador.duplicada(payload("b"))
+    estatisticas = deduplicador.estatisticas()
+    assert estatisticas["recebidas"] == 3
+    assert estatisticas["duplicadas"] == 1
+    assert estatisticas["duplicadas_filtro_local"] == 1
+    assert estatisticas["taxa_duplicadas"] == round(1 / 3, 4)
+
+
+def test_duplicata_vista_por_outro_processo(deduplicador):
+    outro = DeduplicadorMensagens(deduplicador.redis)
+    assert not outro.duplicada(payload("a"))
+    assert deduplicador.duplicada(payload("a"))
+    assert deduplicador.estatisticas()["duplicadas"] == 1
+    assert deduplicador.estatisticas()["duplicadas_filtro_local"] == 0
+
+
+def test_esquecer_aceita_a_reentrega(deduplicador):
+    assert not deduplicador.duplicada(payload("a"))
+    deduplicador.esquecer(payload("a"))
+    assert not deduplicador.duplicada(payload("a"))
+
+
+def test_sem_id_nunca_e_duplicada(deduplicador):
+    assert not deduplicador.duplicada({"message": {}})
+    assert not deduplicador.duplicada({"message": {}})
@@ -0,0 +1,179 @@
+import pytest
+
+pytest.importorskip("prometheus_client")  # disjuntor registra métricas
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # transições rodam num script Lua
+
+import disjuntor  # noqa: E402
+from disjuntor import CircuitoAberto, Disjuntor  # noqa: E402
+from prazo import OrcamentoEsgotado  # noqa: E402
+
+
+class Relogio:
+    """Substitui o módulo time dentro do disjuntor: o teste avança o tempo à mão."""
+
+    def __init__(self):
+        self.agora = 1_000_000.0
+
+    def time(self):
+        return self.agora
+
+    def monotonic(self):
+        return self.agora
+
+    def avancar(self, segundos):
+        self.agora += segundos
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(disjuntor, "time", relogio)
+    return relogio
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def novo(redis_client, **kwargs):
+    parametros = dict(limiar=0.5, min_chamadas=4, janela=30.0, tempo_aberto=10.0, cache_estado=0)
+    parametros.update(kwargs)
+    return Disjuntor(redis_client, "teste", **parametros)
+
+
+def falhar():
+    raise RuntimeError("upstream fora")
+
+
+def abrir(d):
+    for _ in range(d.min_chamadas):
+        with pytest.raises(RuntimeError):
+            d.executar(falhar)
+
+
+def estado(redis_client):
+    return redis_client.hget("disjuntor:teste", "estado") or "fechado"
+
+
+def test_fechado_deixa_passar(relogio, redis_client):
+    d = novo(redis_client)
+    assert d.executar(lambda: "ok") == "ok"
+    assert estado(redis_client) == "fechado"
+
+
+def test_abre_so_depois_de_min_chamadas(relogio, redis_client):
+    d = novo(redis_client)
+    for _ in range(d.min_chamadas - 1):
+        with pytest.raises(RuntimeError):
+            d.executar(falhar)
+    assert estado(redis_client) == "fechado"
+    with pytest.raises(RuntimeError):
+        d.executar(falhar)
+    assert estado(redis_client) == "aberto"
+
+
+def test_taxa_abaixo_do_limiar_nao_abre(relogio, redis_client):
+    d = novo(redis_client)
+    for _ in range(3):
+        d.executar(lambda: "ok")
+    with pytest.raises(RuntimeError):
+        d.executar(falhar)
+    assert estado(redis_client) == "fechado"
+
+
+def test_aberto_rejeita_sem_chamar(relogio, redis_client):
+    d = novo(redis_client)
+    abrir(d)
+    chamadas = []
+    with pytest.raises(CircuitoAberto):
+        d.executar(lambda: chamadas.append(1))
+    assert chamadas == []
+
+
+def test_estado_compartilhado_entre_instancias(relogio, redis_client):
+    abrir(novo(redis_client))
+    with pytest.raises(CircuitoAberto):
+        novo(redis_client).executar(lambda: "ok")
+
+
+def test_sonda_com_sucesso_fecha(relogio, redis_client):
+    d = novo(redis_client)
+    abrir(d)
+    relogio.avancar(d.tempo_aberto + 1)
+    assert d.executar(lambda: "ok") == "ok"
+    assert estado(redis_client) == "fechado"
+    assert not redis_client.exists("disjuntor:teste:sonda")
+    assert d.executar(lambda: "ok") == "ok"
+
+
+def test_sonda_com_falha_reabre(relogio, redis_client):
+    d = novo(redis_client)
+    abrir(d)
+    relogio.avancar(d.tempo_aberto + 1)
+    with pytest.raises(RuntimeError):
+        d.executar(falhar)
+    assert estado(redis_client) == "aberto"
+    assert float(redis_client.hget("disjuntor:teste", "aberto_ate")) == relogio.agora + d.tempo_aberto
+    with pytest.raises(CircuitoAberto):
+        d.executar(lambda: "ok")
+
+
+def test_meio_aberto_so_uma_sonda(relogio, redis_client):
+    d = novo(redis_client)
+    abrir(d)
+    relogio.avancar(d.tempo_aberto + 1)
+    assert d.permitir() is True
+    with pytest.raises(CircuitoAberto):
+        novo(redis_client).permitir()
+
+
+def test_orcamento_esgotado_libera_a_sonda(relogio, redis_client):
+    d = novo(redis_client)
+    abrir(d)
+    relogio.avancar(d.tempo_aberto + 1)
+
+    def sem_orcamento():
+        raise OrcamentoEsgotado()
+
+    with pytest.raises(OrcamentoEsgotado):
+        d.executar(sem_orcamento)
+    assert not redis_client.exists("disjuntor:teste:sonda")
+    assert d.executar(lambda: "ok") == "ok"
+    assert estado(redis_client) == "fechado"
+
+
+def test_chamada_lenta_conta_como_falha(relogio, redis_client):
+    d = novo(redis_client, latencia_max=2.0)
+
+    def lenta():
+        relogio.avancar(3.0)
+        return "ok"
+
+    for _ in range(d.min_chamadas):
+        assert d.executar(lenta) == "ok"
+    assert estado(redis_client) == "aberto"
+
+
+def test_resultado_marcado_como_falha(relogio, redis_client):
+    d = novo(redis_client, falha=lambda r: r.get("erro"))
+    for _ in range(d.min_chamadas):
+        d.executar(lambda: {"erro": True})
+    assert estado(redis_client) == "aberto"
+
+
+def test_sem_redis_fica_fechado(relogio):
+    class RedisFora:
+        def register_script(self, script):
+            def executar(**kwargs):
+                raise ConnectionError("sem redis")
+            return executar
+
+        def hmget(self, *args):
+            raise ConnectionError("sem redis")
+
+    d = Disjuntor(RedisFora(), "teste", min_chamadas=1, cache_estado=0)
+    with pytest.raises(RuntimeError):
+        d.executar(falhar)
+    assert d.executar(lambda: "ok") == "ok"
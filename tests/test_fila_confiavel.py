@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import fila_confiavel  # noqa: E402
+from fila_confiavel import FilaConfiavel  # noqa: E402
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1_000_000.0
+
+    def time(self):
+        return self.agora
+
+    def avancar(self, segundos):
+        self.agora += segundos
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(fila_confiavel, "time", relogio)
+    return relogio
+
+
+@pytest.fixture
+def fila():
+    return FilaConfiavel(fakeredis.FakeRedis(decode_responses=True), visibilidade=120, max_tentativas=3,
+                         backoff_base=5, backoff_max=60)
+
+
+def entregar(fila, msg_id="m1"):
+    """Simula o worker: reserva o item e conta a entrega."""
+    raw = fila.reservar(timeout=1)
+    return raw, fila.registrar_entrega(msg_id)
+
+
+def test_reservar_move_para_processando_com_prazo(relogio, fila):
+    fila.enfileirar({"id": "m1", "data": {}})
+    raw = fila.reservar(timeout=1)
+    assert json.loads(raw)["id"] == "m1"
+    assert fila.redis.llen(FilaConfiavel.MENSAGENS) == 0
+    assert fila.redis.lrange(FilaConfiavel.PROCESSANDO, 0, -1) == [raw]
+    assert fila.redis.zscore(FilaConfiavel.PRAZOS, raw) == relogio.agora + 120
+
+
+def test_consumo_em_ordem_de_chegada(relogio, fila):
+    for i in range(3):
+        fila.enfileirar({"id": f"m{i}", "data": {}})
+    assert [json.loads(fila.reservar(timeout=1))["id"] for _ in range(3)] == ["m0", "m1", "m2"]
+
+
+def test_ack_limpa_tudo(relogio, fila):
+    fila.enfileirar({"id": "m1", "data": {}})
+    raw, _ = entregar(fila)
+    fila.ack(raw, "m1")
+    for chave in (FilaConfiavel.PROCESSANDO, FilaConfiavel.PRAZOS, FilaConfiavel.TENTATIVAS):
+        assert not fila.redis.exists(chave)
+
+
+def test_reaper_devolve_depois_da_visibilidade(relogio, fila):
+    fila.enfileirar({"id": "m1", "data": {}})
+    fila.enfileirar({"id": "m2", "data": {}})
+    raw, _ = entregar(fila)  # worker morre com m1
+    relogio.avancar(119)
+    assert fila.devolver_travadas() == 0
+    relogio.avancar(2)
+    assert fila.devolver_travadas() == 1
+    assert not fila.redis.exists(FilaConfiavel.PROCESSANDO)
+    # Volta para a frente da fila, antes de m2
+    assert fila.reservar(timeout=1) == raw
+
+
+def test_item_sem_prazo_ganha_prazo_e_volta_no_ciclo_seguinte(relogio, fila):
+    # Worker morreu entre o BRPOPLPUSH e o ZADD
+    raw = json.dumps({"id": "m1", "data": {}})
+    fila.redis.lpush(FilaConfiavel.PROCESSANDO, raw)
+    assert fila.devolver_travadas() == 0
+    assert fila.redis.zscore(FilaConfiavel.PRAZOS, raw) == relogio.agora + 120
+    relogio.avancar(121)
+    assert fila.devolver_travadas() == 1
+
+
+def test_falha_transitoria_volta_depois_do_backoff(relogio, fila):
+    fila.enfileirar({"id": "m1", "data": {}})
+    raw, tentativas = entregar(fila)
+    assert not fila.falhar(raw, "m1", tentativas)
+    espera = fila.redis.zscore(FilaConfiavel.PRAZOS, raw) - relogio.agora
+    assert 2.5 <= espera <= 7.5  # backoff_base com jitter, bem antes da visibilidade
+    relogio.avancar(espera + 0.1)
+    assert fila.devolver_travadas() == 1
+    assert fila.reservar(timeout=1) == raw
+
+
+def test_backoff_dobra_e_respeita_o_maximo(relogio, fila):
+    fila.enfileirar({"id": "m1", "data": {}})
+    raw, _ = entregar(fila)
+    assert 5 <= fila.reagendar(raw, "m1", 2) <= 15
+    assert fila.reagendar(raw, "m1", 10) <= 90  # backoff_max=60 com jitter de até 1.5x
+
+
+def test_mortas_depois_de_max_tentativas(relogio, fila):
+    fila.enfileirar({"id": "m1", "data": {}})
+    for tentativa in range(1, 4):
+        raw, tentativas = entregar(fila)
+        assert tentativas == tentativa
+        morreu = fila.falhar(raw, "m1", tentativas)
+        if tentativa < 3:
+            assert not morreu
+            relogio.avancar(100)
+            fila.devolver_travadas()
+    assert morreu
+    assert fila.redis.lrange(FilaConfiavel.MORTAS, 0, -1) == [raw]
+    for chave in (FilaConfiavel.MENSAGENS, FilaConfiavel.PROCESSANDO, FilaConfiavel.PRAZOS, FilaConfiavel.TENTATIVAS):
+        assert not fila.redis.exists(chave)
+
+
+def test_item_ilegivel_vai_direto_para_mortas(relogio, fila):
+    fila.redis.lpush(FilaConfiavel.MENSAGENS, "{quebrado")
+    raw = fila.reservar(timeout=1)
+    assert fila.falhar(raw, None, 0)
+    assert fila.redis.lrange(FilaConfiavel.MORTAS, 0, -1) == ["{quebrado"]
@@ -0,0 +1,28 @@
+import json
+import logging
+
+from logs import FormatadorJson, redigir
+
+
+def formatar(nome_evento, campos):
+    record = logging.LogRecord("geovana.ixc", logging.INFO, __file__, 1, nome_evento, None, None)
+    record.campos = campos
+    return json.loads(FormatadorJson().format(record))
+
+
+def test_campos_nao_sobrescrevem_as_chaves_do_evento():
+    linha = formatar("consulta_ixc", {"nivel": "alto", "evento": "outro", "ts": 0, "duracao_ms": 12})
+    assert linha["nivel"] == "INFO"
+    assert linha["evento"] == "consulta_ixc"
+    assert linha["categoria"] == "ixc"
+    assert linha["ts"] != 0
+    assert linha["campo_nivel"] == "alto"
+    assert linha["campo_evento"] == "outro"
+    assert linha["duracao_ms"] == 12
+
+
+def test_redigir_mascara_dados_sensiveis():
+    redigidos = redigir({"cpf": "12345678901", "erro": "falhou para 11999998888", "dados": {"a": 1}})
+    assert redigidos["cpf"] == "***01"
+    assert redigidos["erro"] == "falhou para ***88"
+    assert redigidos["dados"] == "<dict 1>"
@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # o Lock do redis-py usa scripts Lua para extend/release
+
+from outbox_mem0 import OutboxMem0  # noqa: E402
+
+
+class Mem0:
+    """Registra os lotes recebidos; falha as primeiras `falhas` chamadas."""
+
+    def __init__(self, falhas=0, demora=0.0):
+        self.lotes = []
+        self.falhas = falhas
+        self.demora = demora
+        self.durante = None  # callback(user_id) chamado no meio da chamada
+
+    def add(self, mensagens, user_id, agent_id):
+        if self.durante:
+            self.durante(user_id)
+        if self.demora:
+            time.sleep(self.demora)
+        if self.falhas:
+            self.falhas -= 1
+            raise RuntimeError("mem0 fora")
+        self.lotes.append((user_id, [m["content"] for m in mensagens]))
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def novo(redis_client, mem0, **kwargs):
+    parametros = dict(max_rps=0, tamanho_lote=20)
+    parametros.update(kwargs)
+    return OutboxMem0(redis_client, mem0, **parametros)
+
+
+def enfileirar(outbox, user_id, n):
+    for i in range(n):
+        outbox.enfileirar(user_id, {"role": "user", "content": f"m{i}"})
+
+
+def liberar_backoff(redis_client, user_id):
+    # O lock segura o usuário durante o backoff; no teste o backoff "expira" na hora
+    redis_client.delete(f"mem0:outbox:{user_id}:lock")
+
+
+def test_agrupa_em_lotes_na_ordem(redis_client):
+    mem0 = Mem0()
+    outbox = novo(redis_client, mem0)
+    enfileirar(outbox, "5511", 25)
+    assert outbox.flush() == 20
+    assert outbox.flush() == 5
+    assert mem0.lotes == [("5511", [f"m{i}" for i in range(20)]), ("5511", [f"m{i}" for i in range(20, 25)])]
+    assert not redis_client.exists("mem0:outbox:5511")
+
+
+def test_usuario_sai_de_pendentes_quando_esvazia(redis_client):
+    outbox = novo(redis_client, Mem0())
+    enfileirar(outbox, "5511", 2)
+    outbox.flush()
+    assert redis_client.sismember(OutboxMem0.PENDENTES, "5511")
+    outbox.flush()
+    assert not redis_client.sismember(OutboxMem0.PENDENTES, "5511")
+
+
+def test_falha_mantem_o_lote_e_repete(redis_client):
+    mem0 = Mem0(falhas=1)
+    outbox = novo(redis_client, mem0)
+    enfileirar(outbox, "5511", 3)
+    assert outbox.flush_usuario("5511") == 0
+    assert redis_client.llen("mem0:outbox:5511") == 3
+    # Backoff: o lock continua preso, ninguém reenvia antes da hora
+    assert redis_client.exists("mem0:outbox:5511:lock")
+    assert outbox.flush_usuario("5511") == 0
+    liberar_backoff(redis_client, "5511")
+    assert outbox.flush_usuario("5511") == 3
+    assert mem0.lotes == [("5511", ["m0", "m1", "m2"])]
+    assert not redis_client.exists("mem0:outbox:5511:tentativas")
+
+
+def test_lote_vai_para_mortas_depois_de_max_tentativas(redis_client):
+    mem0 = Mem0(falhas=10)
+    outbox = novo(redis_client, mem0, max_tentativas=2, tamanho_lote=2)
+    enfileirar(outbox, "5511", 3)
+    assert outbox.flush_usuario("5511") == 0
+    liberar_backoff(redis_client, "5511")
+    assert outbox.flush_usuario("5511") == 2
+    morta = json.loads(redis_client.lindex(OutboxMem0.MORTAS, 0))
+    assert morta["user_id"] == "5511"
+    assert [m["content"] for m in morta["mensagens"]] == ["m0", "m1"]
+    # As mensagens seguintes continuam no outbox
+    assert redis_client.lrange("mem0:outbox:5511", 0, -1) == [json.dumps({"role": "user", "content": "m2"})]
+
+
+def test_chamada_lenta_renova_o_lock(redis_client):
+    mem0 = Mem0(demora=1.5)
+    outbox = novo(redis_client, mem0, lock_ttl=1)
+    concorrente = novo(redis_client, Mem0())
+    enfileirar(outbox, "5511", 2)
+    ttls, segundo_flusher, threads = [], [], []
+
+    def durante(user_id):
+        # Outro flusher tenta o mesmo usuário depois que o lock original já teria expirado
+        def tentar():
+            time.sleep(1.2)
+            ttls.append(redis_client.pttl("mem0:outbox:5511:lock"))
+            segundo_flusher.append(concorrente.flush_usuario(user_id))
+
+        threads.append(threading.Thread(target=tentar))
+        threads[0].start()
+        mem0.durante = None
+
+    mem0.durante = durante
+    assert outbox.flush_usuario("5511") == 2
+    threads[0].join()
+    assert ttls[0] > 0  # lock renovado além do lock_ttl original
+    assert segundo_flusher == [0]
+    assert concorrente.mem0.lotes == []
+    assert mem0.lotes == [("5511", ["m0", "m1"])]
+    assert not redis_client.exists("mem0:outbox:5511:lock")
@@ -0,0 +1,75 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # fila por telefone roda em scripts Lua
+
+from outbox_whatsapp import OutboxWhatsApp  # noqa: E402
+
+
+class MegaApi:
+    """Registra os envios; falha as primeiras `falhas` chamadas de cada texto."""
+
+    def __init__(self, falhas=None):
+        self.enviados = []
+        self.falhas = dict(falhas or {})
+
+    def __call__(self, phone, message):
+        if self.falhas.get(message):
+            self.falhas[message] -= 1
+            raise RuntimeError("timeout")
+        self.enviados.append((phone, message))
+
+
+def novo(api, **kwargs):
+    parametros = dict(taxa=1000, rajada=1000, backoff_base=0, backoff_max=0)
+    parametros.update(kwargs)
+    return OutboxWhatsApp(fakeredis.FakeRedis(decode_responses=True), api, "teste", **parametros)
+
+
+def esvaziar(outbox, rodadas=20):
+    for _ in range(rodadas):
+        outbox.processar_prontos()
+
+
+def test_so_o_primeiro_do_telefone_fica_agendado():
+    outbox = novo(MegaApi())
+    ids = [outbox.enfileirar("5511", f"m{i}") for i in range(3)]
+    outbox.enfileirar("5522", "outro")
+    agendados = outbox.redis.zrange(outbox.agendados, 0, -1)
+    assert ids[0] in agendados
+    assert ids[1] not in agendados and ids[2] not in agendados
+    assert len(agendados) == 2
+
+
+def test_mensagens_do_telefone_saem_na_ordem():
+    api = MegaApi()
+    outbox = novo(api)
+    for i in range(5):
+        outbox.enfileirar("5511", f"m{i}")
+    esvaziar(outbox)
+    assert [m for _, m in api.enviados] == [f"m{i}" for i in range(5)]
+    assert not outbox.redis.exists(outbox._fila_telefone("5511"))
+
+
+def test_nova_tentativa_segura_as_seguintes():
+    api = MegaApi(falhas={"m0": 2})
+    outbox = novo(api)
+    for i in range(3):
+        outbox.enfileirar("5511", f"m{i}")
+    outbox.enfileirar("5522", "outro")
+    outbox.processar_prontos()
+    # m0 falhou e foi reagendada: m1 não passa na frente, o outro telefone segue
+    assert api.enviados == [("5522", "outro")]
+    esvaziar(outbox)
+    assert [m for p, m in api.enviados if p == "5511"] == ["m0", "m1", "m2"]
+
+
+def test_envio_morto_libera_o_proximo():
+    api = MegaApi(falhas={"m0": 10})
+    outbox = novo(api, max_tentativas=2)
+    primeiro = outbox.enfileirar("5511", "m0")
+    outbox.enfileirar("5511", "m1")
+    esvaziar(outbox)
+    assert outbox.status(primeiro)["status"] == "morta"
+    assert outbox.redis.llen(OutboxWhatsApp.MORTAS) == 1
+    assert api.enviados == [("5511", "m1")]
@@ -0,0 +1,70 @@
+from respostas_template import RespostasTemplate, campos_do_template, extrair_campos, formatar_data, formatar_valor
+
+BOLETO = {
+    "status": "A", "valor_aberto": "99.9", "data_vencimento": "2024-05-10",
+    "url_pdf": "https://boleto/1.pdf", "linha_digitavel": "34191.79001",
+}
+DADOS = {
+    "cliente": {"razao_social": "Maria Silva", "telefone_celular": "11999998888", "endereco": "Rua A, 10"},
+    "contrato": {"status": "Ativo", "status_internet": "Ativo", "valor": "120"},
+    "status_plano": {"status_contrato": "Ativo", "ultima_conexao_inicial": "2024-05-01 08:30:00"},
+    "valor_plano": {"valor": "99.90"},
+    "boletos": [BOLETO, dict(BOLETO, status="R", valor_aberto="50")],
+}
+
+
+def test_formatacao():
+    assert formatar_valor("99.9") == "99,90"
+    assert formatar_valor("99,9") == "99,90"
+    assert formatar_valor("n/d") == "n/d"
+    assert formatar_data("2024-05-10") == "10/05/2024"
+    assert formatar_data("2024-05-01 08:30:00") == "01/05/2024 08:30"
+    assert formatar_data("ontem") == "ontem"
+
+
+def test_extrair_campos():
+    campos = extrair_campos(DADOS)
+    assert campos["nome_cliente"] == "Maria Silva"
+    assert campos["telefone"] == "11999998888"
+    assert campos["status_contrato"] == "Ativo"
+    assert campos["ultima_conexao_inicial"] == "01/05/2024 08:30"
+    assert campos["valor_plano"] == "99,90"
+    # Só um boleto em aberto (o outro está recebido): os campos dele entram
+    assert campos["boletos_em_aberto"] == 1
+    assert (campos["valor"], campos["data_vencimento"], campos["url_pdf"]) == ("99,90", "10/05/2024", "https://boleto/1.pdf")
+
+
+def test_extrair_campos_com_dados_alternativos():
+    campos = extrair_campos({
+        "cliente": {"nome": "João"},
+        "cadastro": {"telefone": "1133334444", "endereco": "Rua B", "status": "Ativo"},
+        "contrato": {"valor": "80"},
+        "boletos": {"registros": [BOLETO, BOLETO]},
+    })
+    assert campos["nome_cliente"] == "João"
+    assert campos["telefone"] == "1133334444"
+    assert campos["valor_plano"] == "80,00"
+    assert campos["boletos_em_aberto"] == 2
+    assert "valor" not in campos  # vários boletos em aberto: nenhum é escolhido
+
+
+def test_extrair_campos_omite_ausentes():
+    assert extrair_campos({"cliente": None, "boletos": "x"}) == {"boletos_em_aberto": 0}
+
+
+def test_responder():
+    respostas = RespostasTemplate()
+    assert "R$ 99,90" in respostas.responder("consulta_valor_plano", DADOS)
+    assert "https://boleto/1.pdf" in respostas.responder("consulta_boleto", DADOS)
+
+
+def test_responder_devolve_none_para_o_mistral():
+    respostas = RespostasTemplate()
+    assert respostas.responder("consulta_boleto", dict(DADOS, boletos=[BOLETO, BOLETO])) is None
+    assert respostas.responder("consulta_dados_cadastro", {"cliente": {"nome": "Maria"}}) is None  # faltam campos
+    assert respostas.responder("consulta_valor_plano", {"erro": "timeout"}) is None
+    assert respostas.responder("estou_sem_internet", DADOS) is None
+
+
+def test_campos_do_template():
+    assert campos_do_template("Olá {nome_cliente}, R$ {valor}") == {"nome_cliente", "valor"}
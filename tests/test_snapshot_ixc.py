@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+import snapshot_ixc
+from snapshot_ixc import BRUTO, META, FormatoCompacto, FormatoJSON, codificar, decodificar, projetar
+
+BOLETOS = [{"id": str(i), "valor": "99.90", "data_vencimento": "2024-05-10", "linha_digitavel": "0" * 47} for i in range(20)]
+DADOS = {
+    "cliente": {"nome": "Maria", "razao_social": "Maria Silva"},
+    "contrato": {"status": "Ativo", "valor": "99.90"},
+    "boletos": BOLETOS,
+    "logins": [{"login": "maria"}],  # seção que o bot não usa
+}
+
+
+@pytest.fixture(params=["json", "msgpack"])
+def serializacao(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr(snapshot_ixc, "msgpack", None)
+    else:
+        monkeypatch.setattr(snapshot_ixc, "msgpack", pytest.importorskip("msgpack"))
+    return request.param
+
+
+@pytest.mark.parametrize("valor", [{"nome": "Maria", "ativo": True}, [1, 2.5, None], "ç", BOLETOS])
+def test_codificar_decodificar(serializacao, valor):
+    assert decodificar(codificar(valor)) == valor
+
+
+def test_tag_indica_serializacao_e_compressao(serializacao):
+    pequeno, grande = codificar({"a": 1}), codificar(BOLETOS, comprimir_acima=64)
+    if serializacao == "json":
+        assert (pequeno[:1], grande[:1]) == (b"j", b"J")
+    else:
+        assert (pequeno[:1], grande[:1]) == (b"m", b"z")
+    assert len(grande) < len(codificar(BOLETOS, comprimir_acima=10 ** 9))
+
+
+def test_json_gravado_continua_legivel_com_msgpack():
+    pytest.importorskip("msgpack")
+    assert decodificar(b"j" + b'{"a": 1}') == {"a": 1}
+
+
+def test_projetar():
+    assert set(projetar(DADOS)) == {"cliente", "contrato", "boletos"}
+    assert projetar({"erro": "timeout", "cliente": {}}) == {"erro": "timeout", "cliente": {}}
+    assert projetar(["bruto"]) == ["bruto"]
+
+
+def _hash(mapa):
+    # Como o HGETALL de um cliente sem decode_responses devolve o HASH
+    return {c.encode(): v if isinstance(v, bytes) else v.encode() for c, v in mapa.items()}
+
+
+def test_formato_compacto_ida_e_volta(serializacao):
+    formato = FormatoCompacto(None, comprimir_acima=256)
+    envelope = {"dados": DADOS, "ts": 1700000000.5, "erro": False}
+    lido = formato.envelope(_hash(formato._mapa(envelope)))
+    assert lido == {"dados": projetar(DADOS), "ts": 1700000000.5, "erro": False}
+
+
+def test_formato_compacto_leitura_parcial(serializacao):
+    formato = FormatoCompacto(None)
+    hash_redis = _hash(formato._mapa({"dados": DADOS, "ts": 1.0, "erro": False}))
+    campos = ("contrato",)
+    # HMGET devolve os valores na ordem de META + campos
+    resultado = [hash_redis.get(c.encode()) for c in (*META, *campos)]
+    assert formato.envelope(resultado, campos)["dados"] == {"contrato": DADOS["contrato"]}
+
+
+def test_formato_compacto_erro_e_resposta_bruta(serializacao):
+    formato = FormatoCompacto(None)
+    erro = {"dados": {"erro": "timeout"}, "ts": 2.0, "erro": True}
+    assert formato.envelope(_hash(formato._mapa(erro))) == erro
+    mapa = formato._mapa({"dados": ["inesperado"], "ts": 3.0, "erro": False})
+    assert BRUTO in mapa
+    assert formato.envelope(_hash(mapa))["dados"] == ["inesperado"]
+
+
+def test_formato_compacto_sem_snapshot():
+    assert FormatoCompacto(None).envelope({}) is None
+    assert FormatoCompacto(None).envelope([None] * (len(META) + 1), ("cliente",)) is None
+
+
+def test_formato_json_leitura_parcial():
+    bruto = json.dumps({"dados": DADOS, "ts": 1.0, "erro": False})
+    assert FormatoJSON(None).envelope(bruto, ("cliente",))["dados"] == {"cliente": DADOS["cliente"]}